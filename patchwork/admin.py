@@ -19,11 +19,14 @@
 
 from __future__ import absolute_import
 
+import datetime
+
 from django.contrib import admin
 
 from patchwork.models import (Project, Person, UserProfile, State, Submission,
                               Patch, CoverLetter, Comment, Bundle, Tag, Check,
-                              DelegationRule)
+                              DelegationRule, APIToken, QueuedMail,
+                              ScheduledJob, ArchivePolicy)
 
 
 class DelegationRuleInline(admin.TabularInline):
@@ -31,10 +34,16 @@ class DelegationRuleInline(admin.TabularInline):
     fields = ('path', 'user', 'priority')
 
 
+class ArchivePolicyInline(admin.TabularInline):
+    model = ArchivePolicy
+    fields = ('states', 'days')
+
+
 class ProjectAdmin(admin.ModelAdmin):
     list_display = ('name', 'linkname', 'listid', 'listemail')
     inlines = [
         DelegationRuleInline,
+        ArchivePolicyInline,
     ]
 admin.site.register(Project, ProjectAdmin)
 
@@ -116,3 +125,43 @@ admin.site.register(Bundle, BundleAdmin)
 class TagAdmin(admin.ModelAdmin):
     list_display = ('name',)
 admin.site.register(Tag, TagAdmin)
+
+
+class APITokenAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'user', 'name', 'date')
+    fields = ('user', 'name')
+    readonly_fields = ('user', )
+    search_fields = ('user__username', 'name')
+
+    def has_add_permission(self, request):
+        # tokens are created by their users, as they are only shown once
+        return False
+admin.site.register(APIToken, APITokenAdmin)
+
+
+class QueuedMailAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'date', 'status', 'attempts', 'next_attempt',
+                    'last_error')
+    list_filter = ('status',)
+    readonly_fields = ('message', 'date', 'attempts', 'last_error')
+    fields = ('message', 'date', 'status', 'attempts', 'next_attempt',
+              'last_error')
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        queryset.update(status=QueuedMail.STATUS_QUEUED, attempts=0,
+                        next_attempt=datetime.datetime.now())
+    requeue.short_description = 'Requeue selected mail'
+admin.site.register(QueuedMail, QueuedMailAdmin)
+
+
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'last_run', 'last_duration', 'last_succeeded',
+                    'next_run', 'locked_until')
+    readonly_fields = ('name', 'locked_until', 'last_run', 'last_duration',
+                       'last_succeeded', 'last_error')
+
+    def has_add_permission(self, request):
+        # jobs are registered in code
+        return False
+admin.site.register(ScheduledJob, ScheduledJobAdmin)
@@ -0,0 +1,194 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+"""Serve the raw diffs and mboxes of patches from files on disk.
+
+If ARTIFACT_CACHE_DIR is set, a patch's raw diff or mbox is written to a
+file in that directory the first time it is requested. The web server is
+then asked to send the file, using the ARTIFACT_CACHE_HEADER response
+header, so the content needn't pass through a Patchwork process again.
+
+Files are named by a hash of the patch ID, the kind of artifact and the
+patch's artifact generation, which changes whenever the patch or one of
+its comments changes, so outdated files are never served. Files are
+touched each time they are served, and the least recently used are
+removed once the cache grows beyond ARTIFACT_CACHE_SIZE bytes.
+"""
+
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.encoding import force_bytes
+
+# the number of seconds after which the size of the cache is recounted,
+# to account for files written by other processes
+SCAN_INTERVAL = 60
+
+# the fraction of ARTIFACT_CACHE_SIZE that eviction shrinks the cache to,
+# so that eviction isn't needed again on the next write
+EVICT_TARGET = 0.9
+
+_usage = {'size': None, 'scanned': 0}
+_usage_lock = threading.Lock()
+
+
+def enabled():
+    return bool(settings.ARTIFACT_CACHE_DIR)
+
+
+def _relpath(patch, kind):
+    key = hashlib.sha1(force_bytes('%s:%d:%d' % (
+        kind, patch.id, patch.artifact_generation))).hexdigest()
+    return os.path.join(kind, key[:2], key)
+
+
+def _files():
+    for dirpath, _, filenames in os.walk(settings.ARTIFACT_CACHE_DIR):
+        for filename in filenames:
+            # files still being written are hidden
+            if filename.startswith('.'):
+                continue
+
+            path = os.path.join(dirpath, filename)
+            try:
+                yield path, os.stat(path)
+            except OSError as exc:
+                # removed by another process
+                if exc.errno != errno.ENOENT:
+                    raise
+
+
+def prune(max_size=None):
+    """Remove the least recently used files from the cache.
+
+    Args:
+        max_size (int): The number of bytes the files may take up before
+            any are removed. Defaults to ARTIFACT_CACHE_SIZE.
+
+    Returns:
+        The number of bytes the remaining files take up.
+    """
+    if max_size is None:
+        max_size = settings.ARTIFACT_CACHE_SIZE
+
+    files = sorted(_files(), key=lambda f: f[1].st_mtime)
+    size = sum(stat.st_size for _, stat in files)
+
+    if size > max_size:
+        for path, stat in files:
+            if size <= max_size * EVICT_TARGET:
+                break
+
+            try:
+                os.remove(path)
+            except OSError as exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+            size -= stat.st_size
+
+    with _usage_lock:
+        _usage['size'] = size
+        _usage['scanned'] = time.time()
+    return size
+
+
+def _account(size):
+    with _usage_lock:
+        if _usage['size'] is None or \
+                time.time() - _usage['scanned'] > SCAN_INTERVAL:
+            rescan = True
+        else:
+            _usage['size'] += size
+            rescan = _usage['size'] > settings.ARTIFACT_CACHE_SIZE
+
+    if rescan:
+        prune()
+
+
+def _write(path, content):
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+
+    # write to a hidden file and rename it into place, so that the web
+    # server never sends a partly written file
+    fd, tmppath = tempfile.mkstemp(prefix='.', dir=dirname)
+    try:
+        with os.fdopen(fd, 'wb') as tmpfile:
+            tmpfile.write(content)
+        os.chmod(tmppath, 0o644)
+        os.rename(tmppath, path)
+    except Exception:
+        os.remove(tmppath)
+        raise
+
+
+def get_path(patch, kind, render):
+    """Find or create the file holding an artifact of a patch.
+
+    Args:
+        patch (Patch): The patch.
+        kind (str): The kind of artifact, e.g. 'diff' or 'mbox'.
+        render: A callable returning the artifact's content, which is
+            only called if the file doesn't exist yet.
+
+    Returns:
+        The path of the file, relative to ARTIFACT_CACHE_DIR.
+    """
+    relpath = _relpath(patch, kind)
+    path = os.path.join(settings.ARTIFACT_CACHE_DIR, relpath)
+
+    try:
+        os.utime(path, None)
+    except OSError as exc:
+        if exc.errno != errno.ENOENT:
+            raise
+
+        content = force_bytes(render())
+        _write(path, content)
+        _account(len(content))
+
+    return relpath
+
+
+def response(patch, kind, render, content_type):
+    """Return a response asking the web server to send an artifact."""
+    relpath = get_path(patch, kind, render)
+
+    response = HttpResponse(content_type=content_type)
+    header = settings.ARTIFACT_CACHE_HEADER
+    if header == 'X-Accel-Redirect':
+        response[header] = settings.ARTIFACT_CACHE_URL + \
+            relpath.replace(os.sep, '/')
+    else:
+        response[header] = os.path.join(
+            os.path.abspath(settings.ARTIFACT_CACHE_DIR), relpath)
+    return response
@@ -29,6 +29,7 @@ import mailbox
 
 import django
 
+from patchwork import instrumentation
 from patchwork.bin import parsemail
 
 LOGGER = logging.getLogger(__name__)
@@ -53,6 +54,10 @@ def parse_mbox(path, list_id):
     LOGGER.info('Processed %d messages, %d duplicates',
                 len(mbox), duplicates)
 
+    if instrumentation.is_enabled():
+        for line in instrumentation.format_summary():
+            LOGGER.info(line)
+
 
 def main():
     django.setup()
@@ -70,11 +75,16 @@ def main():
                        'this will be extracted from the mail headers.')
     group.add_argument('--verbosity', choices=list_logging_levels(),
                        help='debug level', default='info')
+    group.add_argument('--no-timing', dest='timing', action='store_false',
+                       help="don't time the stages of parsing each mail")
 
     args = vars(parser.parse_args())
 
     logging.basicConfig(level=VERBOSITY_LEVELS[args['verbosity']])
 
+    if args['timing']:
+        instrumentation.enable()
+
     parse_mbox(args['inpath'], args['list_id'])
 
 if __name__ == '__main__':
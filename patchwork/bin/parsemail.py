@@ -41,6 +41,7 @@ from django.utils.log import AdminEmailHandler
 from django.utils import six
 from django.utils.six.moves import map
 
+from patchwork import instrumentation
 from patchwork.models import (Patch, Project, Person, Comment, State,
                               DelegationRule, get_default_initial_patch_state)
 from patchwork.parser import parse_patch, patch_get_filenames
@@ -151,9 +152,8 @@ def find_author(mail):
 
     new_person = False
 
-    try:
-        person = Person.objects.get(email__iexact=email)
-    except Person.DoesNotExist:
+    person = Person.find(email)
+    if person is None:
         person = Person(name=name, email=email)
         new_person = True
 
@@ -240,7 +240,8 @@ def find_content(project, mail):
             c = payload
 
             if not patchbuf:
-                (patchbuf, c) = parse_patch(payload)
+                with instrumentation.stage('parse_patch'):
+                    (patchbuf, c) = parse_patch(payload)
 
             if not pullurl:
                 pullurl = find_pull_request(payload)
@@ -413,13 +414,26 @@ def auto_delegate(project, filenames):
 
 
 def get_delegate(delegate_email):
-    """Return the delegate with the given email or None."""
-    if delegate_email:
-        try:
-            return User.objects.get(email__iexact=delegate_email)
-        except User.DoesNotExist:
-            pass
-    return None
+    """Return the delegate with the given email or None.
+
+    The delegate is the user linked to the person with the address, so
+    any address a user has linked to their account matches them. Failing
+    that, it is the user whose account address it is, which covers users
+    without a linked person, such as those made by createsuperuser.
+    Addresses are compared case-insensitively, and if several people or
+    users match, the first created is used.
+    """
+    if not delegate_email:
+        return None
+
+    # registered users have a person with their email address, which can
+    # be looked up by index
+    person = Person.find(delegate_email, user__isnull=False)
+    if person:
+        return person.user
+
+    return User.objects.filter(
+        email__iexact=delegate_email).order_by('id').first()
 
 
 def parse_mail(mail, list_id=None):
@@ -450,10 +464,11 @@ def parse_mail(mail, list_id=None):
         LOGGER.debug("Ignoring patch due to 'ignore' hint")
         return 0
 
-    if list_id:
-        project = find_project_by_id(list_id)
-    else:
-        project = find_project_by_header(mail)
+    with instrumentation.stage('find_project'):
+        if list_id:
+            project = find_project_by_id(list_id)
+        else:
+            project = find_project_by_header(mail)
 
     if project is None:
         LOGGER.error('Failed to find a project for patch')
@@ -461,14 +476,18 @@ def parse_mail(mail, list_id=None):
 
     msgid = mail.get('Message-Id').strip()
 
-    (author, save_required) = find_author(mail)
+    with instrumentation.stage('find_author'):
+        (author, save_required) = find_author(mail)
 
-    (patch, comment, filenames) = find_content(project, mail)
+    with instrumentation.stage('find_content'):
+        (patch, comment, filenames) = find_content(project, mail)
 
     if patch:
-        delegate = get_delegate(mail.get('X-Patchwork-Delegate', '').strip())
-        if not delegate:
-            delegate = auto_delegate(project, filenames)
+        with instrumentation.stage('auto_delegate'):
+            delegate = get_delegate(
+                mail.get('X-Patchwork-Delegate', '').strip())
+            if not delegate:
+                delegate = auto_delegate(project, filenames)
 
         # we delay the saving until we know we have a patch.
         if save_required:
@@ -480,7 +499,8 @@ def parse_mail(mail, list_id=None):
         patch.state = get_state(mail.get('X-Patchwork-State', '').strip())
         patch.delegate = get_delegate(
             mail.get('X-Patchwork-Delegate', '').strip())
-        patch.save()
+        with instrumentation.stage('patch.save'):
+            patch.save()
         LOGGER.debug('Patch saved')
 
     if comment:
@@ -491,7 +511,8 @@ def parse_mail(mail, list_id=None):
             comment.patch = patch
         comment.submitter = author
         comment.msgid = msgid
-        comment.save()
+        with instrumentation.stage('comment.save'):
+            comment.save()
         LOGGER.debug('Comment saved')
 
     return 0
@@ -545,11 +566,17 @@ def main(args):
                        'this will be extracted from the mail headers.')
     group.add_argument('--verbosity', choices=list_logging_levels(),
                        help='debug level', default='info')
+    group.add_argument('--timing', action='store_true',
+                       help='log the time taken and queries issued by each '
+                       'stage of parsing')
 
     args = vars(parser.parse_args())
 
     logging.basicConfig(level=VERBOSITY_LEVELS[args['verbosity']])
 
+    if args['timing']:
+        instrumentation.enable()
+
     mail = message_from_file(args['infile'])
     try:
         return parse_mail(mail, args['list_id'])
@@ -559,6 +586,10 @@ def main(args):
                 'mail': mail.as_string(),
             })
         raise
+    finally:
+        if args['timing']:
+            for line in instrumentation.format_summary():
+                LOGGER.info(line)
     return parse_mail(mail, args['list_id'])
 
 if __name__ == '__main__':
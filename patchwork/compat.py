@@ -38,3 +38,17 @@ else:
         context_instance = RequestContext(request) if request else None
         return loader.render_to_string(template_name, context,
                                        context_instance)
+
+
+# on_commit
+#
+# Callbacks run once the current transaction commits were added in Django
+# 1.9. Earlier versions run them immediately.
+#
+# https://docs.djangoproject.com/en/dev/releases/1.9/
+
+if django.VERSION >= (1, 9):
+    from django.db.transaction import on_commit
+else:
+    def on_commit(func, using=None):
+        func()
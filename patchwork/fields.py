@@ -20,10 +20,18 @@
 
 from __future__ import absolute_import
 
+import base64
+from collections import OrderedDict
+import datetime
 import hashlib
+import sys
+import threading
+import zlib
 
 import django
-from django.db import models
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
 from django.utils import six
 
 
@@ -51,3 +59,438 @@ class HashField(HashFieldBase):
 
     def db_type(self, connection=None):
         return 'char(%d)' % self.n_bytes
+
+
+class StoredValue(six.text_type):
+    """A column value which has been read, but not yet loaded.
+
+    Fields whose values may be kept elsewhere or compressed hold these
+    until the value is first accessed, so that the values of all the rows
+    read by a query can be loaded together rather than one row at a time.
+    Querysets returned by ``values()`` and ``values_list()`` skip this and
+    return the values as stored, so load such fields through model
+    instances instead.
+    """
+
+
+class StoredValueDescriptor(object):
+    """Loads the stored value of a field when it is first accessed."""
+
+    def __init__(self, field):
+        self.field = field
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        value = instance.__dict__[self.field.attname]
+        if isinstance(value, StoredValue):
+            value = self.field.load(value)
+            instance.__dict__[self.field.attname] = value
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+
+
+class StoredValueMixin(object):
+    """Mixin for text fields whose values are loaded on first access."""
+
+    def contribute_to_class(self, cls, name, *args, **kwargs):
+        super(StoredValueMixin, self).contribute_to_class(
+            cls, name, *args, **kwargs)
+        setattr(cls, self.attname, StoredValueDescriptor(self))
+
+    def pre_save(self, model_instance, add):
+        # values which were never accessed are saved back as they are
+        value = model_instance.__dict__.get(self.attname)
+        if isinstance(value, StoredValue):
+            return value
+        return super(StoredValueMixin, self).pre_save(model_instance, add)
+
+    def get_db_prep_save(self, value, connection):
+        if isinstance(value, StoredValue):
+            return six.text_type(value)
+        return super(StoredValueMixin, self).get_db_prep_save(
+            value, connection)
+
+
+class _Batch(threading.local):
+    """Keys read by this thread, to be loaded together when first used."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # keys which have been read but not yet loaded, in the order they
+        # were read
+        self.pending = OrderedDict()
+        # the values loaded with the most recent batch
+        self.values = {}
+
+    def add(self, key):
+        if key in self.values:
+            return
+        self.pending[key] = None
+        # keys of rows which are never accessed would otherwise pile up
+        while len(self.pending) > BATCH_SIZE:
+            self.pending.popitem(last=False)
+
+    def get(self, key, load):
+        """Return the value for a key, loading it if needed.
+
+        The key is loaded along with all the other pending keys, by calling
+        load with the keys and using the dictionary it returns.
+        """
+        if key not in self.values:
+            self.pending.pop(key, None)
+            keys = [key] + list(self.pending)
+            self.pending.clear()
+            self.values = load(keys)
+        return self.values[key]
+
+
+# the most values loaded with one query, which is kept well below the
+# number of parameters SQLite allows
+BATCH_SIZE = 500
+
+
+# stored in place of values kept in the blob store, followed by the digest
+BLOB_PREFIX = '\x01blob:sha256:'
+
+# recently used blobs, by digest. Blobs are immutable, so this never needs
+# to be invalidated. It is shared by all threads, so is only used while
+# holding _blob_cache_lock
+_blob_cache = OrderedDict()
+_blob_cache_lock = threading.Lock()
+_blob_batch = _Batch()
+
+
+def _cache_blob(digest, data):
+    with _blob_cache_lock:
+        _blob_cache.pop(digest, None)
+        _blob_cache[digest] = data
+        while len(_blob_cache) > settings.BLOB_CACHE_SIZE:
+            _blob_cache.popitem(last=False)
+
+
+def _cached_blob(digest):
+    with _blob_cache_lock:
+        return _blob_cache.get(digest)
+
+
+def clear_blob_cache():
+    with _blob_cache_lock:
+        _blob_cache.clear()
+    _blob_batch.clear()
+
+
+def clear_batches(**kwargs):
+    """Forget the values read but not yet loaded by this thread.
+
+    This is called at the start of each request, so that values read but
+    never used by one request aren't loaded by the next.
+    """
+    _blob_batch.clear()
+    _cold_batch.clear()
+
+
+def blob_digest(value):
+    return hashlib.sha256(value.encode('utf-8')).hexdigest()
+
+
+def is_blob_ref(value):
+    return value is not None and value.startswith(BLOB_PREFIX)
+
+
+def _load_blobs(digests):
+    model = apps.get_model('patchwork', 'Blob')
+    field = model._meta.get_field('data')
+    blobs = dict(
+        (digest, field.load(data)) for digest, data in
+        model.objects.filter(digest__in=digests).values_list(
+            'digest', 'data'))
+    if digests[0] not in blobs:
+        raise model.DoesNotExist('Blob %s does not exist' % digests[0])
+    return blobs
+
+
+def load_blob(ref):
+    """Return the value referenced by a blob reference.
+
+    Blobs referenced by other rows read since are loaded at the same time.
+    """
+    digest = ref[len(BLOB_PREFIX):]
+    data = _cached_blob(digest)
+    if data is None:
+        data = _blob_batch.get(digest, _load_blobs)
+    _cache_blob(digest, data)
+    return data
+
+
+def store_blob(value):
+    """Add a value to the blob store, and return a reference to it."""
+    Blob = apps.get_model('patchwork', 'Blob')
+    digest = blob_digest(value)
+    # the cache can't be used to skip this, as the transaction which
+    # created a cached blob may since have been rolled back. Marking
+    # existing blobs as used stops them being purged meanwhile
+    if not Blob.objects.filter(digest=digest).update(
+            last_used=datetime.datetime.now()):
+        try:
+            with transaction.atomic():
+                Blob.objects.create(digest=digest, data=value)
+        except IntegrityError:
+            # another transaction stored it first
+            pass
+    _cache_blob(digest, value)
+    return BLOB_PREFIX + digest
+
+
+class BlobField(StoredValueMixin, models.TextField):
+    """A text field whose large values are stored in the blob store.
+
+    Values of at least BLOB_MIN_LENGTH characters are stored once in the
+    Blob table, keyed by their SHA-256 digest, and the column holds a
+    reference to the blob. Identical values, such as the diffs of
+    cross-posted patches, are therefore only stored once. Values are
+    loaded transparently when first accessed, together with those of the
+    other rows read since, but lookups other than ``isnull`` do not work
+    on stored values.
+
+    The values of old archived patches may be moved to cold storage by the
+    coldstorage management command, in which case the column instead holds
+    a reference to a ColdValue. Those are likewise loaded on first access,
+    together with the other pending ones.
+    """
+
+    def from_db_value(self, value, expression, connection, context):
+        if is_blob_ref(value):
+            _blob_batch.add(value[len(BLOB_PREFIX):])
+        elif is_cold_ref(value):
+            _cold_batch.add(value[len(COLD_PREFIX):])
+        else:
+            return value
+        return StoredValue(value)
+
+    def load(self, value):
+        value = load_cold(value)
+        if is_blob_ref(value):
+            return load_blob(value)
+        return value
+
+    def pre_save(self, model_instance, add):
+        value = super(BlobField, self).pre_save(model_instance, add)
+        if value is None or isinstance(value, StoredValue):
+            return value
+
+        # values which look like references must be stored too, so they
+        # aren't mistaken for one when loaded
+        if len(value) >= settings.BLOB_MIN_LENGTH or is_blob_ref(value) or \
+                is_cold_ref(value):
+            return store_blob(value)
+        return value
+
+
+# stored in place of compressed values, followed by the name of the preset
+# dictionary used, if any, a colon and the base64-encoded zlib stream
+COMPRESSED_PREFIX = '\x01zlib:'
+
+# strings which commonly appear in values, used to prime the compressor so
+# that even short values compress well. Values are decompressed using the
+# dictionary named in them, so a dictionary must never be changed once
+# used: add a new one instead. The most common strings go last
+COMPRESSION_DICTIONARIES = {
+    'headers': (
+        'X-Mailman-Version: 2.1.\nPrecedence: list\n'
+        'Content-Transfer-Encoding: 8bit\nContent-Transfer-Encoding: 7bit\n'
+        'X-Mailer: git-send-email \nIn-Reply-To: <\nReferences: <\n'
+        'Errors-To: \nSender: \nList-Subscribe: <mailto:\n'
+        'List-Unsubscribe: <mailto:\nList-Post: <mailto:\n'
+        'List-Help: <mailto:\nList-Archive: <http\nList-Id: <\n'
+        'Return-Path: <\nDelivered-To: \nX-Original-To: \n'
+        'Received-SPF: \nAuthentication-Results: \nDKIM-Signature: v=1; '
+        'a=rsa-sha256; c=relaxed/relaxed; d=\nX-Spam-Status: No, score=\n'
+        'Content-Type: text/plain; charset=UTF-8\nMIME-Version: 1.0\n'
+        'Message-Id: <\nSubject: [PATCH \nDate: \nTo: \nCc: \nFrom: \n'
+        ' (Postfix) with ESMTP id \n (PDT)\n (UTC)\n (+0000)\n'
+        'Received: from \n\tby \n\tfor <\n with ESMTPS id \n'
+        'Received: by \n'),
+    'diff': (
+        'Reviewed-by: \nAcked-by: \nCc: \nSigned-off-by: \n---\n'
+        ' files changed, \n file changed, \n insertions(+), \n'
+        ' deletions(-)\n\ndeleted file mode 100644\n'
+        'new file mode 100644\nindex 0000000..\n--- /dev/null\n'
+        '\treturn 0;\n\treturn ret;\n\t}\n\t\t\n\t\n'
+        '\n \n+\n-\ndiff --git a/\nindex \n--- a/\n+++ b/\n@@ -\n'
+        '\n+\t\n-\t\n \t\n'),
+}
+
+# preset dictionaries are not supported by zlib on Python 2, so values
+# stored with one can't be read by Python 2. They are therefore only used
+# if COMPRESSION_USE_DICTIONARIES is set, and the value is written by
+# Python 3.3 or later. Values stored without one can be read by either
+_ZDICT = sys.version_info >= (3, 3)
+
+
+def is_compressed(value):
+    return value is not None and value.startswith(COMPRESSED_PREFIX)
+
+
+def compress_text(value, dictionary=None):
+    """Return the compressed form of a text value.
+
+    The named preset dictionary is only used if COMPRESSION_USE_DICTIONARIES
+    is set and it is supported.
+    """
+    if not _ZDICT or not settings.COMPRESSION_USE_DICTIONARIES:
+        dictionary = None
+
+    if dictionary:
+        compressor = zlib.compressobj(
+            zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, zlib.MAX_WBITS,
+            zlib.DEF_MEM_LEVEL, zlib.Z_DEFAULT_STRATEGY,
+            COMPRESSION_DICTIONARIES[dictionary].encode('utf-8'))
+    else:
+        compressor = zlib.compressobj()
+
+    data = compressor.compress(value.encode('utf-8')) + compressor.flush()
+    return '%s%s:%s' % (COMPRESSED_PREFIX, dictionary or '',
+                        base64.b64encode(data).decode('ascii'))
+
+
+def maybe_compress_text(value, dictionary=None):
+    """Return the shorter of a text value and its compressed form.
+
+    Values shorter than COMPRESSION_MIN_LENGTH are returned as they are.
+    The value must not itself look compressed.
+    """
+    if len(value) < settings.COMPRESSION_MIN_LENGTH:
+        return value
+
+    compressed = compress_text(value, dictionary)
+    if len(compressed) < len(value):
+        return compressed
+    return value
+
+
+def decompress_text(value):
+    """Return the text value of a compressed value."""
+    dictionary, data = value[len(COMPRESSED_PREFIX):].split(':', 1)
+    data = base64.b64decode(data.encode('ascii'))
+
+    if dictionary and not _ZDICT:
+        raise ValueError('Values compressed with a preset dictionary can '
+                         'only be read using Python 3.3 or later')
+
+    if dictionary:
+        decompressor = zlib.decompressobj(
+            zlib.MAX_WBITS, COMPRESSION_DICTIONARIES[dictionary].encode(
+                'utf-8'))
+    else:
+        decompressor = zlib.decompressobj()
+
+    data = decompressor.decompress(data) + decompressor.flush()
+    return data.decode('utf-8')
+
+
+class CompressedTextField(StoredValueMixin, models.TextField):
+    """A text field whose large values are stored compressed.
+
+    Values of at least COMPRESSION_MIN_LENGTH characters are compressed
+    with zlib, primed with the named preset dictionary if one is given,
+    and stored base64-encoded if that makes them shorter. Uncompressed
+    values, such as those stored before the field was compressed, are read
+    as they are. Lookups other than ``isnull`` do not work on compressed
+    values.
+
+    Preset dictionaries are only used if COMPRESSION_USE_DICTIONARIES is
+    set, and by Python 3.3 or later. Values stored with one can't be read
+    by Python 2.
+
+    Values are decompressed when first accessed. They may also be moved to
+    cold storage, like those of a BlobField.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.dictionary = kwargs.pop('dictionary', None)
+        if self.dictionary and self.dictionary not in \
+                COMPRESSION_DICTIONARIES:
+            raise ValueError('Unknown compression dictionary %r' %
+                             self.dictionary)
+
+        super(CompressedTextField, self).__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(
+            CompressedTextField, self).deconstruct()
+        if self.dictionary:
+            kwargs['dictionary'] = self.dictionary
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection, context):
+        if is_cold_ref(value):
+            _cold_batch.add(value[len(COLD_PREFIX):])
+        elif not is_compressed(value):
+            return value
+        return StoredValue(value)
+
+    def load(self, value):
+        value = load_cold(value)
+        if is_compressed(value):
+            return decompress_text(value)
+        return value
+
+    def get_db_prep_save(self, value, connection):
+        if isinstance(value, StoredValue):
+            return six.text_type(value)
+
+        value = super(CompressedTextField, self).get_db_prep_save(
+            value, connection)
+        if value is None:
+            return value
+
+        # values which look compressed must be compressed too, so they
+        # aren't mistaken for compressed ones when loaded
+        if is_compressed(value) or is_cold_ref(value):
+            return compress_text(value, self.dictionary)
+        return maybe_compress_text(value, self.dictionary)
+
+
+# stored in place of values moved to cold storage, followed by the digest
+# of the value as it was stored in the column
+COLD_PREFIX = '\x01cold:sha256:'
+
+_cold_batch = _Batch()
+
+
+def is_cold_ref(value):
+    return value is not None and value.startswith(COLD_PREFIX)
+
+
+def _load_cold_values(digests):
+    model = apps.get_model('patchwork', 'ColdValue')
+    values = dict(model.objects.using(
+        settings.COLD_STORAGE_DATABASE).filter(
+            digest__in=digests).values_list('digest', 'data'))
+    if digests[0] not in values:
+        raise model.DoesNotExist('Cold value %s does not exist' % digests[0])
+
+    # the blobs these refer to are likely to be needed next
+    for digest in digests:
+        if is_blob_ref(values.get(digest)):
+            _blob_batch.add(values[digest][len(BLOB_PREFIX):])
+    return values
+
+
+def load_cold(value):
+    """Return the column value for a value which may be in cold storage.
+
+    The result is the value as it was stored in the column, so may itself
+    be a blob reference or compressed. The other cold values read but not
+    yet loaded are loaded at the same time.
+    """
+    if not is_cold_ref(value):
+        return value
+
+    return _cold_batch.get(value[len(COLD_PREFIX):], _load_cold_values)
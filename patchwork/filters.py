@@ -25,7 +25,7 @@ from django.utils.safestring import mark_safe
 from django.utils import six
 from django.utils.six.moves.urllib.parse import quote
 
-from patchwork.models import Person, State
+from patchwork.models import PatchFile, Person, State
 
 
 class Filter(object):
@@ -262,6 +262,44 @@ class SearchFilter(Filter):
         return mark_safe('function(form) { return form.x.value }')
 
 
+class FilesFilter(Filter):
+    param = 'files'
+
+    def __init__(self, filters):
+        super(FilesFilter, self).__init__(filters)
+        self.name = 'Files'
+        self.path = None
+
+    def _set_key(self, str):
+        str = str.strip()
+        if str == '':
+            return
+        self.path = str
+        self.applied = True
+
+    def kwargs(self):
+        # use a subquery rather than a join, which would return a patch
+        # once for every matching file
+        return {'id__in': PatchFile.objects.filter(
+            path__startswith=self.path).values('patch_id')}
+
+    def condition(self):
+        return self.path
+
+    def key(self):
+        return self.path
+
+    def _form(self):
+        value = ''
+        if self.path:
+            value = escape(self.path)
+        return mark_safe('<input name="%s" class="form-control" value="%s" '
+                         'placeholder="path/prefix/">' % (self.param, value))
+
+    def form_function(self):
+        return mark_safe('function(form) { return form.x.value }')
+
+
 class ArchiveFilter(Filter):
     param = 'archive'
 
@@ -402,6 +440,7 @@ class DelegateFilter(Filter):
 filterclasses = [SubmitterFilter,
                  StateFilter,
                  SearchFilter,
+                 FilesFilter,
                  ArchiveFilter,
                  DelegateFilter]
 
@@ -0,0 +1,167 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Lightweight timing of hot code paths.
+
+Code paths are split into named stages:
+
+    with instrumentation.stage('find_author'):
+        author = find_author(mail)
+
+When instrumentation is enabled, the wall time and the number of SQL
+queries issued by each stage are logged and added to per-stage counters,
+which can be retrieved with `get_stats` or `format_summary`. When it is
+disabled (the default) `stage` returns a shared no-op context manager, so
+the cost of an instrumented stage is a function call.
+
+Stages may be nested, in which case the time and queries of the inner
+stage are also included in those of the outer stage.
+"""
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import logging
+from timeit import default_timer
+
+from django.db import connection
+
+LOGGER = logging.getLogger(__name__)
+
+# per-stage counters, or None if instrumentation is disabled
+_stats = None
+_force_debug_cursor = False
+_depth = 0
+
+
+class StageStats(object):
+    """Aggregated counters of a single stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.time = 0.0
+        self.max_time = 0.0
+        self.queries = 0
+
+    @property
+    def mean_time(self):
+        return self.time / self.calls if self.calls else 0.0
+
+
+class _NullStage(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_stage = _NullStage()
+
+
+class _Stage(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        global _depth
+
+        _depth += 1
+        self.queries = len(connection.queries_log)
+        self.start = default_timer()
+
+    def __exit__(self, *exc_info):
+        global _depth
+
+        elapsed = default_timer() - self.start
+        queries = len(connection.queries_log) - self.queries
+        _depth -= 1
+
+        if _stats is None:  # disabled while the stage was running
+            return False
+
+        stats = _stats.get(self.name)
+        if stats is None:
+            stats = _stats[self.name] = StageStats(self.name)
+        stats.calls += 1
+        stats.time += elapsed
+        stats.max_time = max(stats.max_time, elapsed)
+        stats.queries += queries
+
+        LOGGER.debug('%s: %.2fms, %d queries', self.name, elapsed * 1000,
+                     queries)
+
+        # the query log is bounded; empty it between top-level stages so
+        # that it never fills up and the counts above stay accurate
+        log = connection.queries_log
+        if not _depth and log.maxlen and len(log) > log.maxlen // 2:
+            log.clear()
+
+        return False
+
+
+def stage(name):
+    """Return a context manager timing the named stage."""
+    if _stats is None:
+        return _null_stage
+    return _Stage(name)
+
+
+def is_enabled():
+    return _stats is not None
+
+
+def enable():
+    """Enable instrumentation, resetting any counters."""
+    global _stats, _force_debug_cursor
+
+    if _stats is None:
+        # queries are only recorded by the debug cursor
+        _force_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+    _stats = OrderedDict()
+
+
+def disable():
+    global _stats
+
+    if _stats is not None:
+        connection.force_debug_cursor = _force_debug_cursor
+    _stats = None
+
+
+def get_stats():
+    """Return the counters of each stage, in the order first seen."""
+    if _stats is None:
+        return []
+    return list(_stats.values())
+
+
+def format_summary():
+    """Return a per-stage summary table, as a list of lines."""
+    lines = ['%-24s %8s %12s %10s %10s %9s' % (
+        'stage', 'calls', 'total (ms)', 'mean (ms)', 'max (ms)', 'queries')]
+    for stats in get_stats():
+        lines.append('%-24s %8d %12.1f %10.2f %10.2f %9d' % (
+            stats.name, stats.calls, stats.time * 1000,
+            stats.mean_time * 1000, stats.max_time * 1000, stats.queries))
+    return lines
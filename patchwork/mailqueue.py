@@ -0,0 +1,202 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+"""Queue outgoing mail in the database, for delivery in the background.
+
+With EMAIL_BACKEND set to 'patchwork.mailqueue.QueueBackend', sending
+mail only stores it, so a slow mail server can't hold up web requests.
+The sendqueuedmail management command then delivers the mail through
+MAIL_QUEUE_BACKEND, using up to MAIL_QUEUE_CONCURRENCY connections.
+
+Each delivery attempt first claims the mail for MAIL_QUEUE_LEASE_SECONDS,
+so several workers can share the queue and mail claimed by a worker that
+died is retried. A failed attempt is retried after
+MAIL_QUEUE_RETRY_SECONDS, doubling with each further failure, until
+MAIL_QUEUE_MAX_ATTEMPTS attempts have been made and the mail is marked
+dead.
+"""
+
+from __future__ import absolute_import
+
+import datetime
+import json
+import threading
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import connection as db_connection
+from django.db.models import F
+
+from patchwork.models import QueuedMail
+
+# the number of due mails considered when claiming one, so that workers
+# racing for the first can fall back to the others
+CLAIM_CANDIDATES = 10
+
+
+def serialize(message):
+    return json.dumps({
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': getattr(message, 'reply_to', []),
+        'headers': message.extra_headers,
+        'alternatives': getattr(message, 'alternatives', []),
+    })
+
+
+def deserialize(data):
+    data = json.loads(data)
+    message = EmailMultiAlternatives(
+        subject=data['subject'], body=data['body'],
+        from_email=data['from_email'], to=data['to'], cc=data['cc'],
+        bcc=data['bcc'], headers=data['headers'],
+        alternatives=[tuple(a) for a in data['alternatives']])
+    message.reply_to = data['reply_to']
+    return message
+
+
+class QueueBackend(BaseEmailBackend):
+    """An email backend adding messages to the queue."""
+
+    def send_messages(self, email_messages):
+        queued = []
+        immediate = []
+        for message in email_messages:
+            if not message.recipients():
+                continue
+
+            # attachments can't be queued, as they may not be text
+            if message.attachments:
+                immediate.append(message)
+            else:
+                queued.append(QueuedMail(message=serialize(message)))
+
+        QueuedMail.objects.bulk_create(queued)
+
+        if immediate:
+            backend = get_connection(settings.MAIL_QUEUE_BACKEND,
+                                     fail_silently=self.fail_silently)
+            backend.send_messages(immediate)
+
+        return len(queued) + len(immediate)
+
+
+def _claim():
+    now = datetime.datetime.now()
+    lease = now + datetime.timedelta(seconds=settings.MAIL_QUEUE_LEASE_SECONDS)
+    due = QueuedMail.objects.filter(
+        status=QueuedMail.STATUS_QUEUED, next_attempt__lte=now).order_by(
+            'next_attempt').values_list('id', 'next_attempt')
+
+    for mail_id, next_attempt in due[:CLAIM_CANDIDATES]:
+        # another worker may have claimed the mail since it was selected
+        claimed = QueuedMail.objects.filter(
+            id=mail_id, next_attempt=next_attempt).update(
+                next_attempt=lease, attempts=F('attempts') + 1)
+        if claimed:
+            return QueuedMail.objects.get(id=mail_id)
+
+    return None
+
+
+def _failed(mail, error):
+    mail.last_error = '%s: %s' % (type(error).__name__, error)
+    if mail.attempts >= settings.MAIL_QUEUE_MAX_ATTEMPTS:
+        mail.status = QueuedMail.STATUS_DEAD
+    else:
+        mail.next_attempt = datetime.datetime.now() + datetime.timedelta(
+            seconds=settings.MAIL_QUEUE_RETRY_SECONDS *
+            2 ** (mail.attempts - 1))
+    mail.save()
+
+
+def _worker(results, lock):
+    connection = get_connection(settings.MAIL_QUEUE_BACKEND)
+    sent = failed = 0
+
+    try:
+        mail = _claim()
+        while mail:
+            # a worker died while delivering the mail too often
+            if mail.attempts > settings.MAIL_QUEUE_MAX_ATTEMPTS:
+                _failed(mail, RuntimeError('delivery interrupted'))
+                failed += 1
+                mail = _claim()
+                continue
+
+            try:
+                connection.open()
+                connection.send_messages([deserialize(mail.message)])
+            except Exception as ex:
+                # the connection may be broken, so start a new one
+                connection.close()
+                _failed(mail, ex)
+                failed += 1
+            else:
+                mail.delete()
+                sent += 1
+
+            mail = _claim()
+    finally:
+        connection.close()
+        with lock:
+            results['sent'] += sent
+            results['failed'] += failed
+
+
+def deliver(concurrency=None):
+    """Deliver all the queued mail that is due.
+
+    Args:
+        concurrency (int): The number of mails delivered at once, each
+            over its own connection. Defaults to MAIL_QUEUE_CONCURRENCY.
+
+    Returns:
+        A (sent, failed) tuple of the number of mails delivered, and the
+        number of failed attempts.
+    """
+    if concurrency is None:
+        concurrency = settings.MAIL_QUEUE_CONCURRENCY
+
+    results = {'sent': 0, 'failed': 0}
+    lock = threading.Lock()
+
+    if concurrency <= 1:
+        _worker(results, lock)
+        return results['sent'], results['failed']
+
+    def run():
+        try:
+            _worker(results, lock)
+        finally:
+            db_connection.close()
+
+    threads = [threading.Thread(target=run) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return results['sent'], results['failed']
@@ -0,0 +1,45 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand
+
+from patchwork.utils import archive_stale_patches
+
+
+class Command(BaseCommand):
+    help = "Archive the patches matched by each project's archive policies"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='number of patches archived per transaction (default: '
+            '%(default)s)')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='only report how many patches would be archived')
+
+    def handle(self, *args, **options):
+        count = archive_stale_patches(chunk_size=options['chunk_size'],
+                                      dry_run=options['dry_run'])
+
+        self.stdout.write('%d patches %s' % (
+            count, 'would be archived' if options['dry_run'] else 'archived'))
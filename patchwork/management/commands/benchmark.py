@@ -0,0 +1,160 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from __future__ import absolute_import
+
+import json
+from timeit import default_timer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment
+from django.utils.six.moves import xmlrpc_client
+
+from patchwork.models import Bundle, Patch, Project
+
+
+def _percentile(values, percent):
+    """Return the given percentile of a sorted list, nearest-rank method."""
+    index = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the latency and query counts of the most frequently '
+            'used views, reporting the results as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project',
+                            help='linkname of the project to benchmark '
+                            '(default: the project with most patches)')
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='number of requests made per endpoint')
+        parser.add_argument('--output',
+                            help='write the report to this file rather '
+                            'than stdout')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be positive')
+
+        project = self.get_project(options['project'])
+        patches = list(Patch.objects.filter(project=project)
+                       .order_by('-date')[:options['iterations']])
+        bundle = Bundle.objects.filter(project=project, public=True)\
+            .annotate(n_patches=Count('patches')).order_by('-n_patches')\
+            .first()
+
+        # allows the test client to be used outside of the test runner
+        setup_test_environment()
+        self.client = Client()
+
+        endpoints = [
+            ('patch-list', self.get_view(
+                'patch-list', lambda i: {'project_id': project.linkname})),
+        ]
+        if patches:
+            for view in ('patch-detail', 'patch-mbox', 'patch-raw'):
+                endpoints.append((view, self.get_view(
+                    view, lambda i: {
+                        'patch_id': patches[i % len(patches)].id})))
+        if bundle:
+            endpoints.append(('bundle-mbox', self.get_view(
+                'bundle-mbox', lambda i: {
+                    'username': bundle.owner.username,
+                    'bundlename': bundle.name})))
+        if settings.ENABLE_XMLRPC:
+            endpoints.append(('xmlrpc-patch_list', self.get_xmlrpc(
+                'patch_list', ({'project_id': project.id},))))
+
+        report = {
+            'project': project.linkname,
+            'patches': Patch.objects.filter(project=project).count(),
+            'iterations': options['iterations'],
+            'endpoints': {},
+        }
+        for name, fn in endpoints:
+            report['endpoints'][name] = self.run(fn, options['iterations'])
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def get_project(self, linkname):
+        if linkname:
+            try:
+                return Project.objects.get(linkname=linkname)
+            except Project.DoesNotExist:
+                raise CommandError('Project %s does not exist' % linkname)
+
+        project = Project.objects.annotate(n_patches=Count('submission'))\
+            .order_by('-n_patches').first()
+        if not project:
+            raise CommandError('No projects found. Generate some data with '
+                               'the generatedata command first.')
+        return project
+
+    def get_view(self, view, kwargs):
+        def fn(i):
+            response = self.client.get(reverse(view, kwargs=kwargs(i)))
+            # consume streaming responses so their queries are counted
+            if getattr(response, 'streaming', False):
+                b''.join(response.streaming_content)
+            return response.status_code
+        return fn
+
+    def get_xmlrpc(self, method, params):
+        body = xmlrpc_client.dumps(params, method)
+
+        def fn(i):
+            response = self.client.post(reverse('xmlrpc'), body,
+                                        content_type='text/xml')
+            return response.status_code
+        return fn
+
+    def run(self, fn, iterations):
+        # warm up caches (sessions, sites, templates, ...) first
+        fn(0)
+
+        timings = []
+        queries = []
+        for i in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                start = default_timer()
+                status = fn(i)
+                timings.append((default_timer() - start) * 1000)
+            queries.append(len(captured))
+            if status != 200:
+                raise CommandError('Request failed with status %d' % status)
+
+        timings.sort()
+        return {
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'p50_ms': round(_percentile(timings, 50), 3),
+            'p95_ms': round(_percentile(timings, 95), 3),
+            'max_ms': round(timings[-1], 3),
+            'queries': max(queries),
+        }
@@ -0,0 +1,201 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from __future__ import absolute_import
+
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from patchwork.fields import COLD_PREFIX, blob_digest, is_cold_ref
+from patchwork.models import ColdValue, Comment, Patch, Submission
+
+# how long cold values are kept before they may be purged, so that values
+# stored by a move which hasn't updated the hot columns yet are kept
+PURGE_GRACE = datetime.timedelta(days=1)
+
+# the columns moved for each patch: model, the column holding the patch ID
+# and the columns moved
+COLUMNS = [
+    (Submission, 'id', ['headers', 'content']),
+    (Patch, 'submission_ptr_id', ['diff']),
+    (Comment, 'submission_id', ['headers', 'content']),
+]
+
+
+def _chunks(ids, size):
+    for i in range(0, len(ids), size):
+        yield ids[i:i + size]
+
+
+class Command(BaseCommand):
+    help = ('Move the bulky columns of old archived patches to cold storage, '
+            'and those of unarchived patches back')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.COLD_STORAGE_DAYS,
+            help='move archived patches submitted more than this many days '
+            'ago (default: %(default)s)')
+        parser.add_argument(
+            '--restore', action='store_true',
+            help='move all patches back out of cold storage')
+        parser.add_argument(
+            '--purge', action='store_true',
+            help='delete cold values which are no longer used')
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='number of patches moved per transaction (default: '
+            '%(default)s)')
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        self.cold = settings.COLD_STORAGE_DATABASE
+
+        cold_patches = Patch.objects.filter(cold=True)
+        if options['restore']:
+            restore = cold_patches
+        else:
+            restore = cold_patches.filter(archived=False)
+            since = datetime.datetime.now() - datetime.timedelta(
+                days=options['days'])
+            self.move(Patch.objects.filter(
+                archived=True, cold=False, date__lt=since))
+        self.restore(restore)
+
+        if options['purge']:
+            self.purge()
+
+    def _select(self, model, key, columns, ids):
+        """Return the raw values of the given patches' columns.
+
+        Columns are read and written with raw SQL, as loading them through
+        the ORM would resolve them.
+        """
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT %s, %s FROM %s WHERE %s IN (%s)' % (
+                qn(model._meta.pk.column),
+                ', '.join(qn(column) for column in columns),
+                qn(model._meta.db_table), qn(key),
+                ', '.join(['%s'] * len(ids))), ids)
+            return cursor.fetchall()
+
+    def _update(self, model, column, updates):
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.executemany('UPDATE %s SET %s = %%s WHERE %s = %%s' % (
+                qn(model._meta.db_table), qn(column),
+                qn(model._meta.pk.column)), updates)
+
+    def move(self, patches):
+        ids = list(patches.order_by('id').values_list('id', flat=True))
+        for count, chunk in enumerate(_chunks(ids, self.chunk_size)):
+            for model, key, columns in COLUMNS:
+                rows = self._select(model, key, columns, chunk)
+                for i, column in enumerate(columns, 1):
+                    values = dict(
+                        (row[0], row[i]) for row in rows
+                        if row[i] and not is_cold_ref(row[i]))
+                    if values:
+                        self._move_values(model, column, values)
+            # patches with nothing to move are marked too, so they aren't
+            # selected again
+            Patch.objects.filter(id__in=chunk).update(cold=True)
+
+            self.stdout.write('moved %06d/%06d\r' % (
+                count * self.chunk_size + len(chunk), len(ids)), ending='')
+            self.stdout.flush()
+
+        self.stdout.write('%d patches moved to cold storage' % len(ids))
+
+    def _move_values(self, model, column, values):
+        digests = dict((row_id, blob_digest(value))
+                       for row_id, value in values.items())
+
+        # cold values are committed before the hot columns are updated, so
+        # that an interruption can only leave unused cold values
+        with transaction.atomic(using=self.cold):
+            existing = set(ColdValue.objects.using(self.cold).filter(
+                digest__in=set(digests.values())).values_list(
+                    'digest', flat=True))
+            # reused values are stored again, so they aren't purged while
+            # this move references them
+            ColdValue.objects.using(self.cold).filter(
+                digest__in=existing).update(created=datetime.datetime.now())
+            cold_values = {}
+            for row_id, digest in digests.items():
+                if digest not in existing:
+                    cold_values[digest] = ColdValue(digest=digest,
+                                                    data=values[row_id])
+            ColdValue.objects.using(self.cold).bulk_create(
+                cold_values.values())
+
+        with transaction.atomic():
+            self._update(model, column, [
+                (COLD_PREFIX + digest, row_id)
+                for row_id, digest in digests.items()])
+
+    def restore(self, patches):
+        ids = list(patches.order_by('id').values_list('id', flat=True))
+        for chunk in _chunks(ids, self.chunk_size):
+            with transaction.atomic():
+                for model, key, columns in COLUMNS:
+                    rows = self._select(model, key, columns, chunk)
+                    for i, column in enumerate(columns, 1):
+                        refs = dict((row[0], row[i][len(COLD_PREFIX):])
+                                    for row in rows if is_cold_ref(row[i]))
+                        if not refs:
+                            continue
+
+                        data = dict(ColdValue.objects.using(
+                            self.cold).filter(
+                                digest__in=set(refs.values())).values_list(
+                                    'digest', 'data'))
+                        self._update(model, column, [
+                            (data[digest], row_id)
+                            for row_id, digest in refs.items()])
+                Patch.objects.filter(id__in=chunk).update(cold=False)
+
+        self.stdout.write('%d patches restored from cold storage' % len(ids))
+
+    def purge(self):
+        cutoff = datetime.datetime.now() - PURGE_GRACE
+        qn = connection.ops.quote_name
+        used = set()
+        with connection.cursor() as cursor:
+            for model, _, columns in COLUMNS:
+                for column in columns:
+                    cursor.execute('SELECT %s FROM %s WHERE %s LIKE %%s' % (
+                        qn(column), qn(model._meta.db_table), qn(column)),
+                        [COLD_PREFIX + '%'])
+                    used.update(row[0][len(COLD_PREFIX):]
+                                for row in cursor.fetchall())
+
+        unused = list(set(ColdValue.objects.using(self.cold).filter(
+            created__lt=cutoff).values_list('digest', flat=True)) - used)
+        for chunk in _chunks(unused, self.chunk_size):
+            # re-checked, in case a value was stored again since it was
+            # listed
+            ColdValue.objects.using(self.cold).filter(
+                digest__in=chunk, created__lt=cutoff).delete()
+
+        self.stdout.write('%d unused cold values deleted' % len(unused))
@@ -0,0 +1,95 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from patchwork.fields import CompressedTextField, is_compressed, \
+    maybe_compress_text
+from patchwork.models import Blob, Comment, Submission
+
+
+class Command(BaseCommand):
+    help = 'Compress existing large text values'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='number of rows converted per transaction (default: '
+            '%(default)s)')
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+
+        for model in (Submission, Comment, Blob):
+            for field in model._meta.local_concrete_fields:
+                if isinstance(field, CompressedTextField):
+                    self.convert(model, field)
+
+    def convert(self, model, field):
+        table = connection.ops.quote_name(model._meta.db_table)
+        pk = connection.ops.quote_name(model._meta.pk.column)
+        column = connection.ops.quote_name(field.column)
+
+        # columns are read and written with raw SQL, as loading them
+        # through the ORM would decompress them. Rows are walked in primary
+        # key order, as blobs are keyed by digest rather than by number
+        select = 'SELECT %s, %s FROM %s %%s ORDER BY %s LIMIT %d' % (
+            pk, column, table, pk, self.chunk_size)
+        update = 'UPDATE %s SET %s = %%s WHERE %s = %%s' % (table, column, pk)
+
+        rows = old_size = new_size = 0
+        last_pk = None
+        while True:
+            with transaction.atomic(), connection.cursor() as cursor:
+                if last_pk is None:
+                    cursor.execute(select % '')
+                else:
+                    cursor.execute(select % ('WHERE %s > %%s' % pk),
+                                   [last_pk])
+                results = cursor.fetchall()
+                if not results:
+                    break
+                last_pk = results[-1][0]
+
+                values = []
+                for row_id, value in results:
+                    if value is None or is_compressed(value):
+                        continue
+                    # values which don't get any shorter are left as they are
+                    compressed = maybe_compress_text(value, field.dictionary)
+                    if compressed != value:
+                        values.append((compressed, row_id, value))
+                cursor.executemany(update, [
+                    (compressed, row_id) for compressed, row_id, _ in values])
+
+            rows += len(values)
+            old_size += sum(len(value) for _, _, value in values)
+            new_size += sum(len(compressed) for compressed, _, _ in values)
+
+            self.stdout.write('%s.%s: %d values compressed\r' % (
+                model._meta.model_name, field.name, rows), ending='')
+            self.stdout.flush()
+
+        self.stdout.write('%s.%s: %d values of %d characters compressed to '
+                          '%d characters' % (
+                              model._meta.model_name, field.name, rows,
+                              old_size, new_size))
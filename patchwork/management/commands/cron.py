@@ -19,17 +19,16 @@
 
 from django.core.management.base import BaseCommand
 
-from patchwork.utils import send_notifications, do_expiry
+from patchwork import scheduler
 
 
 class Command(BaseCommand):
-    help = ('Run periodic patchwork functions: send notifications and '
-            'expire unused users')
+    help = ('Run periodic patchwork functions: send notifications, '
+            'expire unused users and compact the event log. Jobs being '
+            'run elsewhere, for instance by the scheduler command, are '
+            'skipped')
 
     def handle(self, *args, **kwargs):
-        errors = send_notifications()
-        for (recipient, error) in errors:
-            self.stderr.write("Failed sending to %s: %s" %
-                              (recipient.email, error))
-
-        do_expiry()
+        for (job, error) in scheduler.run_pending(force=True):
+            if error:
+                self.stderr.write('Job %s failed: %s' % (job.name, error))
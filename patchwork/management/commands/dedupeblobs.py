@@ -0,0 +1,173 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from __future__ import absolute_import
+
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import Max
+
+from patchwork.fields import BLOB_PREFIX, BlobField, blob_digest, is_blob_ref
+from patchwork.models import Blob, ColdValue, Comment, Patch, Submission
+
+# unreferenced blobs used more recently than this are kept, as the
+# transactions which used them may not have committed yet
+PURGE_GRACE = datetime.timedelta(days=1)
+
+
+class Command(BaseCommand):
+    help = ('Move existing large text values to the blob store, storing '
+            'duplicates once')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='number of rows converted per transaction (default: '
+            '%(default)s)')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='report the space that would be saved, without changing '
+            'anything')
+        parser.add_argument(
+            '--purge', action='store_true',
+            help='instead delete blobs which are no longer referenced')
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        self.dry_run = options['dry_run']
+        # digests of the blobs created by a dry run, were it not one
+        self.new_digests = set()
+
+        columns = [(model, field)
+                   for model in (Submission, Patch, Comment)
+                   for field in model._meta.local_concrete_fields
+                   if isinstance(field, BlobField)]
+
+        if options['purge']:
+            self.purge(columns)
+            return
+
+        for model, field in columns:
+            self.convert(model, field)
+
+    def convert(self, model, field):
+        table = connection.ops.quote_name(model._meta.db_table)
+        pk = connection.ops.quote_name(model._meta.pk.column)
+        column = connection.ops.quote_name(field.column)
+        last_pk = model._base_manager.aggregate(Max('pk'))['pk__max'] or 0
+
+        # columns are read and written with raw SQL, as loading them
+        # through the ORM would resolve existing blob references
+        select = 'SELECT %s, %s FROM %s WHERE %s >= %%s AND %s < %%s' % (
+            pk, column, table, pk, pk)
+        update = 'UPDATE %s SET %s = %%s WHERE %s = %%s' % (table, column, pk)
+
+        rows = old_size = new_size = 0
+        for start in range(0, last_pk + 1, self.chunk_size):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(select, [start, start + self.chunk_size])
+                values = dict(
+                    (row_id, value) for row_id, value in cursor.fetchall()
+                    if value is not None and not is_blob_ref(value) and
+                    len(value) >= settings.BLOB_MIN_LENGTH)
+                if not values:
+                    continue
+
+                digests = dict((row_id, blob_digest(value))
+                               for row_id, value in values.items())
+                existing = set(Blob.objects.filter(
+                    digest__in=set(digests.values())).values_list(
+                        'digest', flat=True))
+                if not self.dry_run:
+                    # see purge()
+                    Blob.objects.filter(digest__in=existing).update(
+                        last_used=datetime.datetime.now())
+                existing |= self.new_digests
+
+                blobs = {}
+                for row_id, digest in digests.items():
+                    if digest not in existing and digest not in blobs:
+                        blobs[digest] = Blob(digest=digest,
+                                             data=values[row_id])
+
+                rows += len(values)
+                old_size += sum(len(value) for value in values.values())
+                new_size += sum(len(blob.data) for blob in blobs.values())
+
+                if self.dry_run:
+                    self.new_digests.update(blobs)
+                    continue
+
+                try:
+                    with transaction.atomic():
+                        Blob.objects.bulk_create(blobs.values())
+                except IntegrityError:
+                    # a concurrently parsed mail added one of the blobs
+                    for blob in blobs.values():
+                        Blob.objects.get_or_create(
+                            digest=blob.digest, defaults={'data': blob.data})
+                cursor.executemany(update, [
+                    (BLOB_PREFIX + digest, row_id)
+                    for row_id, digest in digests.items()])
+
+            self.stdout.write('%s.%s: %06d/%06d\r' % (
+                model._meta.model_name, field.name,
+                min(start + self.chunk_size, last_pk), last_pk), ending='')
+            self.stdout.flush()
+
+        self.stdout.write('%s.%s: %d values of %d characters stored as %d '
+                          'characters of blobs' % (
+                              model._meta.model_name, field.name, rows,
+                              old_size, new_size))
+
+    def purge(self, columns):
+        # values in cold storage may be blob references too
+        tables = [(connection, model._meta.db_table, field.column)
+                  for model, field in columns]
+        tables.append((connections[settings.COLD_STORAGE_DATABASE],
+                       ColdValue._meta.db_table,
+                       ColdValue._meta.get_field('data').column))
+
+        cutoff = datetime.datetime.now() - PURGE_GRACE
+        used = set()
+        for conn, table, column in tables:
+            qn = conn.ops.quote_name
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT %s FROM %s WHERE %s LIKE %%s' % (
+                    qn(column), qn(table), qn(column)),
+                    [BLOB_PREFIX + '%'])
+                used.update(row[0][len(BLOB_PREFIX):]
+                            for row in cursor.fetchall())
+
+        unused = list(set(Blob.objects.filter(
+            last_used__lt=cutoff).values_list('digest', flat=True)) - used)
+        deleted = 0
+        for start in range(0, len(unused), self.chunk_size):
+            chunk = unused[start:start + self.chunk_size]
+            if not self.dry_run:
+                # re-checked, in case a blob was used since it was listed
+                Blob.objects.filter(digest__in=chunk,
+                                    last_used__lt=cutoff).delete()
+            deleted += len(chunk)
+
+        self.stdout.write('%d unused blobs %s' % (
+            deleted, 'would be deleted' if self.dry_run else 'deleted'))
@@ -0,0 +1,54 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+from __future__ import absolute_import
+
+from django.core.management.base import BaseCommand
+
+from patchwork.utils import do_expiry
+
+
+class Command(BaseCommand):
+    help = ('Expire pending confirmations, and inactive users who have no '
+            'pending confirmation')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='number of rows deleted per transaction (default: '
+            '%(default)s)')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='only report how many rows would be deleted')
+
+    def progress(self, kind, done, total):
+        self.stdout.write('%s: %06d/%06d\r' % (kind, done, total), ending='')
+        self.stdout.flush()
+        if done == total:
+            self.stdout.write('')
+
+    def handle(self, *args, **options):
+        confirmations, users = do_expiry(
+            chunk_size=options['chunk_size'], dry_run=options['dry_run'],
+            progress=self.progress if options['verbosity'] else None)
+
+        self.stdout.write('%d confirmations and %d users %s' % (
+            confirmations, users,
+            'would be expired' if options['dry_run'] else 'expired'))
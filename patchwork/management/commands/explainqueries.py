@@ -0,0 +1,106 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+from __future__ import absolute_import
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+
+from patchwork.models import Patch, Person, Project, State
+from patchwork.views import Order
+
+
+class Command(BaseCommand):
+    help = ('Print the query plans of the most frequently run queries, to '
+            'check that they use the expected indexes')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--project',
+                            help='linkname of the project to use (default: '
+                            'the project with most patches)')
+        parser.add_argument('--analyze', action='store_true',
+                            help='run the queries and report actual timings '
+                            '(PostgreSQL only)')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.explain = 'EXPLAIN QUERY PLAN '
+        elif options['analyze'] and connection.vendor == 'postgresql':
+            self.explain = 'EXPLAIN ANALYZE '
+        else:
+            self.explain = 'EXPLAIN '
+
+        project = self.get_project(options['project'])
+        patch = Patch.objects.filter(project=project).exclude(
+            hash=None).only('hash').first()
+        delegate = User.objects.filter(
+            patch__project=project).order_by('id').first()
+        person = Person.objects.order_by('id').first()
+
+        # the queries made by the patch list, the todo list, hash lookups by
+        # pwclient and author lookups by the mail parser respectively
+        patches = Patch.objects.filter(project=project)
+        patches = patches.filter(
+            archived=False, state__in=State.objects.filter(
+                action_required=True).values('pk').query)
+        patches = Order().apply(patches).with_tag_counts(project)
+        patches = patches.defer('content', 'diff', 'headers')
+        patches = patches.select_related('state', 'submitter', 'delegate')
+        queries = [
+            ('patch list', patches[:settings.DEFAULT_ITEMS_PER_PAGE]),
+            ('patch by hash', Patch.objects.filter(
+                hash=patch.hash if patch else '0' * 40)),
+            ('person by email', Person.objects.filter(
+                email_key=person.email_key if person else '')),
+        ]
+        if delegate:
+            queries.insert(1, ('todo list',
+                               delegate.profile.todo_patches(project)))
+        else:
+            self.stderr.write('No delegated patches; skipping the todo list')
+
+        for name, queryset in queries:
+            self.stdout.write('%s:' % name)
+            for line in self.get_plan(queryset):
+                self.stdout.write('    %s' % line)
+            self.stdout.write('')
+
+    def get_project(self, linkname):
+        if linkname:
+            try:
+                return Project.objects.get(linkname=linkname)
+            except Project.DoesNotExist:
+                raise CommandError('Project %s does not exist' % linkname)
+
+        project = Project.objects.annotate(n_patches=Count('submission'))\
+            .order_by('-n_patches').first()
+        if not project:
+            raise CommandError('No projects found')
+        return project
+
+    def get_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(self.explain + sql, params)
+            return [' | '.join(str(column) for column in row)
+                    for row in cursor.fetchall()]
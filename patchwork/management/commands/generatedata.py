@@ -0,0 +1,353 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from __future__ import absolute_import
+
+import datetime
+import random
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.six.moves import range
+
+from patchwork.models import (Bundle, BundlePatch, Check, Comment,
+                              DelegationRule, Patch, PatchBucket, PatchFile,
+                              PatchTag, Person, Project, State, Submission,
+                              Tag)
+from patchwork.parser import hash_patch, patch_get_file_stats
+from patchwork.similarity import diff_buckets
+
+# top-level directories and file names used to build diffs; delegation
+# rules are generated against the same directories
+DIRECTORIES = [
+    'arch/x86/kernel', 'arch/arm/mach', 'drivers/net/ethernet',
+    'drivers/gpu/drm', 'drivers/usb/core', 'Documentation/devicetree',
+    'fs/ext4', 'include/linux', 'kernel/sched', 'mm', 'net/core',
+    'sound/soc', 'tools/perf',
+]
+FILE_NAMES = ['core.c', 'main.c', 'init.c', 'util.c', 'debug.c', 'Kconfig',
+              'Makefile', 'regs.h', 'types.h']
+WORDS = ('fix add remove update refactor handle support use avoid clean '
+         'driver device buffer memory lock queue timer error path table '
+         'register interrupt state config value check length offset').split()
+
+
+def _next_id(model):
+    return (model.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+
+def _sentence(rng, min_words=4, max_words=12):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words,
+                                                          max_words))]
+    return ' '.join(words).capitalize()
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic data set of projects, people, patches, '
+            'comments, tags, checks, bundles and delegation rules')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=5,
+                            help='number of projects to create')
+        parser.add_argument('--patches', type=int, default=1000,
+                            help='total number of patches to create')
+        parser.add_argument('--people', type=int, default=200,
+                            help='number of submitters to create')
+        parser.add_argument('--users', type=int, default=10,
+                            help='number of users (delegates, check '
+                            'owners, bundle owners) to create')
+        parser.add_argument('--comments', type=float, default=2.0,
+                            help='mean number of comments per patch')
+        parser.add_argument('--checks', type=float, default=1.0,
+                            help='mean number of checks per patch')
+        parser.add_argument('--bundles', type=int, default=20,
+                            help='number of bundles to create')
+        parser.add_argument('--bundle-size', type=int, default=20,
+                            help='number of patches per bundle')
+        parser.add_argument('--rules', type=int, default=5,
+                            help='number of delegation rules per project')
+        parser.add_argument('--archived', type=float, default=0.8,
+                            help='fraction of patches that are archived')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of patches inserted per '
+                            'transaction')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='random seed, for reproducible data sets')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.options = options
+
+        self.states = list(State.objects.all())
+        if not self.states:
+            raise CommandError('No states found. Load the default_states '
+                               'fixture first.')
+        self.tags = list(Tag.objects.all())
+
+        self.users = self.create_users(options['users'])
+        self.people = self.create_people(options['people'])
+        self.projects = self.create_projects(options['projects'])
+        self.create_delegation_rules(options['rules'])
+
+        self.patch_ids = {project.id: [] for project in self.projects}
+        self.create_patches(options['patches'], options['batch_size'])
+        self.create_bundles(options['bundles'], options['bundle_size'])
+
+        self.reset_sequences()
+
+        self.stdout.write('\ndone')
+
+    def reset_sequences(self):
+        # rows were inserted with explicit primary keys, which doesn't
+        # advance the sequences of some databases
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [Person, Project, Submission, Bundle])
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    def create_users(self, count):
+        # users are created individually, as bulk_create doesn't send the
+        # post_save signal that creates the user profile
+        base = _next_id(User)
+        users = []
+        for i in range(count):
+            username = 'synthetic%d' % (base + i)
+            users.append(User.objects.create_user(
+                username, '%s@example.com' % username, username))
+        return users
+
+    def create_people(self, count):
+        base = _next_id(Person)
+        people = []
+        for i in range(count):
+            pk = base + i
+            email = 'person%d@synthetic.example.com' % pk
+            # bulk_create doesn't call save(), which sets the email key
+            people.append(Person(id=pk, name='Synthetic Person %d' % pk,
+                                 email=email, email_key=email))
+        Person.objects.bulk_create(people)
+        return people
+
+    def create_projects(self, count):
+        base = _next_id(Project)
+        projects = []
+        for i in range(count):
+            linkname = 'synthetic-%d' % (base + i)
+            projects.append(Project(
+                id=base + i, linkname=linkname, name=linkname.capitalize(),
+                listid='%s.synthetic.example.com' % linkname,
+                listemail='%s@synthetic.example.com' % linkname))
+        Project.objects.bulk_create(projects)
+        return projects
+
+    def create_delegation_rules(self, count):
+        if not self.users:
+            return
+
+        rules = []
+        for project in self.projects:
+            for priority, path in enumerate(
+                    self.rng.sample(DIRECTORIES, min(count,
+                                                     len(DIRECTORIES)))):
+                rules.append(DelegationRule(
+                    project=project, path=path + '/*', priority=priority,
+                    user=self.rng.choice(self.users)))
+        DelegationRule.objects.bulk_create(rules)
+
+    def make_diff(self):
+        """Generate a diff of realistic shape and size.
+
+        Most patches touch one or two files with a few small hunks, but
+        the size distribution has a long tail.
+        """
+        rng = self.rng
+        lines = []
+        filenames = []
+
+        n_files = min(1 + int(rng.expovariate(0.7)), 40)
+        for _ in range(n_files):
+            filename = '%s/%s' % (rng.choice(DIRECTORIES),
+                                  rng.choice(FILE_NAMES))
+            filenames.append(filename)
+            lines.append('diff --git a/%s b/%s' % (filename, filename))
+            lines.append('index %07x..%07x 100644' % (
+                rng.getrandbits(28), rng.getrandbits(28)))
+            lines.append('--- a/%s' % filename)
+            lines.append('+++ b/%s' % filename)
+
+            start = rng.randint(1, 2000)
+            for _ in range(min(1 + int(rng.expovariate(0.8)), 20)):
+                removed = min(int(rng.lognormvariate(1.0, 1.0)), 300)
+                added = min(int(rng.lognormvariate(1.5, 1.0)), 300)
+                lines.append('@@ -%d,%d +%d,%d @@ %s' % (
+                    start, removed + 6, start, added + 6,
+                    _sentence(rng, 1, 3).lower()))
+                context = ['\t' + _sentence(rng, 2, 6).lower() + ';'
+                           for _ in range(6)]
+                lines.extend(' ' + line for line in context[:3])
+                lines.extend('-\t' + _sentence(rng, 2, 8).lower() + ';'
+                             for _ in range(removed))
+                lines.extend('+\t' + _sentence(rng, 2, 8).lower() + ';'
+                             for _ in range(added))
+                lines.extend(' ' + line for line in context[3:])
+                start += rng.randint(20, 200)
+
+        return '\n'.join(lines) + '\n', filenames
+
+    def make_content(self, submitter):
+        paragraphs = [' '.join(_sentence(self.rng) + '.'
+                               for _ in range(self.rng.randint(1, 4)))
+                      for _ in range(self.rng.randint(1, 3))]
+        paragraphs.append('Signed-off-by: %s' % submitter)
+        return '\n\n'.join(paragraphs)
+
+    def make_headers(self, msgid, submitter, project, subject, date):
+        return ('Message-Id: %s\nFrom: %s\nTo: %s\nSubject: [PATCH] %s\n'
+                'Date: %s\nList-Id: <%s>\n' % (
+                    msgid, submitter, project.listemail, subject,
+                    date.strftime('%a, %d %b %Y %H:%M:%S +0000'),
+                    project.listid))
+
+    def _count(self, mean):
+        """Return a random, non-negative count with the given mean."""
+        if mean <= 0:
+            return 0
+        return int(self.rng.expovariate(1.0 / mean) + 0.5)
+
+    def create_patches(self, count, batch_size):
+        base = _next_id(Submission)
+        start_date = datetime.datetime.now() - datetime.timedelta(
+            days=3 * 365)
+        step = datetime.timedelta(days=3 * 365) / max(count, 1)
+
+        for offset in range(0, count, batch_size):
+            with transaction.atomic():
+                self.create_patch_batch(
+                    base + offset, min(batch_size, count - offset),
+                    start_date + step * offset, step)
+            self.stdout.write('%06d/%06d\r' % (
+                min(offset + batch_size, count), count), ending='')
+            self.stdout.flush()
+
+    def create_patch_batch(self, base, count, date, step):
+        rng = self.rng
+        patches = []
+        comments = []
+        checks = []
+        patchtags = []
+        patchfiles = []
+        patchbuckets = []
+
+        for pk in range(base, base + count):
+            project = rng.choice(self.projects)
+            submitter = rng.choice(self.people)
+            name = _sentence(rng)
+            msgid = '<%d.%d@synthetic.example.com>' % (
+                pk, rng.getrandbits(32))
+            diff, filenames = self.make_diff()
+            date += step
+
+            delegate = None
+            if self.users and rng.random() < 0.3:
+                delegate = rng.choice(self.users)
+
+            patches.append(Patch(
+                id=pk, submission_ptr_id=pk, project=project,
+                submitter=submitter, msgid=msgid, name=name, date=date,
+                headers=self.make_headers(msgid, submitter, project, name,
+                                          date),
+                content=self.make_content(submitter), diff=diff,
+                hash=hash_patch(diff).hexdigest(), delegate=delegate,
+                state=rng.choice(self.states),
+                archived=rng.random() < self.options['archived']))
+            self.patch_ids[project.id].append(pk)
+            patchfiles.extend(PatchFile.from_stats(
+                pk, patch_get_file_stats(diff)))
+            patchbuckets.extend(PatchBucket.from_buckets(
+                pk, diff_buckets(diff)))
+
+            tag_counts = {}
+            for i in range(self._count(self.options['comments'])):
+                commenter = rng.choice(self.people)
+                content = _sentence(rng) + '.'
+                if self.tags and rng.random() < 0.5:
+                    tag = rng.choice(self.tags)
+                    tag_counts[tag] = tag_counts.get(tag, 0) + 1
+                    content += '\n\n%s %s' % (tag.name + ':', commenter)
+                comments.append(Comment(
+                    submission_id=pk, submitter=commenter, content=content,
+                    msgid='<%d.%d.%d@synthetic.example.com>' % (
+                        pk, i, rng.getrandbits(32)),
+                    date=date + datetime.timedelta(hours=i + 1),
+                    headers=''))
+
+            for tag, tag_count in tag_counts.items():
+                patchtags.append(PatchTag(patch_id=pk, tag=tag,
+                                          count=tag_count))
+
+            if self.users:
+                for i in range(self._count(self.options['checks'])):
+                    checks.append(Check(
+                        patch_id=pk, user=rng.choice(self.users),
+                        date=date + datetime.timedelta(minutes=i + 1),
+                        state=rng.choice(Check.STATE_CHOICES)[0],
+                        target_url='http://ci.example.com/%d/%d' % (pk, i),
+                        description=_sentence(rng, 2, 5),
+                        context='ci-%d' % rng.randint(1, 3)))
+
+        Submission.objects.bulk_create(patches)
+        # bulk_create refuses multi-table inherited models, so insert the
+        # patch table rows the way bulk_create itself does
+        fields = Patch._meta.local_concrete_fields
+        batch = max(connection.ops.bulk_batch_size(fields, patches), 1)
+        for i in range(0, len(patches), batch):
+            Patch._base_manager._insert(patches[i:i + batch], fields=fields)
+
+        PatchFile.objects.bulk_create(patchfiles)
+        PatchBucket.objects.bulk_create(patchbuckets)
+        Comment.objects.bulk_create(comments)
+        PatchTag.objects.bulk_create(patchtags)
+        Check.objects.bulk_create(checks)
+
+    def create_bundles(self, count, size):
+        if not self.users or not count:
+            return
+
+        base = _next_id(Bundle)
+        bundles = []
+        bundlepatches = []
+        for pk in range(base, base + count):
+            project = self.rng.choice(self.projects)
+            patch_ids = self.patch_ids[project.id]
+            bundles.append(Bundle(
+                id=pk, owner=self.rng.choice(self.users), project=project,
+                name='synthetic-bundle-%d' % pk,
+                public=self.rng.random() < 0.5))
+            patch_ids = self.rng.sample(patch_ids, min(size, len(patch_ids)))
+            for order, patch_id in enumerate(patch_ids):
+                bundlepatches.append(BundlePatch(
+                    bundle_id=pk, patch_id=patch_id, order=order + 1))
+
+        with transaction.atomic():
+            Bundle.objects.bulk_create(bundles)
+            BundlePatch.objects.bulk_create(bundlepatches)
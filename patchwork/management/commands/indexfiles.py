@@ -0,0 +1,33 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from __future__ import absolute_import
+
+from patchwork.management.indexing import IndexCommand
+from patchwork.models import PatchFile
+from patchwork.parser import patch_get_file_stats
+
+
+class Command(IndexCommand):
+    help = 'Build the index of files touched by existing patches'
+    model = PatchFile
+    index_diff = staticmethod(patch_get_file_stats)
+
+    def entries(self, patch_id, stats):
+        return PatchFile.from_stats(patch_id, stats)
@@ -0,0 +1,33 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from __future__ import absolute_import
+
+from patchwork.management.indexing import IndexCommand
+from patchwork.models import PatchBucket
+from patchwork.similarity import diff_buckets
+
+
+class Command(IndexCommand):
+    help = 'Build the near-duplicate index of existing patches'
+    model = PatchBucket
+    index_diff = staticmethod(diff_buckets)
+
+    def entries(self, patch_id, buckets):
+        return PatchBucket.from_buckets(patch_id, buckets)
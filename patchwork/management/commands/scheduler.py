@@ -0,0 +1,88 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+from __future__ import absolute_import
+
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection
+
+from patchwork import scheduler
+
+
+class Command(BaseCommand):
+    help = ('Keep running periodic patchwork jobs, such as sending '
+            'notifications, as they become due')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--poll', type=int, default=10,
+            help='number of seconds between checks for due jobs (default: '
+            '%(default)s)')
+        parser.add_argument(
+            '--once', action='store_true',
+            help='run the jobs that are due, then exit')
+
+    def report(self, job, error):
+        if error:
+            self.stderr.write('Job %s failed: %s' % (job.name, error))
+
+    def handle(self, *args, **options):
+        if options['once']:
+            for (job, error) in scheduler.run_pending():
+                self.report(job, error)
+            return
+
+        # each job is run in its own thread, so that a long job doesn't
+        # hold up the others
+        threads = {}
+        while True:
+            close_old_connections()
+            try:
+                self.start_due(threads)
+            except DatabaseError as ex:
+                # the database may be briefly unavailable, so try again
+                # with a new connection after polling
+                self.stderr.write('Failed claiming jobs: %s' % ex)
+                connection.close()
+
+            time.sleep(options['poll'])
+
+    def start_due(self, threads):
+        for job in scheduler.jobs():
+            thread = threads.get(job.name)
+            if thread and thread.is_alive():
+                continue
+
+            locked_until = scheduler.claim(job)
+            if locked_until:
+                thread = threading.Thread(target=self.run,
+                                          args=(job, locked_until))
+                thread.daemon = True
+                thread.start()
+                threads[job.name] = thread
+
+    def run(self, job, locked_until):
+        try:
+            self.report(job, scheduler.run(job, locked_until))
+        finally:
+            connection.close()
@@ -0,0 +1,53 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+from __future__ import absolute_import
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from patchwork import mailqueue
+
+
+class Command(BaseCommand):
+    help = 'Deliver the mail queued by patchwork.mailqueue.QueueBackend'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int,
+            default=settings.MAIL_QUEUE_CONCURRENCY,
+            help='number of mails delivered at once (default: '
+            '%(default)s)')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='keep running, checking for mail every this many seconds, '
+            'rather than exiting once the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = mailqueue.deliver(options['concurrency'])
+            if options['verbosity'] > 1 or failed:
+                self.stdout.write('%d sent, %d failed' % (sent, failed))
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,115 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Shared implementation of the commands which index existing diffs."""
+
+from __future__ import absolute_import
+
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils.six.moves import map
+
+from patchwork.models import Patch
+
+
+def _index(item):
+    index_diff, patch_id, diff = item
+    return patch_id, index_diff(diff)
+
+
+class IndexCommand(BaseCommand):
+    """Base class for commands building an index of existing patches.
+
+    Subclasses set model, the model of the index entries, each of which
+    has a patch, and index_diff, a static method wrapping a module-level
+    function run in the worker processes, and implement entries().
+    """
+    model = None
+    index_diff = None
+
+    def entries(self, patch_id, result):
+        """Return the index entries of a patch from its index_diff()."""
+        raise NotImplementedError
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'patch_ids', nargs='*', type=int, metavar='PATCH_ID',
+            help='patches to index (default: all unindexed patches)')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='re-index patches which are already indexed')
+        parser.add_argument(
+            '--processes', type=int, default=multiprocessing.cpu_count(),
+            help='number of processes used to index diffs (default: '
+            '%(default)s)')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='number of patches fetched and indexed per transaction '
+            '(default: %(default)s)')
+
+    def handle(self, *args, **options):
+        patches = Patch.objects.filter(diff__isnull=False)
+        if options['patch_ids']:
+            patches = patches.filter(id__in=options['patch_ids'])
+        elif not options['all']:
+            patches = patches.exclude(
+                id__in=self.model.objects.values('patch_id'))
+
+        ids = list(patches.order_by('id').values_list('id', flat=True))
+        count = len(ids)
+        batch_size = options['batch_size']
+
+        pool = None
+        if options['processes'] > 1:
+            # forked workers must not share the database connection; they
+            # only index diffs, so never need one of their own
+            connection.close()
+            pool = multiprocessing.Pool(options['processes'])
+            map_fn = pool.imap
+        else:
+            map_fn = map
+
+        try:
+            for start in range(0, count, batch_size):
+                batch = ids[start:start + batch_size]
+                # fetch the batch up front: the pool feeds workers from
+                # another thread, which can't use this thread's connection.
+                # Diffs are read through instances, so that those in the
+                # blob store are loaded
+                items = [(self.index_diff, patch.id, patch.diff) for patch in
+                         Patch.objects.filter(id__in=batch).only('diff')]
+                entries = []
+                for patch_id, result in map_fn(_index, items):
+                    entries.extend(self.entries(patch_id, result))
+
+                with transaction.atomic():
+                    self.model.objects.filter(patch_id__in=batch).delete()
+                    self.model.objects.bulk_create(entries)
+
+                self.stdout.write('%06d/%06d\r' % (start + len(batch), count),
+                                  ending='')
+                self.stdout.flush()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        self.stdout.write('\ndone')
@@ -0,0 +1,246 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from __future__ import absolute_import
+
+from collections import deque
+import datetime
+import json
+import logging
+from logging.handlers import RotatingFileHandler
+import random
+import threading
+from timeit import default_timer
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import base as template_base
+
+from patchwork import routers
+
+LOGGER = logging.getLogger('patchwork.profiling')
+
+# the most recent request profiles, newest last
+_profiles = deque(maxlen=1)
+_profiles_lock = threading.Lock()
+
+# per-thread template render timing of the request being profiled
+_local = threading.local()
+
+
+def get_profiles():
+    """Return the recorded request profiles, newest first."""
+    with _profiles_lock:
+        return list(reversed(_profiles))
+
+
+def clear_profiles():
+    with _profiles_lock:
+        _profiles.clear()
+
+
+def _sample_rate(view_name):
+    rates = settings.PROFILING_SAMPLE_RATES
+    return rates.get(view_name, rates.get('*', 0.0))
+
+
+def _instrument_templates():
+    """Wrap template rendering to record the time spent rendering.
+
+    Only the outermost render is timed, so included and extended
+    templates aren't counted twice.
+    """
+    if getattr(template_base.Template.render, 'profiled', False):
+        return
+
+    render = template_base.Template.render
+
+    def profiled_render(self, context):
+        if getattr(_local, 'template_time', None) is None or \
+                getattr(_local, 'depth', 0):
+            return render(self, context)
+
+        _local.depth = 1
+        start = default_timer()
+        try:
+            return render(self, context)
+        finally:
+            _local.template_time += default_timer() - start
+            _local.depth = 0
+
+    profiled_render.profiled = True
+    template_base.Template.render = profiled_render
+
+
+def _queries_since(log, last):
+    """Return the queries in a query log recorded after ``last``.
+
+    The log is bounded, and drops its oldest queries once full, so
+    positions in it aren't stable. Instead, the queries are found by the
+    last one recorded before them, if any. If it has since been dropped,
+    every query in the log is new.
+    """
+    queries = list(log)
+    if last is None:
+        return queries
+
+    for i in range(len(queries) - 1, -1, -1):
+        if queries[i] is last:
+            return queries[i + 1:]
+    return queries
+
+
+class ProfilingMiddleware(object):
+    """Record the time taken by, and SQL issued for, sampled requests.
+
+    Requests are sampled by URL name according to PROFILING_SAMPLE_RATES.
+    For each sampled request the total time, the number of SQL queries
+    made on any database and the time spent in them, the template render
+    time and the slowest queries are recorded in an in-memory ring buffer,
+    viewable by staff at the 'profiling' URL, and logged to the
+    'patchwork.profiling' logger.
+    """
+
+    def __init__(self):
+        global _profiles
+
+        if not settings.ENABLE_PROFILING:
+            raise MiddlewareNotUsed()
+
+        with _profiles_lock:
+            _profiles = deque(_profiles,
+                              maxlen=settings.PROFILING_BUFFER_SIZE)
+
+        if settings.PROFILING_LOG_FILE and not LOGGER.handlers:
+            handler = RotatingFileHandler(
+                settings.PROFILING_LOG_FILE,
+                maxBytes=settings.PROFILING_LOG_MAX_BYTES, backupCount=5)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            LOGGER.addHandler(handler)
+            LOGGER.setLevel(logging.INFO)
+
+        _instrument_templates()
+
+    def process_request(self, request):
+        request._profile_start = default_timer()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        view_name = match.url_name if match else None
+        if not view_name or random.random() >= _sample_rate(view_name):
+            return None
+
+        # queries are only recorded by the debug cursor, which is enabled
+        # for every database, so that reads sent to replicas are included
+        databases = {}
+        for conn in connections.all():
+            log = conn.queries_log
+            databases[conn.alias] = {
+                'force_debug_cursor': conn.force_debug_cursor,
+                'last_query': log[-1] if log else None,
+            }
+            conn.force_debug_cursor = True
+        request._profile = {
+            'view': view_name,
+            'databases': databases,
+        }
+        _local.template_time = 0.0
+        _local.depth = 0
+
+    def process_response(self, request, response):
+        profile = getattr(request, '_profile', None)
+        if profile is None:
+            return response
+
+        elapsed = default_timer() - request._profile_start
+        template_time = _local.template_time
+        _local.template_time = None
+
+        queries = []
+        for conn in connections.all():
+            state = profile['databases'].get(conn.alias)
+            if state is None:
+                continue
+
+            conn.force_debug_cursor = state['force_debug_cursor']
+            queries.extend(
+                {'db': conn.alias, 'sql': q['sql'], 'time': float(q['time'])}
+                for q in _queries_since(conn.queries_log,
+                                        state['last_query']))
+
+            # the query log is bounded, and queries may no longer be
+            # recorded; empty it so it can't fill up
+            if not conn.queries_logged:
+                conn.queries_log.clear()
+        queries.sort(key=lambda q: q['time'], reverse=True)
+
+        record = {
+            'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'view': profile['view'],
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'time': round(elapsed * 1000, 3),
+            'sql_count': len(queries),
+            'sql_time': round(sum(q['time'] for q in queries) * 1000, 3),
+            'template_time': round(template_time * 1000, 3),
+            'slowest_queries': [
+                {'db': q['db'], 'sql': q['sql'],
+                 'time': round(q['time'] * 1000, 3)}
+                for q in queries[:settings.PROFILING_SLOWEST_QUERIES]],
+        }
+
+        with _profiles_lock:
+            _profiles.append(record)
+        LOGGER.info(json.dumps(record, sort_keys=True))
+
+        return response
+
+
+class ReplicaMiddleware(object):
+    """Serve read-only requests from a database replica.
+
+    GET and HEAD requests are served from a replica, unless the view is
+    marked with patchwork.routers.use_primary or the client is pinned to
+    the primary. Any other request pins the client to the primary, unless
+    the view sets ``request.replica_read_only``. See patchwork.routers.
+    """
+
+    def __init__(self):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+
+    def process_request(self, request):
+        routers.set_replica(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in ('GET', 'HEAD') and \
+                not routers.is_pinned(request) and \
+                not getattr(view_func, 'use_primary', False):
+            routers.set_replica(routers.choose_replica())
+
+    def process_response(self, request, response):
+        routers.set_replica(None)
+
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and \
+                not getattr(request, 'replica_read_only', False):
+            routers.pin(response)
+
+        return response
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('patchwork', '0012_add_coverletter_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIToken',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('name', models.CharField(max_length=100, blank=True)),
+                ('prefix', models.CharField(max_length=8, db_index=True)),
+                ('digest', models.CharField(max_length=64)),
+                ('date', models.DateTimeField(default=datetime.datetime.now)),
+                ('user', models.ForeignKey(related_name='api_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
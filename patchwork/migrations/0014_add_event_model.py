@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('patchwork', '0013_add_api_token_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('category', models.CharField(max_length=20, choices=[('patch-created', 'Patch created'), ('patch-state-changed', 'Patch state changed'), ('patch-delegated', 'Patch delegated'), ('patch-archived', 'Patch archived'), ('patch-unarchived', 'Patch unarchived'), ('comment-created', 'Comment created'), ('check-created', 'Check created')])),
+                ('date', models.DateTimeField(default=datetime.datetime.now, db_index=True)),
+                ('comment', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='patchwork.Comment', null=True)),
+                ('created_check', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='patchwork.Check', null=True)),
+                ('current_delegate', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, null=True)),
+                ('current_state', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='patchwork.State', null=True)),
+                ('previous_delegate', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, null=True)),
+                ('previous_state', models.ForeignKey(related_name='+', on_delete=django.db.models.deletion.SET_NULL, to='patchwork.State', null=True)),
+                ('project', models.ForeignKey(related_name='+', to='patchwork.Project')),
+                ('submission', models.ForeignKey(related_name='+', to='patchwork.Submission')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('project', 'id')]),
+        ),
+    ]
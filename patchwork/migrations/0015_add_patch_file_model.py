@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0014_add_event_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatchFile',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('path', models.CharField(max_length=255, db_index=True)),
+                ('change_type', models.CharField(max_length=1, choices=[('A', 'added'), ('D', 'deleted'), ('M', 'modified'), ('R', 'renamed')])),
+                ('lines_added', models.PositiveIntegerField(default=0)),
+                ('lines_removed', models.PositiveIntegerField(default=0)),
+                ('patch', models.ForeignKey(related_name='files', to='patchwork.Patch')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
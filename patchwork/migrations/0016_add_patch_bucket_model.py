@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0015_add_patch_file_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatchBucket',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('bucket', models.BigIntegerField(db_index=True)),
+                ('patch', models.ForeignKey(related_name='buckets', to='patchwork.Patch')),
+            ],
+        ),
+    ]
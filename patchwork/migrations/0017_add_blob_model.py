@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import patchwork.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0016_add_patch_bucket_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('digest', models.CharField(max_length=64, serialize=False, primary_key=True)),
+                ('data', models.TextField()),
+            ],
+        ),
+        # existing values are moved to the blob store by the dedupeblobs
+        # management command, rather than here
+        migrations.AlterField(
+            model_name='comment',
+            name='content',
+            field=patchwork.fields.BlobField(null=True, blank=True),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='content',
+            field=patchwork.fields.BlobField(null=True, blank=True),
+        ),
+        migrations.AlterField(
+            model_name='patch',
+            name='diff',
+            field=patchwork.fields.BlobField(null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import patchwork.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0017_add_blob_model'),
+    ]
+
+    # existing values are compressed by the compresstext management
+    # command, rather than here
+    operations = [
+        migrations.AlterField(
+            model_name='blob',
+            name='data',
+            field=patchwork.fields.CompressedTextField(dictionary='diff'),
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='headers',
+            field=patchwork.fields.CompressedTextField(blank=True, dictionary='headers'),
+        ),
+        migrations.AlterField(
+            model_name='submission',
+            name='headers',
+            field=patchwork.fields.CompressedTextField(blank=True, dictionary='headers'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0018_compress_text_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ColdValue',
+            fields=[
+                ('digest', models.CharField(max_length=64, serialize=False, primary_key=True)),
+                ('data', models.TextField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import patchwork.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0019_add_coldvalue_model'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='submission',
+            index_together=set([('project', 'date')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='patch',
+            index_together=set([('archived', 'state'), ('delegate', 'archived', 'state')]),
+        ),
+        migrations.AlterField(
+            model_name='patch',
+            name='hash',
+            field=patchwork.fields.HashField(db_index=True, max_length=40, null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from patchwork.models import normalize_email
+
+
+def set_email_keys(apps, schema_editor):
+    # keys are computed in Python, as SQL's LOWER() may lowercase
+    # non-ASCII characters differently to str.lower(), or not at all
+    Person = apps.get_model('patchwork', 'Person')
+    people = Person.objects.values_list('id', 'email').order_by('id')
+    for person_id, email in people.iterator():
+        Person.objects.filter(id=person_id).update(
+            email_key=normalize_email(email))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0020_add_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='person',
+            name='email_key',
+            field=models.CharField(default='', max_length=255, editable=False, db_index=True),
+            preserve_default=False,
+        ),
+        migrations.RunPython(set_email_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import patchwork.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0021_add_person_email_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='list_generation',
+            field=models.PositiveIntegerField(default=patchwork.models.initial_list_generation, editable=False),
+        ),
+    ]
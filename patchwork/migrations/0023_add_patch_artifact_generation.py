@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import patchwork.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0022_add_project_list_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patch',
+            name='artifact_generation',
+            field=models.PositiveIntegerField(default=patchwork.models.new_artifact_generation, editable=False),
+        ),
+    ]
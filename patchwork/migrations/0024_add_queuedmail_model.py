@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0023_add_patch_artifact_generation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueuedMail',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('message', models.TextField()),
+                ('date', models.DateTimeField(default=datetime.datetime.now)),
+                ('status', models.SmallIntegerField(default=0, choices=[(0, 'queued'), (1, 'dead')])),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(default=datetime.datetime.now)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Queued mail',
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='queuedmail',
+            index_together=set([('status', 'next_attempt')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0024_add_queuedmail_model'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledJob',
+            fields=[
+                ('name', models.CharField(max_length=50, serialize=False, primary_key=True)),
+                ('next_run', models.DateTimeField(default=datetime.datetime.now)),
+                ('locked_until', models.DateTimeField(null=True, blank=True)),
+                ('last_run', models.DateTimeField(null=True, blank=True)),
+                ('last_duration', models.FloatField(null=True, blank=True)),
+                ('last_succeeded', models.NullBooleanField()),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
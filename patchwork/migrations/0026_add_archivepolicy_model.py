@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0025_add_scheduledjob_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patch',
+            name='last_updated',
+            field=models.DateTimeField(default=datetime.datetime.now, editable=False),
+        ),
+        # patches were last known to be updated when they were submitted
+        migrations.RunSQL(
+            'UPDATE patchwork_patch SET last_updated = '
+            '(SELECT date FROM patchwork_submission '
+            'WHERE patchwork_submission.id = '
+            'patchwork_patch.submission_ptr_id)',
+            migrations.RunSQL.noop),
+        migrations.CreateModel(
+            name='ArchivePolicy',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('days', models.PositiveIntegerField(help_text='Archive patches which have not been updated or commented on for this many days.')),
+                ('project', models.ForeignKey(related_name='archive_policies', to='patchwork.Project')),
+                ('states', models.ManyToManyField(help_text='Only archive patches in these states, or in any state if none are selected.', to='patchwork.State', blank=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Archive policies',
+            },
+        ),
+    ]
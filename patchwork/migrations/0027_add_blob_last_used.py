@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0026_add_archivepolicy_model'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='last_used',
+            field=models.DateTimeField(default=datetime.datetime.now),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Q
+
+# see patchwork.fields.COLD_PREFIX
+COLD_PREFIX = '\x01cold:sha256:'
+
+
+def mark_cold_patches(apps, schema_editor):
+    Patch = apps.get_model('patchwork', 'Patch')
+    Patch.objects.filter(
+        Q(headers__startswith=COLD_PREFIX) |
+        Q(content__startswith=COLD_PREFIX) |
+        Q(diff__startswith=COLD_PREFIX)).update(cold=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0027_add_blob_last_used'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patch',
+            name='cold',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AlterIndexTogether(
+            name='patch',
+            index_together=set([('archived', 'state'), ('delegate', 'archived', 'state'), ('archived', 'cold')]),
+        ),
+        migrations.RunPython(mark_cold_patches, migrations.RunPython.noop),
+    ]
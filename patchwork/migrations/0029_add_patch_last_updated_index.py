@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0028_add_patch_cold'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='patch',
+            index_together=set([('archived', 'state'), ('delegate', 'archived', 'state'), ('archived', 'cold'), ('archived', 'last_updated')]),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patchwork', '0029_add_patch_last_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coldvalue',
+            name='created',
+            field=models.DateTimeField(default=datetime.datetime.now),
+        ),
+    ]
@@ -22,20 +22,38 @@ from __future__ import absolute_import
 
 from collections import Counter, OrderedDict
 import datetime
+import hashlib
 import random
 import re
+import time
 
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core.signals import request_started
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.utils.crypto import constant_time_compare, get_random_string
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.functional import cached_property
 from django.utils.six.moves import filter
 
-from patchwork.fields import HashField
-from patchwork.parser import extract_tags, hash_patch
+from patchwork import instrumentation
+from patchwork import notify
+from patchwork import similarity
+from patchwork.compat import on_commit
+from patchwork.fields import BlobField, CompressedTextField, HashField, \
+    clear_batches
+from patchwork.parser import extract_tags, hash_patch, patch_get_file_stats
+
+
+def normalize_email(email):
+    """Return the form of an email address used for lookups.
+
+    Addresses are compared case-insensitively, so are looked up by their
+    lowercase form.
+    """
+    return email.strip().lower()
 
 
 @python_2_unicode_compatible
@@ -43,14 +61,35 @@ class Person(models.Model):
     # properties
 
     email = models.CharField(max_length=255, unique=True)
+    # the normalized email, which people are looked up by. This isn't
+    # unique, as older databases may hold addresses differing only in case
+    email_key = models.CharField(max_length=255, db_index=True,
+                                 editable=False)
     name = models.CharField(max_length=255, null=True, blank=True)
     user = models.ForeignKey(User, null=True, blank=True,
                              on_delete=models.SET_NULL)
 
+    @classmethod
+    def find(cls, email, **kwargs):
+        """Return the person with an email address, or None.
+
+        Addresses are compared case-insensitively. Where several people
+        have the address in different cases, the first created is
+        returned. Additional keyword arguments filter the people
+        considered.
+        """
+        return cls.objects.filter(
+            email_key=normalize_email(email), **kwargs).select_related(
+                'user').order_by('id').first()
+
     def link_to_user(self, user):
         self.name = user.profile.name()
         self.user = user
 
+    def save(self, *args, **kwargs):
+        self.email_key = normalize_email(self.email)
+        super(Person, self).save(*args, **kwargs)
+
     def __str__(self):
         if self.name:
             return '%s <%s>' % (self.name, self.email)
@@ -61,6 +100,13 @@ class Person(models.Model):
         verbose_name_plural = 'People'
 
 
+def initial_list_generation():
+    # generations start at a random value, so that pages cached for a
+    # project whose creation was rolled back, or which was restored from a
+    # backup, can't be mistaken for those of its successor
+    return random.randint(0, 2 ** 30)
+
+
 @python_2_unicode_compatible
 class Project(models.Model):
     # properties
@@ -81,6 +127,11 @@ class Project(models.Model):
     send_notifications = models.BooleanField(default=False)
     use_tags = models.BooleanField(default=True)
 
+    # incremented whenever the project's patch list changes, invalidating
+    # cached list pages. See patchwork.pagecache
+    list_generation = models.PositiveIntegerField(
+        default=initial_list_generation, editable=False)
+
     def is_editable(self, user):
         if not user.is_authenticated():
             return False
@@ -92,6 +143,17 @@ class Project(models.Model):
             return []
         return list(Tag.objects.all())
 
+    def save(self, *args, **kwargs):
+        # the list generation is only ever incremented in the database, and
+        # mustn't be overwritten by a stale copy, which would make stale
+        # cached pages current again
+        if self.pk is not None:
+            generation = Project.objects.filter(pk=self.pk).values_list(
+                'list_generation', flat=True).first()
+            if generation is not None:
+                self.list_generation = generation
+        super(Project, self).save(*args, **kwargs)
+
     def __str__(self):
         return self.name
 
@@ -114,6 +176,41 @@ class DelegationRule(models.Model):
         unique_together = (('path', 'project'))
 
 
+@python_2_unicode_compatible
+class ArchivePolicy(models.Model):
+    """Archive a project's patches once they haven't changed for a while.
+
+    Policies are applied by the 'archive' periodic job.
+    """
+    project = models.ForeignKey(Project, related_name='archive_policies')
+    states = models.ManyToManyField(
+        'State', blank=True,
+        help_text='Only archive patches in these states, or in any state '
+        'if none are selected.')
+    days = models.PositiveIntegerField(
+        help_text='Archive patches which have not been updated or '
+        'commented on for this many days.')
+
+    def stale_patches(self):
+        """Return the unarchived patches this policy archives."""
+        date_limit = datetime.datetime.now() - datetime.timedelta(
+            days=self.days)
+        patches = Patch.objects.filter(project=self.project_id,
+                                       archived=False,
+                                       last_updated__lt=date_limit)
+
+        states = [state.id for state in self.states.all()]
+        if states:
+            patches = patches.filter(state__in=states)
+        return patches
+
+    def __str__(self):
+        return 'Archive after %d days' % self.days
+
+    class Meta:
+        verbose_name_plural = 'Archive policies'
+
+
 @python_2_unicode_compatible
 class UserProfile(models.Model):
     user = models.OneToOneField(User, unique=True, related_name='profile')
@@ -222,8 +319,30 @@ class PatchTag(models.Model):
         unique_together = [('patch', 'tag')]
 
 
+# the default state and when it expires from this process's cache. It is
+# cleared whenever a State is saved or deleted, but other processes only
+# see the change once their copy expires
+_default_initial_patch_state = (None, 0)
+
+
 def get_default_initial_patch_state():
-    return State.objects.get(ordering=0)
+    global _default_initial_patch_state
+
+    state, expiry = _default_initial_patch_state
+    now = time.time()
+    if state is None or expiry <= now:
+        state = State.objects.get(ordering=0)
+        _default_initial_patch_state = (
+            state, now + settings.DEFAULT_STATE_CACHE_TIMEOUT)
+    return state
+
+
+def _state_change_callback(sender, **kwargs):
+    global _default_initial_patch_state
+    _default_initial_patch_state = (None, 0)
+
+models.signals.post_save.connect(_state_change_callback, sender=State)
+models.signals.post_delete.connect(_state_change_callback, sender=State)
 
 
 class PatchQuerySet(models.query.QuerySet):
@@ -261,18 +380,44 @@ class PatchManager(models.Manager):
         return self.get_queryset().with_tag_counts(project)
 
 
+class Blob(models.Model):
+    """A text value in the content-addressed blob store.
+
+    See patchwork.fields.BlobField.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = CompressedTextField(dictionary='diff')
+    # when the blob was last stored, so that blobs which have just been
+    # referenced again aren't purged. See the dedupeblobs command
+    last_used = models.DateTimeField(default=datetime.datetime.now)
+
+
+class ColdValue(models.Model):
+    """A column value of an old archived patch, moved out of the hot tables.
+
+    Values are stored exactly as they were stored in the column, keyed by
+    their SHA-256 digest. This table lives in the COLD_STORAGE_DATABASE.
+    See the coldstorage management command.
+    """
+    digest = models.CharField(max_length=64, primary_key=True)
+    data = models.TextField()
+    # when the value was stored, so that values which a running move hasn't
+    # referenced yet aren't purged. Reused values are stored again
+    created = models.DateTimeField(default=datetime.datetime.now)
+
+
 class EmailMixin(models.Model):
     """Mixin for models with an email-origin."""
     # email metadata
 
     msgid = models.CharField(max_length=255)
     date = models.DateTimeField(default=datetime.datetime.now)
-    headers = models.TextField(blank=True)
+    headers = CompressedTextField(blank=True, dictionary='headers')
 
     # content
 
     submitter = models.ForeignKey(Person)
-    content = models.TextField(null=True, blank=True)
+    content = BlobField(null=True, blank=True)
 
     response_re = re.compile(
         r'^(Tested|Reviewed|Acked|Signed-off|Nacked|Reported)-by: .*$',
@@ -313,17 +458,26 @@ class Submission(EmailMixin, models.Model):
     class Meta:
         ordering = ['date']
         unique_together = [('msgid', 'project')]
+        # patch lists
+        index_together = [['project', 'date']]
 
 
 class CoverLetter(Submission):
     pass
 
 
+def new_artifact_generation():
+    # a new random generation, rather than an incremented one, can't
+    # coincide with the generation of an earlier version of the patch,
+    # even if a stale copy of the patch is saved
+    return random.randint(0, 2 ** 30)
+
+
 @python_2_unicode_compatible
 class Patch(Submission):
     # patch metadata
 
-    diff = models.TextField(null=True, blank=True)
+    diff = BlobField(null=True, blank=True)
     commit_ref = models.CharField(max_length=255, null=True, blank=True)
     pull_url = models.CharField(max_length=255, null=True, blank=True)
     tags = models.ManyToManyField(Tag, through=PatchTag)
@@ -333,7 +487,18 @@ class Patch(Submission):
     delegate = models.ForeignKey(User, blank=True, null=True)
     state = models.ForeignKey(State, null=True)
     archived = models.BooleanField(default=False)
-    hash = HashField(null=True, blank=True)
+    hash = HashField(null=True, blank=True, db_index=True)
+
+    # changes whenever the patch or its comments change, outdating the
+    # raw diff and mbox files cached on disk
+    artifact_generation = models.PositiveIntegerField(
+        default=new_artifact_generation, editable=False)
+    # the last time the patch or its comments changed
+    last_updated = models.DateTimeField(default=datetime.datetime.now,
+                                        editable=False)
+    # whether the patch has been moved to cold storage. See the
+    # coldstorage management command
+    cold = models.BooleanField(default=False, editable=False)
 
     objects = PatchManager()
 
@@ -360,15 +525,60 @@ class Patch(Submission):
             self._set_tag(tag, counter[tag])
 
     def save(self):
-        if not hasattr(self, 'state') or not self.state:
+        if self.state_id is None:
             self.state = get_default_initial_patch_state()
 
         if self.hash is None and self.diff is not None:
             self.hash = hash_patch(self.diff).hexdigest()
 
+        created = self.pk is None
+        self.artifact_generation = new_artifact_generation()
+        self.last_updated = datetime.datetime.now()
+
         super(Patch, self).save()
 
-        self.refresh_tag_counts()
+        if created:
+            with instrumentation.stage('refresh_files'):
+                self.refresh_files()
+            with instrumentation.stage('refresh_buckets'):
+                self.refresh_buckets()
+
+        # the saved state is now the state as loaded from the database
+        self._orig_state_id = self.state_id
+        self._orig_delegate_id = self.delegate_id
+        self._orig_archived = self.archived
+
+        with instrumentation.stage('refresh_tags'):
+            self.refresh_tag_counts()
+
+    def refresh_files(self):
+        """Rebuild the index of files touched by the diff."""
+        self.files.all().delete()
+        if self.diff:
+            PatchFile.objects.bulk_create(
+                PatchFile.from_stats(self.id, patch_get_file_stats(self.diff)))
+
+    def refresh_buckets(self):
+        """Rebuild the near-duplicate index entries of the diff."""
+        self.buckets.all().delete()
+        if self.diff:
+            PatchBucket.objects.bulk_create(PatchBucket.from_buckets(
+                self.id, similarity.diff_buckets(self.diff)))
+
+    def similar_patches(self, max_count=10):
+        """Return patches likely to be earlier revisions of this one.
+
+        These are the earlier patches in the project whose diffs share at
+        least one bucket with this patch's, most similar first. Only their
+        names and dates are loaded, which also keeps the bulky columns out
+        of the GROUP BY clause.
+        """
+        return Patch.objects.filter(
+            project_id=self.project_id, date__lt=self.date,
+            buckets__bucket__in=self.buckets.values('bucket')).only(
+                'name', 'date').annotate(
+                    shared_buckets=models.Count('buckets')).order_by(
+                        '-shared_buckets', '-date')[:max_count]
 
     def is_editable(self, user):
         if not user.is_authenticated():
@@ -379,11 +589,15 @@ class Patch(Submission):
 
         return self.project.is_editable(user)
 
-    def filename(self):
+    @staticmethod
+    def filename_for_name(name):
         fname_re = re.compile(r'[^-_A-Za-z0-9\.]+')
-        str = fname_re.sub('-', self.name)
+        str = fname_re.sub('-', name)
         return str.strip('-') + '.patch'
 
+    def filename(self):
+        return self.filename_for_name(self.name)
+
     @property
     def combined_check_state(self):
         """Return the combined state for all checks.
@@ -463,6 +677,66 @@ class Patch(Submission):
 
     class Meta:
         verbose_name_plural = 'Patches'
+        # patch lists, todo lists, cold storage and archive policies,
+        # respectively
+        index_together = [['archived', 'state'],
+                          ['delegate', 'archived', 'state'],
+                          ['archived', 'cold'],
+                          ['archived', 'last_updated']]
+
+
+@python_2_unicode_compatible
+class PatchFile(models.Model):
+    """A file touched by a patch.
+
+    This allows patches to be found by path without fetching their diffs.
+    """
+    CHANGE_ADDED = 'A'
+    CHANGE_DELETED = 'D'
+    CHANGE_MODIFIED = 'M'
+    CHANGE_RENAMED = 'R'
+    CHANGE_CHOICES = (
+        (CHANGE_ADDED, 'added'),
+        (CHANGE_DELETED, 'deleted'),
+        (CHANGE_MODIFIED, 'modified'),
+        (CHANGE_RENAMED, 'renamed'),
+    )
+
+    patch = models.ForeignKey(Patch, related_name='files')
+    path = models.CharField(max_length=255, db_index=True)
+    change_type = models.CharField(max_length=1, choices=CHANGE_CHOICES)
+    lines_added = models.PositiveIntegerField(default=0)
+    lines_removed = models.PositiveIntegerField(default=0)
+
+    @staticmethod
+    def from_stats(patch_id, stats):
+        """Create (unsaved) PatchFiles from patch_get_file_stats output."""
+        return [PatchFile(patch_id=patch_id, path=path[:255],
+                          change_type=change_type, lines_added=added,
+                          lines_removed=removed)
+                for path, change_type, added, removed in stats]
+
+    def __str__(self):
+        return self.path
+
+    class Meta:
+        ordering = ['id']
+
+
+class PatchBucket(models.Model):
+    """A locality-sensitive hash bucket of a patch's diff.
+
+    Patches with similar diffs are likely to share buckets; see
+    patchwork.similarity.
+    """
+    patch = models.ForeignKey(Patch, related_name='buckets')
+    bucket = models.BigIntegerField(db_index=True)
+
+    @staticmethod
+    def from_buckets(patch_id, buckets):
+        """Create (unsaved) PatchBuckets from diff_buckets output."""
+        return [PatchBucket(patch_id=patch_id, bucket=bucket)
+                for bucket in buckets]
 
 
 class Comment(EmailMixin, models.Model):
@@ -473,7 +747,8 @@ class Comment(EmailMixin, models.Model):
 
     def save(self, *args, **kwargs):
         super(Comment, self).save(*args, **kwargs)
-        self.submission.refresh_tag_counts()
+        with instrumentation.stage('refresh_tags'):
+            self.submission.refresh_tag_counts()
 
     def delete(self, *args, **kwargs):
         super(Comment, self).delete(*args, **kwargs)
@@ -622,25 +897,253 @@ class EmailConfirmation(models.Model):
         super(EmailConfirmation, self).save()
 
 
+@python_2_unicode_compatible
+class QueuedMail(models.Model):
+    """An outgoing email, waiting to be delivered.
+
+    Mail is queued by patchwork.mailqueue.QueueBackend and delivered by the
+    sendqueuedmail management command, which deletes it once delivered.
+    Mail that can't be delivered after MAIL_QUEUE_MAX_ATTEMPTS attempts is
+    kept as dead, for an administrator to inspect and requeue.
+    """
+    STATUS_QUEUED = 0
+    STATUS_DEAD = 1
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, 'queued'),
+        (STATUS_DEAD, 'dead'),
+    )
+
+    # the message, serialized as JSON
+    message = models.TextField()
+    date = models.DateTimeField(default=datetime.datetime.now)
+    status = models.SmallIntegerField(choices=STATUS_CHOICES,
+                                      default=STATUS_QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=datetime.datetime.now)
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return 'Mail %d (%s)' % (self.id, self.get_status_display())
+
+    class Meta:
+        verbose_name_plural = 'Queued mail'
+        index_together = [['status', 'next_attempt']]
+
+
+@python_2_unicode_compatible
+class ScheduledJob(models.Model):
+    """The schedule and last outcome of a periodic job.
+
+    Jobs are registered in patchwork.scheduler. A scheduler runs a job by
+    first locking its row until locked_until, so that a job is never run
+    by two schedulers at once.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    next_run = models.DateTimeField(default=datetime.datetime.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_run = models.DateTimeField(null=True, blank=True)
+    # the duration of the last run, in seconds
+    last_duration = models.FloatField(null=True, blank=True)
+    last_succeeded = models.NullBooleanField()
+    last_error = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        ordering = ['name']
+
+
 @python_2_unicode_compatible
 class EmailOptout(models.Model):
     email = models.CharField(max_length=200, primary_key=True)
 
     @classmethod
     def is_optout(cls, email):
-        email = email.lower().strip()
-        return cls.objects.filter(email=email).count() > 0
+        return cls.objects.filter(email=normalize_email(email)).exists()
 
     def __str__(self):
         return self.email
 
 
+@python_2_unicode_compatible
+class APIToken(models.Model):
+    """A token authenticating a user to the XML-RPC interface.
+
+    Only a hash of the token is stored. Tokens are looked up by their
+    first few characters, which aren't secret, then verified by comparing
+    hashes in constant time.
+    """
+    prefix_length = 8
+
+    user = models.ForeignKey(User, related_name='api_tokens')
+    name = models.CharField(max_length=100, blank=True)
+    prefix = models.CharField(max_length=prefix_length, db_index=True)
+    digest = models.CharField(max_length=64)
+    date = models.DateTimeField(default=datetime.datetime.now)
+
+    @staticmethod
+    def hash_token(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def generate(cls, user, name=''):
+        """Create a new token for a user, returning the token itself."""
+        token = get_random_string(40)
+        cls.objects.create(user=user, name=name,
+                           prefix=token[:cls.prefix_length],
+                           digest=cls.hash_token(token))
+        return token
+
+    @classmethod
+    def authenticate(cls, token):
+        """Return the active user a token belongs to, or None."""
+        digest = cls.hash_token(token)
+        tokens = cls.objects.filter(prefix=token[:cls.prefix_length])\
+            .select_related('user')
+        for api_token in tokens:
+            if constant_time_compare(api_token.digest, digest) and \
+                    api_token.user.is_active:
+                return api_token.user
+        return None
+
+    def __str__(self):
+        return '%s...' % self.prefix
+
+
+@python_2_unicode_compatible
+class Event(models.Model):
+    """An entry in the log of changes to patches.
+
+    Events are only ever appended, so the auto-incrementing ID doubles as
+    a sequence number: clients poll for events with an ID greater than
+    the last one they saw, and the cost of doing so depends on the number
+    of new events rather than the size of the project.
+
+    IDs are handed out when an event is inserted but only become visible
+    once its transaction commits, so an event can become visible after
+    one with a higher ID. Events are therefore only listed once they are
+    older than ``settings.EVENT_COMMIT_LAG``, by which point any event
+    with a lower ID is assumed to have committed. This is a guess: the
+    date is set when the event is created, so events recorded by a
+    transaction which stays open for longer than that can still be
+    missed by clients which have moved past their IDs.
+    """
+    CATEGORY_PATCH_CREATED = 'patch-created'
+    CATEGORY_PATCH_STATE_CHANGED = 'patch-state-changed'
+    CATEGORY_PATCH_DELEGATED = 'patch-delegated'
+    CATEGORY_PATCH_ARCHIVED = 'patch-archived'
+    CATEGORY_PATCH_UNARCHIVED = 'patch-unarchived'
+    CATEGORY_COMMENT_CREATED = 'comment-created'
+    CATEGORY_CHECK_CREATED = 'check-created'
+    CATEGORY_CHOICES = (
+        (CATEGORY_PATCH_CREATED, 'Patch created'),
+        (CATEGORY_PATCH_STATE_CHANGED, 'Patch state changed'),
+        (CATEGORY_PATCH_DELEGATED, 'Patch delegated'),
+        (CATEGORY_PATCH_ARCHIVED, 'Patch archived'),
+        (CATEGORY_PATCH_UNARCHIVED, 'Patch unarchived'),
+        (CATEGORY_COMMENT_CREATED, 'Comment created'),
+        (CATEGORY_CHECK_CREATED, 'Check created'),
+    )
+
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
+    project = models.ForeignKey(Project, related_name='+')
+    submission = models.ForeignKey(Submission, related_name='+')
+    date = models.DateTimeField(default=datetime.datetime.now, db_index=True)
+
+    previous_state = models.ForeignKey(State, related_name='+', null=True,
+                                       on_delete=models.SET_NULL)
+    current_state = models.ForeignKey(State, related_name='+', null=True,
+                                      on_delete=models.SET_NULL)
+    previous_delegate = models.ForeignKey(User, related_name='+', null=True,
+                                          on_delete=models.SET_NULL)
+    current_delegate = models.ForeignKey(User, related_name='+', null=True,
+                                         on_delete=models.SET_NULL)
+    comment = models.ForeignKey(Comment, related_name='+', null=True,
+                                on_delete=models.SET_NULL)
+    created_check = models.ForeignKey(Check, related_name='+', null=True,
+                                      on_delete=models.SET_NULL)
+
+    # the fields fetched by Event.values_to_dict(), allowing a page of
+    # events to be serialized from a single query
+    VALUES = ('id', 'category', 'project_id', 'project__linkname',
+              'submission_id', 'date', 'previous_state__name',
+              'current_state__name', 'previous_delegate__username',
+              'current_delegate__username', 'comment_id', 'created_check_id')
+
+    @staticmethod
+    def values_to_dict(values):
+        """Serialize an event fetched using ``values(*Event.VALUES)``.
+
+        None is not representable in XML-RPC, so missing values are
+        returned as empty strings or zero.
+        """
+        return {
+            'id': values['id'],
+            'category': values['category'],
+            'project': values['project__linkname'],
+            'project_id': values['project_id'],
+            'patch_id': values['submission_id'],
+            'date': values['date'].isoformat(),
+            'previous_state': values['previous_state__name'] or '',
+            'current_state': values['current_state__name'] or '',
+            'previous_delegate': values['previous_delegate__username'] or '',
+            'current_delegate': values['current_delegate__username'] or '',
+            'comment_id': values['comment_id'] or 0,
+            'check_id': values['created_check_id'] or 0,
+        }
+
+    @staticmethod
+    def commit_horizon():
+        """Return the date before which events are listed."""
+        return datetime.datetime.now() - datetime.timedelta(
+            seconds=settings.EVENT_COMMIT_LAG)
+
+    @classmethod
+    def list_since(cls, since, max_count, **filters):
+        """Return at most ``max_count`` serialized events after ``since``.
+
+        ``max_count`` is capped at ``settings.EVENT_LIST_MAX_COUNT``. The
+        list stops before the first event recorded within the last
+        ``settings.EVENT_COMMIT_LAG`` seconds, so that a client can't
+        move past an event which has yet to commit.
+        """
+        max_count = min(max_count, settings.EVENT_LIST_MAX_COUNT)
+        if max_count <= 0:
+            max_count = settings.EVENT_LIST_MAX_COUNT
+
+        horizon = cls.commit_horizon()
+        events = cls.objects.filter(id__gt=since, **filters).order_by('id')
+        result = []
+        for values in events.values(*cls.VALUES)[:max_count]:
+            if values['date'] >= horizon:
+                break
+            result.append(cls.values_to_dict(values))
+        return result
+
+    def __str__(self):
+        return '%d: %s' % (self.id, self.get_category_display())
+
+    class Meta:
+        ordering = ['id']
+        index_together = [['project', 'id']]
+
+
 class PatchChangeNotification(models.Model):
     patch = models.OneToOneField(Patch, primary_key=True)
     last_modified = models.DateTimeField(default=datetime.datetime.now)
     orig_state = models.ForeignKey(State)
 
 
+def _patch_init_callback(sender, instance, **kwargs):
+    # record the state as loaded, so _patch_change_callback and
+    # _patch_event_callback can detect changes without fetching the
+    # original patch
+    instance._orig_state_id = instance.state_id
+    instance._orig_delegate_id = instance.delegate_id
+    instance._orig_archived = instance.archived
+
+
 def _patch_change_callback(sender, instance, **kwargs):
     # we only want notification of modified patches
     if instance.pk is None:
@@ -649,31 +1152,187 @@ def _patch_change_callback(sender, instance, **kwargs):
     if instance.project is None or not instance.project.send_notifications:
         return
 
-    try:
-        orig_patch = Patch.objects.get(pk=instance.pk)
-    except Patch.DoesNotExist:
-        return
-
     # If there's no interesting changes, abort without creating the
     # notification
-    if orig_patch.state == instance.state:
+    orig_state_id = instance._orig_state_id
+    if orig_state_id == instance.state_id:
         return
 
-    notification = None
+    # notifications are keyed by patch, so concurrent changes can't both
+    # create one
     try:
-        notification = PatchChangeNotification.objects.get(patch=instance)
-    except PatchChangeNotification.DoesNotExist:
+        with transaction.atomic():
+            PatchChangeNotification.objects.create(
+                patch=instance, orig_state_id=orig_state_id)
+        return
+    except IntegrityError:
         pass
 
-    if notification is None:
-        notification = PatchChangeNotification(patch=instance,
-                                               orig_state=orig_patch.state)
-    elif notification.orig_state == instance.state:
-        # If we're back at the original state, there is no need to notify
-        notification.delete()
+    # If we're back at the original state, there is no need to notify
+    notifications = PatchChangeNotification.objects.filter(patch=instance)
+    notifications.filter(orig_state_id=instance.state_id).delete()
+    notifications.update(last_modified=datetime.datetime.now())
+
+models.signals.post_init.connect(_patch_init_callback, sender=Patch)
+models.signals.pre_save.connect(_patch_change_callback, sender=Patch)
+
+
+def _patch_event_callback(sender, instance, created, raw=False, **kwargs):
+    if raw:
         return
 
-    notification.last_modified = datetime.datetime.now()
-    notification.save()
+    event = {
+        'project_id': instance.project_id,
+        'submission_id': instance.id,
+    }
 
-models.signals.pre_save.connect(_patch_change_callback, sender=Patch)
+    if created:
+        Event.objects.create(category=Event.CATEGORY_PATCH_CREATED,
+                             current_state_id=instance.state_id,
+                             current_delegate_id=instance.delegate_id,
+                             **event)
+        return
+
+    if instance._orig_state_id != instance.state_id:
+        Event.objects.create(category=Event.CATEGORY_PATCH_STATE_CHANGED,
+                             previous_state_id=instance._orig_state_id,
+                             current_state_id=instance.state_id,
+                             **event)
+
+    if instance._orig_delegate_id != instance.delegate_id:
+        Event.objects.create(category=Event.CATEGORY_PATCH_DELEGATED,
+                             previous_delegate_id=instance._orig_delegate_id,
+                             current_delegate_id=instance.delegate_id,
+                             **event)
+
+    if instance._orig_archived != instance.archived:
+        if instance.archived:
+            category = Event.CATEGORY_PATCH_ARCHIVED
+        else:
+            category = Event.CATEGORY_PATCH_UNARCHIVED
+        Event.objects.create(category=category, **event)
+
+
+def _comment_event_callback(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+
+    Event.objects.create(category=Event.CATEGORY_COMMENT_CREATED,
+                         project_id=instance.submission.project_id,
+                         submission_id=instance.submission_id,
+                         comment=instance)
+
+
+def _check_event_callback(sender, instance, created, raw=False, **kwargs):
+    if raw or not created:
+        return
+
+    Event.objects.create(category=Event.CATEGORY_CHECK_CREATED,
+                         project_id=instance.patch.project_id,
+                         submission_id=instance.patch_id,
+                         created_check=instance)
+
+
+def _event_created_callback(sender, instance, created, raw=False, **kwargs):
+    # wake up any long-polling clients waiting on the project
+    if created and not raw:
+        notify.send(instance.project_id)
+
+models.signals.post_save.connect(_patch_event_callback, sender=Patch)
+models.signals.post_save.connect(_comment_event_callback, sender=Comment)
+models.signals.post_save.connect(_check_event_callback, sender=Check)
+models.signals.post_save.connect(_event_created_callback, sender=Event)
+
+
+class _ListChanges(object):
+    """The projects whose lists were changed by a transaction.
+
+    Projects are matched by lookups, such as the ID of a changed
+    submission, rather than fetched, as related objects may already be
+    deleted. Their list generations are bumped with a single update once
+    the transaction commits, so that the project rows aren't locked for
+    the rest of the transaction by every change made in it.
+    """
+
+    def __init__(self):
+        self.lookups = {}
+
+    def add(self, lookup, value):
+        self.lookups.setdefault(lookup, set()).add(value)
+
+    def __call__(self):
+        query = models.Q()
+        for lookup, values in self.lookups.items():
+            query |= models.Q(**{lookup + '__in': values})
+        Project.objects.filter(query).update(
+            list_generation=models.F('list_generation') + 1)
+
+
+def _list_changed(lookup, value):
+    # invalidate the cached list pages of the matching projects, adding to
+    # the changes already pending for the transaction, if any
+    connection = transaction.get_connection()
+    for sids, func in getattr(connection, 'run_on_commit', []):
+        if isinstance(func, _ListChanges):
+            func.add(lookup, value)
+            return
+
+    changes = _ListChanges()
+    changes.add(lookup, value)
+    on_commit(changes)
+
+
+def _list_change_callback(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    if sender is Patch:
+        _list_changed('id', instance.project_id)
+    elif sender is Comment:
+        _list_changed('submission__id', instance.submission_id)
+    else:
+        _list_changed('submission__id', instance.patch_id)
+
+
+def _person_list_change_callback(sender, instance, created, raw=False,
+                                 **kwargs):
+    # lists show submitters' names, but new people have no patches yet
+    if raw or created:
+        return
+
+    _list_changed('submission__submitter__id', instance.id)
+
+
+def _state_list_change_callback(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    _list_changed('submission__patch__state__id', instance.id)
+
+models.signals.post_save.connect(_list_change_callback, sender=Patch)
+models.signals.post_delete.connect(_list_change_callback, sender=Patch)
+models.signals.post_save.connect(_list_change_callback, sender=Comment)
+models.signals.post_delete.connect(_list_change_callback, sender=Comment)
+models.signals.post_save.connect(_list_change_callback, sender=Check)
+models.signals.post_delete.connect(_list_change_callback, sender=Check)
+models.signals.post_save.connect(_list_change_callback, sender=PatchTag)
+models.signals.post_delete.connect(_list_change_callback, sender=PatchTag)
+models.signals.post_save.connect(_person_list_change_callback, sender=Person)
+models.signals.post_save.connect(_state_list_change_callback, sender=State)
+
+
+def _artifact_change_callback(sender, instance, raw=False, **kwargs):
+    # outdate the cached raw diff and mbox of the patch, which include the
+    # tags given in its comments, and mark the patch as updated
+    if raw:
+        return
+
+    Patch.objects.filter(id=instance.submission_id).update(
+        artifact_generation=new_artifact_generation(),
+        last_updated=datetime.datetime.now())
+
+models.signals.post_save.connect(_artifact_change_callback, sender=Comment)
+models.signals.post_delete.connect(_artifact_change_callback, sender=Comment)
+
+# values read but never used by one request are not loaded by the next
+request_started.connect(clear_batches)
@@ -0,0 +1,162 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Wake up requests waiting for new events.
+
+On PostgreSQL, recording an event sends a notification on the
+``patchwork_events`` channel with the project ID as payload, and waiters
+sleep on the connection socket until a notification for their project
+arrives. Notifications are only delivered once the transaction that sent
+them commits. Other databases fall back to re-checking every
+LONGPOLL_POLL_INTERVAL seconds.
+
+Each waiter occupies a web server worker for the duration of its wait, so
+the number of concurrent waiters across all processes on the host is
+limited to LONGPOLL_MAX_WAITERS. Slots are lock files, which are released
+by the kernel if a worker dies.
+"""
+
+from __future__ import absolute_import
+
+import contextlib
+import errno
+import fcntl
+import os
+import select
+import tempfile
+import time
+
+from django.conf import settings
+from django.db import connection
+
+CHANNEL = 'patchwork_events'
+
+
+def _use_listen():
+    return connection.vendor == 'postgresql' and \
+        not connection.in_atomic_block
+
+
+def send(project_id):
+    """Notify waiters of a new event in the given project."""
+    if connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_notify(%s, %s)',
+                       [CHANNEL, str(project_id)])
+
+
+def _wait_listen(check, project_id, deadline):
+    connection.ensure_connection()
+    conn = connection.connection
+    with connection.cursor() as cursor:
+        cursor.execute('LISTEN %s' % CHANNEL)
+
+    try:
+        # check after listening, so no event can be missed in between
+        result = check()
+        while not result:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+
+            if not select.select([conn], [], [], remaining)[0]:
+                break
+
+            conn.poll()
+            payloads = [notify.payload for notify in conn.notifies]
+            del conn.notifies[:]
+            if project_id is None or str(project_id) in payloads:
+                result = check()
+        return result
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('UNLISTEN %s' % CHANNEL)
+        del conn.notifies[:]
+
+
+def _wait_poll(check, deadline):
+    result = check()
+    while not result:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+
+        time.sleep(min(remaining, settings.LONGPOLL_POLL_INTERVAL))
+        result = check()
+    return result
+
+
+def wait(check, project_id=None, timeout=0):
+    """Wait for new events.
+
+    Args:
+        check: A callable returning a true value once there are events
+            for the waiter.
+        project_id (int): If not None, only wake up for events in this
+            project.
+        timeout (float): The maximum number of seconds to wait.
+
+    Returns:
+        The last value returned by check.
+    """
+    deadline = time.time() + timeout
+    if _use_listen():
+        return _wait_listen(check, project_id, deadline)
+    return _wait_poll(check, deadline)
+
+
+def _lock_dir():
+    path = settings.LONGPOLL_LOCK_DIR or os.path.join(
+        tempfile.gettempdir(), 'patchwork-longpoll')
+    try:
+        os.makedirs(path)
+    except OSError as exc:
+        if exc.errno != errno.EEXIST:
+            raise
+    return path
+
+
+@contextlib.contextmanager
+def waiter_slot():
+    """Acquire one of the LONGPOLL_MAX_WAITERS waiter slots.
+
+    Yields True if a slot was acquired, or False if all are in use, in
+    which case the caller must not wait.
+    """
+    path = _lock_dir()
+    for slot in range(settings.LONGPOLL_MAX_WAITERS):
+        fd = os.open(os.path.join(path, 'slot-%d' % slot),
+                     os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError) as exc:
+            os.close(fd)
+            if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            continue
+
+        try:
+            yield True
+        finally:
+            os.close(fd)
+        return
+
+    yield False
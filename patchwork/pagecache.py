@@ -0,0 +1,99 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Cache the patch list pages seen by anonymous users.
+
+Pages are cached by project, filter, order and page number, along with
+the project's list generation, which is incremented once a transaction
+changing a patch, comment, check or tag count in the project, or the name
+of a submitter or state shown in its list, commits. A change therefore
+invalidates all of the project's cached pages at once, without needing
+to find them, and unused pages expire after LIST_CACHE_TIMEOUT seconds.
+Renaming a delegate's user doesn't invalidate the pages showing them.
+
+Cache hits and misses are counted per process, and shown on the request
+profiling page.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+
+from patchwork.filters import filterclasses
+
+# the request parameters a list page depends on
+PARAMS = [f.param for f in filterclasses] + ['order', 'page']
+
+_stats = {'hits': 0, 'misses': 0}
+_stats_lock = threading.Lock()
+
+
+def get_stats():
+    with _stats_lock:
+        stats = dict(_stats)
+
+    total = stats['hits'] + stats['misses']
+    stats['hit_rate'] = float(stats['hits']) / total if total else None
+    return stats
+
+
+def clear_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
+
+
+def cache_key(request, project):
+    """Return the key a list page is cached under.
+
+    Returns None if the page must not be cached, as it is personalized.
+    """
+    if not settings.LIST_CACHE_TIMEOUT or request.method != 'GET' or \
+            request.user.is_authenticated():
+        return None
+
+    # messages are only shown once
+    if len(messages.get_messages(request)):
+        return None
+
+    # serialized unambiguously, so that escaped separators within a value
+    # can't make it match another set of parameters
+    params = json.dumps([(name, request.GET[name].strip())
+                         for name in sorted(PARAMS) if request.GET.get(name)])
+    return 'patchwork:list:%d:%d:%s' % (
+        project.id, project.list_generation,
+        hashlib.sha1(params.encode('utf-8')).hexdigest())
+
+
+def get_page(key):
+    """Return the cached content of a page, or None."""
+    content = caches[settings.LIST_CACHE].get(key)
+    with _stats_lock:
+        _stats['hits' if content is not None else 'misses'] += 1
+    return content
+
+
+def set_page(key, content):
+    caches[settings.LIST_CACHE].set(key, content,
+                                    settings.LIST_CACHE_TIMEOUT)
@@ -274,6 +274,79 @@ def patch_get_filenames(str):
     return filenames
 
 
+def _strip_path(path):
+    # normalise -p1 top-directories
+    return '/'.join(path.split('/')[1:])
+
+
+def patch_get_file_stats(str):
+    """Return the files touched by a diff, and how.
+
+    Args:
+        str: The diff, as extracted by parse_patch.
+
+    Returns:
+        A list of (path, change_type, lines_added, lines_removed) tuples,
+        in the order the files appear in the diff. change_type is one of
+        'A' (added), 'D' (deleted), 'R' (renamed) or 'M' (modified).
+    """
+    str = str.replace('\r', '')
+
+    files = []
+    old_path = None
+    renamed = False
+    # remaining old and new lines of the current hunk
+    lc = [0, 0]
+
+    for line in str.split('\n'):
+        if lc[0] > 0 or lc[1] > 0:
+            if line.startswith('-'):
+                lc[0] -= 1
+                files[-1][3] += 1
+            elif line.startswith('+'):
+                lc[1] -= 1
+                files[-1][2] += 1
+            elif not line.startswith('\\'):
+                lc[0] -= 1
+                lc[1] -= 1
+            continue
+
+        hunk_match = _hunk_re.match(line)
+        filename_match = _filename_re.match(line)
+
+        if hunk_match and files:
+            lc = [int(x) if x else 1 for x in hunk_match.groups()]
+
+        elif filename_match and filename_match.group(1) == '---':
+            old_path = filename_match.group(2)
+
+        elif filename_match:
+            new_path = filename_match.group(2)
+            if renamed:
+                # already recorded from the git rename header
+                pass
+            elif new_path.startswith('/dev/null'):
+                files.append([_strip_path(old_path), 'D', 0, 0])
+            elif old_path is None or old_path.startswith('/dev/null'):
+                files.append([_strip_path(new_path), 'A', 0, 0])
+            elif _strip_path(old_path) != _strip_path(new_path):
+                files.append([_strip_path(new_path), 'R', 0, 0])
+            else:
+                files.append([_strip_path(new_path), 'M', 0, 0])
+            old_path = None
+            renamed = False
+
+        elif line.startswith('rename to '):
+            files.append([line[len('rename to '):], 'R', 0, 0])
+            renamed = True
+
+        elif line.startswith('diff '):
+            old_path = None
+            renamed = False
+
+    return [tuple(entry) for entry in files]
+
+
 def main(args):
     from optparse import OptionParser
 
@@ -0,0 +1,124 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Send reads to database replicas.
+
+DATABASE_REPLICAS lists the aliases in DATABASES which are read-only
+replicas of the 'default' database. Reads are only sent to a replica
+within a use_replicas() block, which ReplicaMiddleware enters for
+read-only requests. Everything else, including all writes, mail parsing
+and management commands, uses the primary.
+
+Replicas lag behind the primary, so a client which has just changed
+something is pinned to the primary for REPLICA_PIN_SECONDS, so that it
+sees its own changes.
+"""
+
+from __future__ import absolute_import
+
+import contextlib
+import random
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'pw_primary'
+
+# the replica reads are currently sent to, if any
+_local = threading.local()
+
+
+def get_replica():
+    return getattr(_local, 'replica', None)
+
+
+def set_replica(alias):
+    _local.replica = alias
+
+
+def choose_replica():
+    """Return the replica to use for a request, or None if there are none.
+
+    A single replica is used for each request, so that it sees a
+    consistent snapshot of the data.
+    """
+    if not settings.DATABASE_REPLICAS:
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+@contextlib.contextmanager
+def use_replicas(enabled=True):
+    """Send reads made in this block to a replica, if enabled."""
+    previous = get_replica()
+    set_replica(choose_replica() if enabled else None)
+    try:
+        yield
+    finally:
+        set_replica(previous)
+
+
+def use_primary(view):
+    """Mark a view as always reading from the primary.
+
+    This is needed by views which write on GET requests, or which must
+    see changes as soon as they are committed.
+    """
+    view.use_primary = True
+    return view
+
+
+def is_pinned(request):
+    return PIN_COOKIE in request.COOKIES
+
+
+def pin(response):
+    """Pin the client to the primary for REPLICA_PIN_SECONDS."""
+    response.set_cookie(PIN_COOKIE, '1',
+                        max_age=settings.REPLICA_PIN_SECONDS)
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        # sessions are written on login, and must be read back immediately
+        if model._meta.app_label == 'sessions':
+            return DEFAULT_DB_ALIAS
+        return get_replica()
+
+    def db_for_write(self, model, **hints):
+        # objects read from a replica are saved to the primary
+        instance = hints.get('instance')
+        if instance is not None and \
+                instance._state.db in settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = [DEFAULT_DB_ALIAS] + list(settings.DATABASE_REPLICAS)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, *args, **hints):
+        # replicas are kept up to date by the database itself
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
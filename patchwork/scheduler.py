@@ -0,0 +1,215 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+"""Run periodic jobs.
+
+Jobs are functions registered with the register decorator. Each is run
+every `interval` seconds, which SCHEDULER_INTERVALS can override by job
+name, by the long-running scheduler management command. The cron
+command instead runs every job each time it is run.
+
+A run first locks the job's ScheduledJob row until the job's timeout,
+with a compare-and-set update, so that a job is never run twice at once,
+even by schedulers on different hosts. If a run outlives the timeout,
+another scheduler may take the lock over, so a run only unlocks the job,
+and records its outcome, if it still holds the lock it took. The next run
+is scheduled after
+the interval plus a random jitter of up to SCHEDULER_JITTER of it, which
+keeps jobs with the same interval from always running together. The
+time, duration and outcome of the last run are recorded in the row.
+"""
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+import datetime
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from patchwork import mailqueue
+from patchwork.models import ScheduledJob
+from patchwork.utils import (send_notifications, do_expiry, compact_events,
+                             expire_events, archive_stale_patches)
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Job(object):
+
+    def __init__(self, name, func, interval, timeout):
+        self.name = name
+        self.func = func
+        self.default_interval = interval
+        self.timeout = timeout
+
+    @property
+    def interval(self):
+        return settings.SCHEDULER_INTERVALS.get(self.name,
+                                                self.default_interval)
+
+
+_jobs = OrderedDict()
+
+
+def register(name, interval, timeout=3600):
+    """Register a function as a periodic job.
+
+    Args:
+        name (str): A unique name for the job.
+        interval (int): The number of seconds between runs, unless
+            overridden by SCHEDULER_INTERVALS.
+        timeout (int): The number of seconds after which a run is assumed
+            to have died, and the job may be run again.
+    """
+    def decorator(func):
+        _jobs[name] = Job(name, func, interval, timeout)
+        return func
+    return decorator
+
+
+def jobs():
+    """Return the registered jobs, except those disabled by setting their
+    interval to 0."""
+    return [job for job in _jobs.values() if job.interval]
+
+
+def claim(job, force=False):
+    """Lock a job for a run.
+
+    Args:
+        job (Job): The job.
+        force (bool): Claim the job even if it isn't due yet.
+
+    Returns:
+        The time the job was locked until, to pass to run, or None if it
+        isn't due or is being run elsewhere.
+    """
+    now = datetime.datetime.now()
+    locked_until = now + datetime.timedelta(seconds=job.timeout)
+
+    unlocked = ScheduledJob.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        name=job.name)
+    if not force:
+        unlocked = unlocked.filter(next_run__lte=now)
+    if unlocked.update(locked_until=locked_until):
+        return locked_until
+
+    # jobs are run as soon as they are first registered
+    if ScheduledJob.objects.filter(name=job.name).exists():
+        return None
+    try:
+        with transaction.atomic():
+            ScheduledJob.objects.create(name=job.name,
+                                        locked_until=locked_until)
+    except IntegrityError:
+        # created by another scheduler in the meantime
+        return None
+    return locked_until
+
+
+def run(job, locked_until):
+    """Run a job locked by claim, record its outcome and unlock it.
+
+    Args:
+        job (Job): The job.
+        locked_until (datetime): The lock returned by claim. If the run
+            outlived it and another run has since locked the job, that
+            run's lock is left alone.
+
+    Returns:
+        The error the job failed with, or None if it succeeded.
+    """
+    start = datetime.datetime.now()
+    started = time.time()
+
+    try:
+        job.func()
+    except Exception as ex:
+        LOGGER.exception('Job %s failed', job.name)
+        error = '%s: %s' % (type(ex).__name__, ex)
+    else:
+        error = None
+
+    duration = time.time() - started
+    jitter = random.uniform(0, settings.SCHEDULER_JITTER) * job.interval
+    unlocked = ScheduledJob.objects.filter(
+        name=job.name, locked_until=locked_until).update(
+        locked_until=None, last_run=start, last_duration=duration,
+        last_succeeded=error is None, last_error=error or '',
+        next_run=start + datetime.timedelta(seconds=job.interval + jitter))
+    if not unlocked:
+        LOGGER.warning('Job %s outlived its lock, which was taken over',
+                       job.name)
+
+    return error
+
+
+def run_pending(force=False):
+    """Run each job that is due, and isn't being run elsewhere.
+
+    Args:
+        force (bool): Run jobs even if they aren't due yet.
+
+    Returns:
+        A list of (job, error) tuples for the jobs run, where error is
+        None if the job succeeded.
+    """
+    results = []
+    for job in jobs():
+        locked_until = claim(job, force)
+        if locked_until:
+            results.append((job, run(job, locked_until)))
+    return results
+
+
+@register('notifications', interval=settings.NOTIFICATION_DELAY_MINUTES * 60)
+def _send_notifications():
+    errors = send_notifications()
+    if errors:
+        raise RuntimeError('; '.join(
+            'failed sending to %s: %s' % (recipient.email, error)
+            for (recipient, error) in errors))
+
+
+@register('expiry', interval=3600)
+def _do_expiry():
+    do_expiry()
+
+
+@register('archive', interval=3600)
+def _archive_stale_patches():
+    archive_stale_patches()
+
+
+@register('events', interval=3600)
+def _compact_events():
+    compact_events()
+    expire_events()
+
+
+@register('mail-queue', interval=60)
+def _deliver_mail():
+    mailqueue.deliver()
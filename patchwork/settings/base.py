@@ -28,14 +28,20 @@ INSTALLED_APPS = [
     'patchwork',
 ]
 
+# Database
+
+DATABASE_ROUTERS = ['patchwork.routers.ReplicaRouter']
+
 # HTTP
 
 MIDDLEWARE_CLASSES = [
+    'patchwork.middleware.ProfilingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
+    'patchwork.middleware.ReplicaMiddleware',
 ]
 
 if django.VERSION >= (1, 7):
@@ -148,6 +154,110 @@ NOTIFICATION_FROM_EMAIL = DEFAULT_FROM_EMAIL
 # Set to True to enable the Patchwork XML-RPC interface
 ENABLE_XMLRPC = False
 
+# The number of seconds validated XML-RPC API tokens are cached for. Revoked
+# tokens may continue to work for up to this long
+XMLRPC_TOKEN_CACHE_TIMEOUT = 60
+
+# The number of seconds each process caches the default patch state for.
+# Other processes may assign the old default for up to this long after it
+# changes
+DEFAULT_STATE_CACHE_TIMEOUT = 60
+
+# The maximum number of events returned by a single request to the event
+# feed, and the number of days events are kept for. Runs of state or
+# delegate changes to a patch older than EVENT_COMPACTION_HOURS are
+# compacted to a single event for the net change
+EVENT_LIST_MAX_COUNT = 500
+EVENT_RETENTION_DAYS = 30
+EVENT_COMPACTION_HOURS = 24
+
+# The number of seconds before a new event is listed. Event IDs are assigned
+# before the recording transaction commits, so an event may only become
+# visible after one with a higher ID; clients could skip events recorded by
+# transactions which take longer than this to commit
+EVENT_COMMIT_LAG = 10
+
+# The maximum number of seconds a request to the long-polling event feed
+# waits for new events, and the number of such requests allowed to wait at
+# once. Each waiting request occupies a web server worker, so this must be
+# lower than the number of workers (see lib/uwsgi/patchwork.ini). On
+# databases other than PostgreSQL, waiting requests check for new events
+# every LONGPOLL_POLL_INTERVAL seconds. Set LONGPOLL_LOCK_DIR to a private
+# directory if several instances share a host
+LONGPOLL_MAX_TIMEOUT = 30
+LONGPOLL_MAX_WAITERS = 2
+LONGPOLL_POLL_INTERVAL = 1
+LONGPOLL_LOCK_DIR = None
+
+# Text values of at least this many characters, such as diffs, are stored
+# once in the content-addressed blob store, so that duplicates are only
+# stored once. Up to BLOB_CACHE_SIZE recently used blobs are cached in
+# memory by each process
+BLOB_MIN_LENGTH = 512
+BLOB_CACHE_SIZE = 64
+
+# Message headers and blobs of at least this many characters are stored
+# compressed
+COMPRESSION_MIN_LENGTH = 256
+
+# Whether to prime compression with preset dictionaries, which makes short
+# values compress better when running under Python 3.3 or later. Values
+# written this way can't be read by Python 2, so only enable this once no
+# process of the instance will run under Python 2 again
+COMPRESSION_USE_DICTIONARIES = False
+
+# The headers, content, diffs and comments of archived patches submitted
+# more than COLD_STORAGE_DAYS days ago are moved to the
+# COLD_STORAGE_DATABASE by the coldstorage management command, keeping the
+# patch tables small
+COLD_STORAGE_DAYS = 365
+COLD_STORAGE_DATABASE = 'default'
+
+# Aliases in DATABASES of read-only replicas of the 'default' database. If
+# any are given, read-only requests are served from a randomly chosen
+# replica, except for REPLICA_PIN_SECONDS after a client makes a change,
+# so that it sees its own changes. This should be longer than the
+# replication lag
+DATABASE_REPLICAS = []
+REPLICA_PIN_SECONDS = 10
+
+# The number of seconds patch list pages seen by anonymous users are cached
+# for in the LIST_CACHE cache, or 0 to disable caching. Cached pages are
+# invalidated as soon as the list changes
+LIST_CACHE_TIMEOUT = 300
+LIST_CACHE = 'default'
+
+# Set to a directory to cache the raw diffs and mboxes of patches there,
+# and have the web server send them using the ARTIFACT_CACHE_HEADER header,
+# either 'X-Accel-Redirect' (nginx) or 'X-Sendfile' (Apache, lighttpd). For
+# nginx, ARTIFACT_CACHE_URL is the internal location aliased to the
+# directory. The least recently used files are removed once the cache grows
+# beyond ARTIFACT_CACHE_SIZE bytes
+ARTIFACT_CACHE_DIR = None
+ARTIFACT_CACHE_HEADER = 'X-Accel-Redirect'
+ARTIFACT_CACHE_URL = '/artifacts/'
+ARTIFACT_CACHE_SIZE = 1024 * 1024 * 1024
+
+# With EMAIL_BACKEND set to 'patchwork.mailqueue.QueueBackend', mail is
+# queued in the database and delivered through MAIL_QUEUE_BACKEND by the
+# sendqueuedmail management command, using up to MAIL_QUEUE_CONCURRENCY
+# connections. Failed deliveries are retried after MAIL_QUEUE_RETRY_SECONDS,
+# doubling after each failure, until MAIL_QUEUE_MAX_ATTEMPTS attempts have
+# failed. Mail being delivered is retried if not delivered within
+# MAIL_QUEUE_LEASE_SECONDS
+MAIL_QUEUE_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+MAIL_QUEUE_CONCURRENCY = 4
+MAIL_QUEUE_RETRY_SECONDS = 60
+MAIL_QUEUE_MAX_ATTEMPTS = 8
+MAIL_QUEUE_LEASE_SECONDS = 300
+
+# The number of seconds between runs of periodic jobs, by job name, where
+# these differ from the defaults, or 0 to disable a job. The next run of a
+# job is delayed by a random jitter of up to SCHEDULER_JITTER times its
+# interval
+SCHEDULER_INTERVALS = {}
+SCHEDULER_JITTER = 0.1
+
 # Set to True to enable redirections or URLs from previous versions
 # of patchwork
 COMPAT_REDIR = True
@@ -156,3 +266,27 @@ COMPAT_REDIR = True
 # the scheme based on current access. This is useful if SSL protocol
 # is terminated upstream of the server (e.g. at the load balancer)
 FORCE_HTTPS_LINKS = False
+
+# Set to True to profile a sample of requests. Profiles are viewable by
+# staff users at /profiling/
+ENABLE_PROFILING = False
+
+# The fraction of requests profiled, by URL name. The '*' entry applies to
+# any URL not listed
+PROFILING_SAMPLE_RATES = {
+    'patch-list': 0.01,
+    'patch-detail': 0.01,
+    'bundle-mbox': 0.01,
+    'xmlrpc': 0.01,
+    '*': 0.0,
+}
+
+# The number of request profiles kept in memory, and the number of slowest
+# queries recorded for each
+PROFILING_BUFFER_SIZE = 500
+PROFILING_SLOWEST_QUERIES = 5
+
+# Set to a filename to also log request profiles, one JSON object per line,
+# to a rotating log file
+PROFILING_LOG_FILE = None
+PROFILING_LOG_MAX_BYTES = 10 * 1024 * 1024
@@ -41,6 +41,9 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
 EMAIL_USE_TLS = True
 
+# Queue mail for delivery by the sendqueuedmail management command
+EMAIL_BACKEND = 'patchwork.mailqueue.QueueBackend'
+
 DEFAULT_FROM_EMAIL = 'Patchwork <patchwork@patchwork.example.com>'
 SERVER_EMAIL = DEFAULT_FROM_EMAIL
 NOTIFICATION_FROM_EMAIL = DEFAULT_FROM_EMAIL
@@ -0,0 +1,117 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Near-duplicate detection of diffs.
+
+Resends of a patch often differ from the original only in their context
+lines, line numbers or whitespace, so their hashes differ. Instead, each
+diff is reduced to the set of its normalized added and removed lines, and
+a MinHash signature of that set is computed: the probability that two
+signatures agree at a given position equals the Jaccard similarity of the
+two sets.
+
+Signatures are split into BANDS bands of ROWS values, and each band is
+hashed to a bucket. Diffs sharing a bucket agree on a whole band, so the
+diffs similar to a given one are found by looking up its buckets rather
+than by comparing it against every other diff. With 16 bands of 4 rows, a
+pair of diffs with a similarity of 0.5 shares a bucket with a probability
+of 0.64, and one with a similarity of 0.8 with a probability of 0.9998.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import random
+import struct
+import zlib
+
+from patchwork.parser import _filename_re, _hunk_re
+
+BANDS = 16
+ROWS = 4
+
+# lines shorter than this once normalized, such as braces, carry no
+# information about the patch and are ignored
+MIN_LINE_LENGTH = 4
+
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 32) - 1
+
+# fixed so that signatures are comparable across processes and releases
+_rng = random.Random(0x5ec7)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+                 for _ in range(BANDS * ROWS)]
+
+
+def diff_shingles(diff):
+    """Return the set of normalized changed lines of a diff.
+
+    Context lines, file names and line numbers are ignored, and runs of
+    whitespace are collapsed, so rebased resends of a patch produce the
+    same set.
+    """
+    shingles = set()
+
+    for line in diff.replace('\r', '').split('\n'):
+        if not line or line[0] not in '+-':
+            continue
+
+        if _filename_re.match(line) or _hunk_re.match(line):
+            continue
+
+        text = ' '.join(line[1:].split())
+        if len(text) < MIN_LINE_LENGTH:
+            continue
+
+        shingles.add(zlib.crc32((line[0] + text).encode('utf-8')) & _MASK)
+
+    return shingles
+
+
+def minhash(shingles):
+    """Return the MinHash signature of a set of shingles."""
+    if not shingles:
+        return None
+
+    return [min(((a * shingle + b) % _PRIME) for shingle in shingles)
+            for a, b in _PERMUTATIONS]
+
+
+def signature_buckets(signature):
+    """Return the bucket of each band of a signature.
+
+    Buckets are signed 64-bit integers, suitable for a BigIntegerField.
+    The band number is included in the hash, so buckets of different
+    bands never collide.
+    """
+    if signature is None:
+        return []
+
+    buckets = []
+    for band in range(BANDS):
+        values = signature[band * ROWS:(band + 1) * ROWS]
+        digest = hashlib.sha1(struct.pack('>%dQ' % (ROWS + 1), band,
+                                          *values)).digest()
+        buckets.append(struct.unpack('>q', digest[:8])[0])
+    return buckets
+
+
+def diff_buckets(diff):
+    """Return the LSH buckets of a diff."""
+    return signature_buckets(minhash(diff_shingles(diff)))
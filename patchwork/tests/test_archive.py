@@ -0,0 +1,99 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import datetime
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from patchwork.models import ArchivePolicy, Event, Patch, Project, State
+from patchwork.tests.utils import create_comment, create_patches, defaults
+from patchwork.utils import archive_stale_patches
+
+
+class ArchivePolicyTest(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        defaults.project.save()
+        self.accepted = State.objects.get(name='Accepted')
+        self.policy = ArchivePolicy.objects.create(project=defaults.project,
+                                                   days=30)
+        self.policy.states.add(self.accepted)
+
+    def _create_patches(self, count=1, days=31, state=None):
+        patches = create_patches(count, state=state or self.accepted)
+        Patch.objects.filter(pk__in=[patch.pk for patch in patches]).update(
+            last_updated=datetime.datetime.now() -
+            datetime.timedelta(days=days))
+        return patches
+
+    def _archived(self, patch):
+        return Patch.objects.get(pk=patch.pk).archived
+
+    def testArchive(self):
+        patches = self._create_patches(3)
+        generation = Project.objects.get(
+            pk=defaults.project.pk).list_generation
+
+        self.assertEqual(archive_stale_patches(chunk_size=2), 3)
+
+        for patch in patches:
+            self.assertTrue(self._archived(patch))
+        self.assertEqual(Event.objects.filter(
+            category=Event.CATEGORY_PATCH_ARCHIVED).count(), 3)
+        self.assertNotEqual(Project.objects.get(
+            pk=defaults.project.pk).list_generation, generation)
+
+        self.assertEqual(archive_stale_patches(), 0)
+
+    def testRecent(self):
+        patch = self._create_patches(days=29)[0]
+        self.assertEqual(archive_stale_patches(), 0)
+        self.assertFalse(self._archived(patch))
+
+    def testCommented(self):
+        patch = self._create_patches()[0]
+        create_comment(patch)
+        self.assertEqual(archive_stale_patches(), 0)
+        self.assertFalse(self._archived(patch))
+
+    def testStates(self):
+        patch = self._create_patches(
+            state=State.objects.get(name='New'))[0]
+        self.assertEqual(archive_stale_patches(), 0)
+        self.assertFalse(self._archived(patch))
+
+        # policies without states apply to patches in any state
+        self.policy.states.clear()
+        self.assertEqual(archive_stale_patches(), 1)
+        self.assertTrue(self._archived(patch))
+
+    def testDryRun(self):
+        patch = self._create_patches()[0]
+        # patches matched by several policies are only counted once
+        ArchivePolicy.objects.create(project=defaults.project, days=10)
+
+        stdout = StringIO()
+        call_command('archive', dry_run=True, stdout=stdout)
+
+        self.assertIn('1 patches would be archived', stdout.getvalue())
+        self.assertFalse(self._archived(patch))
@@ -0,0 +1,112 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import json
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from patchwork.models import (Bundle, BundlePatch, Comment, DelegationRule,
+                              Patch, Project, State)
+from patchwork.parser import parse_patch
+
+
+class GenerateDataTest(TestCase):
+    fixtures = ['default_tags', 'default_states']
+
+    def _generate(self, **kwargs):
+        options = {'projects': 2, 'patches': 30, 'people': 5, 'users': 2,
+                   'bundles': 2, 'bundle_size': 5, 'batch_size': 7,
+                   'seed': 1, 'stdout': StringIO()}
+        options.update(kwargs)
+        call_command('generatedata', **options)
+
+    def testGenerate(self):
+        self._generate()
+        self.assertEqual(Project.objects.count(), 2)
+        self.assertEqual(Patch.objects.count(), 30)
+        self.assertEqual(Bundle.objects.count(), 2)
+        self.assertTrue(BundlePatch.objects.exists())
+        self.assertTrue(DelegationRule.objects.exists())
+        self.assertTrue(Comment.objects.exists())
+
+        # generated diffs are parsed back as-is
+        patch = Patch.objects.all()[0]
+        diff, _ = parse_patch(patch.diff)
+        self.assertEqual(diff, patch.diff)
+
+    def testGenerateTwice(self):
+        """Ensure primary keys don't clash with existing data"""
+        self._generate()
+        self._generate(seed=2)
+        self.assertEqual(Project.objects.count(), 4)
+        self.assertEqual(Patch.objects.count(), 60)
+
+        # sequences are updated after inserting with explicit keys
+        project = Project(linkname='new', name='new', listid='new.example.com',
+                          listemail='new@example.com')
+        project.save()
+
+    def testNoStates(self):
+        State.objects.all().delete()
+        self.assertRaises(CommandError, self._generate)
+
+
+class BenchmarkTest(TestCase):
+    fixtures = ['default_tags', 'default_states']
+
+    def testBenchmark(self):
+        call_command('generatedata', projects=1, patches=10, people=3,
+                     users=1, bundles=1, seed=1, stdout=StringIO())
+        Bundle.objects.update(public=True)
+
+        out = StringIO()
+        call_command('benchmark', iterations=2, stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report['patches'], 10)
+        for name in ('patch-list', 'patch-detail', 'patch-mbox',
+                     'bundle-mbox'):
+            result = report['endpoints'][name]
+            self.assertTrue(result['p50_ms'] <= result['p95_ms'])
+            self.assertTrue(result['queries'] > 0)
+
+    def testNoProjects(self):
+        self.assertRaises(CommandError, call_command, 'benchmark',
+                          stdout=StringIO())
+
+
+class ExplainQueriesTest(TestCase):
+    fixtures = ['default_tags', 'default_states']
+
+    def testExplain(self):
+        call_command('generatedata', projects=1, patches=10, people=3,
+                     users=1, bundles=0, seed=1, stdout=StringIO())
+
+        out = StringIO()
+        call_command('explainqueries', stdout=out, stderr=StringIO())
+        output = out.getvalue()
+        for name in ('patch list', 'patch by hash', 'person by email'):
+            self.assertIn('%s:\n' % name, output)
+
+    def testNoProjects(self):
+        self.assertRaises(CommandError, call_command, 'explainqueries',
+                          stdout=StringIO())
@@ -0,0 +1,149 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import datetime
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from patchwork import fields
+from patchwork.fields import is_cold_ref
+from patchwork.models import ColdValue, Comment, Patch, Submission
+from patchwork.tests import utils
+
+
+def _raw_value(model, field, pk):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT %s FROM %s WHERE %s = %%s' % (
+            model._meta.get_field(field).column, model._meta.db_table,
+            model._meta.pk.column), [pk])
+        return cursor.fetchone()[0]
+
+
+class ColdStorageTest(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        old = datetime.datetime.now() - datetime.timedelta(days=10)
+        self.patches = utils.create_patches(3, date=old, archived=True,
+                                            headers=u'X-Test: 1',
+                                            content=u'test content')
+        self.comment = utils.create_comment(self.patches[0],
+                                            content=u'test comment')
+        # recent patches and unarchived patches stay where they are
+        self.patches[1].date = datetime.datetime.now()
+        self.patches[1].save()
+        self.patches[2].archived = False
+        self.patches[2].save()
+
+    def _coldstorage(self, **kwargs):
+        call_command('coldstorage', days=5, chunk_size=1, stdout=StringIO(),
+                     **kwargs)
+
+    def _is_cold(self, patch):
+        return [is_cold_ref(_raw_value(model, field, patch.id))
+                for model, field in [(Submission, 'headers'),
+                                     (Submission, 'content'),
+                                     (Patch, 'diff')]]
+
+    def test_move(self):
+        self._coldstorage()
+        self.assertEqual(self._is_cold(self.patches[0]), [True] * 3)
+        self.assertTrue(is_cold_ref(
+            _raw_value(Comment, 'content', self.comment.id)))
+        self.assertEqual(self._is_cold(self.patches[1]), [False] * 3)
+        self.assertEqual(self._is_cold(self.patches[2]), [False] * 3)
+        # one for each non-empty value
+        self.assertEqual(ColdValue.objects.count(), 4)
+
+        patch = Patch.objects.get(id=self.patches[0].id)
+        self.assertEqual(patch.headers, u'X-Test: 1')
+        self.assertEqual(patch.content, u'test content')
+        self.assertEqual(patch.diff, self.patches[1].diff)
+        self.assertEqual(Comment.objects.get(id=self.comment.id).content,
+                         self.comment.content)
+
+    def test_empty_values(self):
+        patch = utils.create_patches(1, date=self.patches[0].date,
+                                     archived=True, headers=u'',
+                                     content=u'')[0]
+        self._coldstorage()
+        self.assertTrue(Patch.objects.get(id=patch.id).cold)
+        self.assertEqual(self._is_cold(patch), [False, False, True])
+
+        # patches already in cold storage aren't selected again
+        Patch.objects.filter(id=patch.id).update(diff=u'new diff')
+        self._coldstorage()
+        self.assertEqual(_raw_value(Patch, 'diff', patch.id), u'new diff')
+
+    def test_batched(self):
+        self._coldstorage()
+        Patch.objects.filter(id=self.patches[2].id).update(archived=True)
+        self._coldstorage()
+
+        # one query for the patches, and one for their cold values
+        fields.clear_batches()
+        with self.assertNumQueries(2):
+            patches = Patch.objects.filter(
+                id__in=[self.patches[0].id, self.patches[2].id])
+            for patch in patches:
+                self.assertEqual(patch.diff, self.patches[0].diff)
+                self.assertEqual(patch.content, u'test content')
+
+    def test_restore_unarchived(self):
+        self._coldstorage()
+        Patch.objects.filter(id=self.patches[0].id).update(archived=False)
+        self._coldstorage()
+        self.assertEqual(self._is_cold(self.patches[0]), [False] * 3)
+        self.assertEqual(_raw_value(Submission, 'headers',
+                                    self.patches[0].id), u'X-Test: 1')
+
+    def test_restore(self):
+        self._coldstorage()
+        self._coldstorage(restore=True)
+        for patch in self.patches:
+            self.assertEqual(self._is_cold(patch), [False] * 3)
+        self.assertEqual(
+            Patch.objects.get(id=self.patches[0].id).diff,
+            self.patches[0].diff)
+
+        # values stored recently are kept, in case a move is still using
+        # them
+        self._coldstorage(restore=True, purge=True)
+        self.assertEqual(ColdValue.objects.count(), 4)
+
+        ColdValue.objects.update(
+            created=datetime.datetime.now() - datetime.timedelta(days=2))
+        self._coldstorage(restore=True, purge=True)
+        self.assertFalse(ColdValue.objects.exists())
+
+    def test_purge_reused(self):
+        self._coldstorage()
+        ColdValue.objects.update(
+            created=datetime.datetime.now() - datetime.timedelta(days=2))
+        self._coldstorage(restore=True)
+
+        # moving the patches again stores their values again
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=1)
+        self._coldstorage()
+        self.assertFalse(ColdValue.objects.filter(
+            created__lt=cutoff).exists())
+        self.assertEqual(ColdValue.objects.count(), 4)
@@ -0,0 +1,297 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import datetime
+import json
+import tempfile
+import time
+import unittest
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from patchwork import notify
+from patchwork.models import Event, State
+from patchwork.tests import utils
+from patchwork.utils import compact_events, expire_events
+from patchwork.views import xmlrpc as xmlrpc_views
+
+
+class EventRecordTest(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        self.patch = utils.create_patches()[0]
+        self.user = utils.create_user()
+
+    def _categories(self):
+        return list(Event.objects.values_list('category', flat=True))
+
+    def testPatchCreated(self):
+        event = Event.objects.get()
+        self.assertEqual(event.category, Event.CATEGORY_PATCH_CREATED)
+        self.assertEqual(event.submission_id, self.patch.id)
+        self.assertEqual(event.project_id, self.patch.project_id)
+        self.assertEqual(event.current_state_id, self.patch.state_id)
+
+    def testPatchChanged(self):
+        orig_state = self.patch.state
+        new_state = State.objects.exclude(pk=orig_state.pk)[0]
+        self.patch.state = new_state
+        self.patch.delegate = self.user
+        self.patch.archived = True
+        self.patch.save()
+
+        self.assertEqual(self._categories(), [
+            Event.CATEGORY_PATCH_CREATED,
+            Event.CATEGORY_PATCH_STATE_CHANGED,
+            Event.CATEGORY_PATCH_DELEGATED,
+            Event.CATEGORY_PATCH_ARCHIVED,
+        ])
+        event = Event.objects.get(
+            category=Event.CATEGORY_PATCH_STATE_CHANGED)
+        self.assertEqual(event.previous_state, orig_state)
+        self.assertEqual(event.current_state, new_state)
+        event = Event.objects.get(category=Event.CATEGORY_PATCH_DELEGATED)
+        self.assertEqual(event.previous_delegate, None)
+        self.assertEqual(event.current_delegate, self.user)
+
+    def testPatchUnchanged(self):
+        self.patch.name = 'renamed'
+        self.patch.save()
+        self.assertEqual(self._categories(), [Event.CATEGORY_PATCH_CREATED])
+
+    def testCommentAndCheckCreated(self):
+        comment = utils.create_comment(self.patch)
+        check = utils.create_check(self.patch, self.user)
+        check.save()
+
+        self.assertEqual(self._categories(), [
+            Event.CATEGORY_PATCH_CREATED,
+            Event.CATEGORY_COMMENT_CREATED,
+            Event.CATEGORY_CHECK_CREATED,
+        ])
+        events = Event.objects.all()
+        self.assertEqual(events[1].comment, comment)
+        self.assertEqual(events[2].created_check, check)
+
+
+@override_settings(EVENT_COMMIT_LAG=0)
+class EventListTest(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        self.patches = utils.create_patches(3)
+        self.other = utils.create_patches(2, project=utils.create_project())
+
+    def testListSince(self):
+        first = Event.objects.first().id
+        with self.assertNumQueries(1):
+            events = Event.list_since(first, 2)
+        self.assertEqual([event['patch_id'] for event in events],
+                         [patch.id for patch in self.patches[1:]])
+
+    def testListProject(self):
+        events = Event.list_since(
+            0, 0, project_id=self.other[0].project_id)
+        self.assertEqual([event['patch_id'] for event in events],
+                         [patch.id for patch in self.other])
+
+    @override_settings(EVENT_LIST_MAX_COUNT=2)
+    def testListMaxCount(self):
+        self.assertEqual(len(Event.list_since(0, 0)), 2)
+        self.assertEqual(len(Event.list_since(0, 10)), 2)
+
+    @override_settings(EVENT_COMMIT_LAG=60)
+    def testOutOfOrderCommit(self):
+        Event.objects.update(
+            date=datetime.datetime.now() - datetime.timedelta(minutes=2))
+        last_id = Event.objects.last().id
+        utils.create_patches(2)
+        ids = list(Event.objects.filter(id__gt=last_id).values_list(
+            'id', flat=True))
+
+        # the first new event is still to be committed when the second
+        # becomes visible
+        pending = Event.objects.get(id=ids[0])
+        pending.delete()
+        self.assertEqual(Event.list_since(last_id, 0), [])
+
+        pending.id = ids[0]
+        pending.save()
+        self.assertEqual(Event.list_since(last_id, 0), [])
+
+        Event.objects.filter(id__gt=last_id).update(
+            date=datetime.datetime.now() - datetime.timedelta(minutes=1))
+        events = Event.list_since(last_id, 0)
+        self.assertEqual([event['id'] for event in events], ids)
+
+    def testJSON(self):
+        project = self.other[0].project
+        response = self.client.get(reverse('api-events'),
+                                   {'project': project.linkname, 'limit': 1})
+        data = json.loads(response.content.decode())
+        self.assertEqual(len(data['events']), 1)
+        self.assertEqual(data['events'][0]['patch_id'], self.other[0].id)
+        self.assertEqual(data['events'][0]['project'], project.linkname)
+
+        response = self.client.get(reverse('api-events'),
+                                   {'project': project.linkname,
+                                    'since': data['last_id']})
+        data = json.loads(response.content.decode())
+        self.assertEqual([event['patch_id'] for event in data['events']],
+                         [self.other[1].id])
+
+        response = self.client.get(reverse('api-events'),
+                                   {'since': data['last_id']})
+        data = json.loads(response.content.decode())
+        self.assertEqual(data['events'], [])
+        self.assertEqual(data['last_id'], Event.objects.last().id)
+
+    @unittest.skipUnless(settings.ENABLE_XMLRPC,
+                         'requires xmlrpc interface (use the ENABLE_XMLRPC '
+                         'setting)')
+    def testXMLRPC(self):
+        events = xmlrpc_views.event_list(0, 0, self.patches[0].project_id)
+        self.assertEqual([event['patch_id'] for event in events],
+                         [patch.id for patch in self.patches])
+
+
+@override_settings(LONGPOLL_POLL_INTERVAL=0.01,
+                   LONGPOLL_LOCK_DIR=tempfile.mkdtemp(),
+                   EVENT_COMMIT_LAG=0)
+class EventWaitTest(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        self.patch = utils.create_patches()[0]
+        self.last_id = Event.objects.last().id
+
+    def _get(self, **params):
+        params.setdefault('project', self.patch.project.linkname)
+        return self.client.get(reverse('api-events-wait'), params)
+
+    def testExistingEvents(self):
+        response = self._get(since=0)
+        data = json.loads(response.content.decode())
+        self.assertEqual(data['last_id'], self.last_id)
+
+    def testTimeout(self):
+        start = time.time()
+        response = self._get(since=self.last_id, timeout=1)
+        self.assertGreaterEqual(time.time() - start, 1)
+        data = json.loads(response.content.decode())
+        self.assertEqual(data, {'events': [], 'last_id': self.last_id})
+
+    @override_settings(EVENT_COMMIT_LAG=1)
+    def testCommitLag(self):
+        start = time.time()
+        response = self._get(since=0, timeout=5)
+        self.assertGreaterEqual(time.time() - start, 0.5)
+        data = json.loads(response.content.decode())
+        self.assertEqual(data['last_id'], self.last_id)
+
+        # events which can already be listed are returned immediately
+        start = time.time()
+        response = self._get(since=0, timeout=5)
+        self.assertLess(time.time() - start, 0.5)
+        data = json.loads(response.content.decode())
+        self.assertEqual(data['last_id'], self.last_id)
+
+    @override_settings(EVENT_COMMIT_LAG=1, LONGPOLL_MAX_WAITERS=1)
+    def testCommitLagSlots(self):
+        # waiting for new events to be listed occupies a slot
+        with notify.waiter_slot() as acquired:
+            self.assertTrue(acquired)
+            response = self._get(since=0, timeout=1)
+            self.assertEqual(response.status_code, 503)
+
+    def testInvalidProject(self):
+        response = self._get(project='invalid', since=self.last_id)
+        self.assertEqual(response.status_code, 404)
+
+    def testWakeup(self):
+        calls = []
+
+        def check():
+            calls.append(None)
+            return len(calls) == 3
+
+        self.assertTrue(notify.wait(check, timeout=10))
+        self.assertEqual(len(calls), 3)
+
+    def testSlots(self):
+        with self.settings(LONGPOLL_MAX_WAITERS=1):
+            with notify.waiter_slot() as acquired:
+                self.assertTrue(acquired)
+                with notify.waiter_slot() as acquired:
+                    self.assertFalse(acquired)
+
+                response = self._get(since=self.last_id, timeout=1)
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '1')
+
+                # requests which don't need to wait are still served
+                response = self._get(since=0)
+                self.assertEqual(response.status_code, 200)
+
+            with notify.waiter_slot() as acquired:
+                self.assertTrue(acquired)
+
+
+class EventExpiryTest(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        self.patch = utils.create_patches()[0]
+        self.states = list(State.objects.all()[:3])
+
+    def _age(self, **kwargs):
+        Event.objects.update(
+            date=datetime.datetime.now() - datetime.timedelta(**kwargs))
+
+    def testCompaction(self):
+        orig_state = self.patch.state
+        for state in self.states[1:] + [self.states[0], self.states[2]]:
+            self.patch.state = state
+            self.patch.save()
+        self._age(hours=settings.EVENT_COMPACTION_HOURS + 1)
+
+        self.assertEqual(compact_events(), 3)
+        events = Event.objects.filter(
+            category=Event.CATEGORY_PATCH_STATE_CHANGED)
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0].previous_state, orig_state)
+        self.assertEqual(events[0].current_state, self.states[2])
+        self.assertTrue(Event.objects.filter(
+            category=Event.CATEGORY_PATCH_CREATED).exists())
+
+    def testCompactionRecent(self):
+        for state in self.states[1:]:
+            self.patch.state = state
+            self.patch.save()
+        self.assertEqual(compact_events(), 0)
+
+    def testExpiry(self):
+        self.assertEqual(expire_events(), 0)
+        self._age(days=settings.EVENT_RETENTION_DAYS + 1)
+        self.assertEqual(expire_events(), 1)
+        self.assertFalse(Event.objects.exists())
@@ -20,11 +20,15 @@
 import datetime
 
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db.models import F
 from django.test import TestCase
+from django.utils.six import StringIO
 
-from patchwork.models import EmailConfirmation, Person, Patch
+from patchwork.models import (EmailConfirmation, Person, Patch, Project,
+                              UserProfile)
 from patchwork.tests.utils import create_user, defaults
-from patchwork.utils import do_expiry
+from patchwork.utils import _delete_users, do_expiry
 
 
 class TestRegistrationExpiry(TestCase):
@@ -122,3 +126,77 @@ class TestRegistrationExpiry(TestCase):
         # and there should be no user associated with the person
         self.assertEqual(
             Person.objects.get(pk=defaults.patch_author_person.pk).user, None)
+
+    def testPendingOptoutConfirmation(self):
+        date = ((datetime.datetime.now() - EmailConfirmation.validity) -
+                datetime.timedelta(hours=1))
+        (user, conf) = self.register(date)
+
+        # pending confirmations without a user don't keep users
+        EmailConfirmation(type='optout', email='test@example.com').save()
+
+        do_expiry()
+
+        self.assertFalse(User.objects.filter(pk=user.pk).exists())
+
+    def testProfileExpiry(self):
+        date = ((datetime.datetime.now() - EmailConfirmation.validity) -
+                datetime.timedelta(hours=1))
+        (user, conf) = self.register(date)
+        defaults.project.save()
+        user.profile.maintainer_projects.add(defaults.project)
+
+        do_expiry()
+
+        self.assertFalse(UserProfile.objects.filter(user=user.pk).exists())
+        self.assertTrue(Project.objects.filter(pk=defaults.project.pk)
+                        .exists())
+
+    def testChunkedExpiry(self):
+        date = ((datetime.datetime.now() - EmailConfirmation.validity) -
+                datetime.timedelta(hours=1))
+        users = [self.register(date)[0] for i in range(3)]
+        (recent_user, recent_conf) = self.register(datetime.datetime.now())
+
+        progress = []
+        counts = do_expiry(chunk_size=2,
+                           progress=lambda *args: progress.append(args))
+
+        self.assertEqual(counts, (3, 3))
+        self.assertEqual(progress, [
+            ('confirmations', 2, 3), ('confirmations', 3, 3),
+            ('users', 2, 3), ('users', 3, 3)])
+        self.assertFalse(User.objects.filter(
+            pk__in=[user.pk for user in users]).exists())
+        self.assertTrue(User.objects.filter(pk=recent_user.pk).exists())
+
+    def testConfirmedWhileExpiring(self):
+        date = ((datetime.datetime.now() - EmailConfirmation.validity) -
+                datetime.timedelta(hours=1))
+        users = [self.register(date)[0] for i in range(2)]
+        expired = User.objects.filter(is_active=False,
+                                      last_login=F('date_joined'))
+
+        # a user listed for deletion confirms their registration before
+        # the batch is deleted, so is kept and not counted
+        users[0].is_active = True
+        users[0].save()
+
+        self.assertEqual(
+            _delete_users(expired, [user.pk for user in users]), 1)
+        self.assertTrue(User.objects.filter(pk=users[0].pk).exists())
+        self.assertFalse(User.objects.filter(pk=users[1].pk).exists())
+
+    def testDryRun(self):
+        date = ((datetime.datetime.now() - EmailConfirmation.validity) -
+                datetime.timedelta(hours=1))
+        (user, conf) = self.register(date)
+
+        stdout = StringIO()
+        call_command('expire', dry_run=True, stdout=stdout)
+
+        self.assertIn('1 confirmations and 1 users would be expired',
+                      stdout.getvalue())
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+        self.assertTrue(EmailConfirmation.objects.filter(pk=conf.pk)
+                        .exists())
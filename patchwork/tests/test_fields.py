@@ -17,9 +17,19 @@
 # along with Patchwork; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
-from django.test import SimpleTestCase
+import datetime
+import threading
+import unittest
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
 
 from patchwork import fields
+from patchwork.models import Blob, Patch, Submission
+from patchwork.tests import utils
 
 
 class TestHashField(SimpleTestCase):
@@ -31,3 +41,214 @@ class TestHashField(SimpleTestCase):
         """
         field = fields.HashField()
         self.assertEqual(field.n_bytes, 40)
+
+
+def _raw_value(model, field, pk):
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT %s FROM %s WHERE %s = %%s' % (
+            model._meta.get_field(field).column, model._meta.db_table,
+            model._meta.pk.column), [pk])
+        return cursor.fetchone()[0]
+
+
+@override_settings(BLOB_MIN_LENGTH=16)
+class TestBlobField(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        self.patches = utils.create_patches(2)
+        fields.clear_blob_cache()
+
+    def tearDown(self):
+        fields.clear_blob_cache()
+
+    def _save_diff(self, patch, diff):
+        patch.diff = diff
+        patch.save()
+        return Patch.objects.get(id=patch.id)
+
+    def test_dedupe(self):
+        diff = 'x' * 32
+        for patch in self.patches:
+            self.assertEqual(self._save_diff(patch, diff).diff, diff)
+
+        self.assertEqual(Blob.objects.filter(data=diff).count(), 1)
+        for patch in self.patches:
+            self.assertEqual(_raw_value(Patch, 'diff', patch.id),
+                             fields.BLOB_PREFIX + fields.blob_digest(diff))
+
+    def test_short_value(self):
+        count = Blob.objects.count()
+        self.assertEqual(self._save_diff(self.patches[0], 'short').diff,
+                         'short')
+        self.assertEqual(_raw_value(Patch, 'diff', self.patches[0].id),
+                         'short')
+        self.assertEqual(Blob.objects.count(), count)
+
+    def test_reference_like_value(self):
+        value = fields.BLOB_PREFIX
+        self.assertEqual(self._save_diff(self.patches[0], value).diff, value)
+        self.assertTrue(Blob.objects.filter(data=value).exists())
+
+    def test_cached(self):
+        diff = 'x' * 32
+        self._save_diff(self.patches[0], diff)
+        with self.assertNumQueries(1):
+            self.assertEqual(Patch.objects.get(id=self.patches[0].id).diff,
+                             diff)
+
+        fields.clear_blob_cache()
+        with self.assertNumQueries(2):
+            self.assertEqual(Patch.objects.get(id=self.patches[0].id).diff,
+                             diff)
+
+    def test_batched(self):
+        diffs = ['%d' % i * 32 for i in range(len(self.patches))]
+        for patch, diff in zip(self.patches, diffs):
+            self._save_diff(patch, diff)
+
+        fields.clear_blob_cache()
+        with self.assertNumQueries(2):
+            patches = Patch.objects.filter(
+                id__in=[patch.id for patch in self.patches]).order_by('id')
+            self.assertEqual([patch.diff for patch in patches], diffs)
+
+    @override_settings(BLOB_CACHE_SIZE=4)
+    def test_cache_threads(self):
+        errors = []
+
+        def cache_blobs(thread):
+            try:
+                for i in range(1000):
+                    digest = '%d-%d' % (thread, i % 8)
+                    fields._cache_blob(digest, digest)
+            except Exception as ex:
+                errors.append(ex)
+
+        threads = [threading.Thread(target=cache_blobs, args=(i,))
+                   for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(fields._blob_cache), 4)
+
+    def test_unloaded_value_saved(self):
+        diff = 'x' * 32
+        self._save_diff(self.patches[0], diff)
+        patch = Patch.objects.get(id=self.patches[0].id)
+        Blob.objects.all().delete()
+        patch.save()
+
+        self.assertEqual(_raw_value(Patch, 'diff', patch.id),
+                         fields.BLOB_PREFIX + fields.blob_digest(diff))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_purge_command(self):
+        diff = 'x' * 32
+        self._save_diff(self.patches[0], diff)
+        self._save_diff(self.patches[0], 'y' * 32)
+        self._save_diff(self.patches[1], 'z' * 32)
+        last_used = datetime.datetime.now() - datetime.timedelta(days=2)
+        Blob.objects.exclude(data='z' * 32).update(last_used=last_used)
+
+        call_command('dedupeblobs', purge=True, stdout=StringIO())
+        self.assertEqual(
+            sorted(Blob.objects.values_list('digest', flat=True)),
+            sorted([fields.blob_digest('y' * 32),
+                    fields.blob_digest('z' * 32)]))
+
+    def test_dedupe_command(self):
+        diff = 'y' * 32
+        Patch.objects.update(diff=diff)
+        Submission.objects.filter(id=self.patches[0].id).update(
+            content='z' * 32)
+        Blob.objects.all().delete()
+
+        call_command('dedupeblobs', dry_run=True, stdout=StringIO())
+        self.assertFalse(Blob.objects.exists())
+        self.assertEqual(_raw_value(Patch, 'diff', self.patches[0].id), diff)
+
+        call_command('dedupeblobs', chunk_size=1, stdout=StringIO())
+        self.assertEqual(Blob.objects.count(), 2)
+        for patch in self.patches:
+            self.assertTrue(fields.is_blob_ref(
+                _raw_value(Patch, 'diff', patch.id)))
+            self.assertEqual(Patch.objects.get(id=patch.id).diff, diff)
+        self.assertEqual(Patch.objects.get(id=self.patches[0].id).content,
+                         'z' * 32)
+
+
+HEADERS = ('Received: from localhost (localhost [127.0.0.1])\n'
+           '\tby example.com (Postfix) with ESMTP id 1234\n'
+           'List-Id: <test.example.com>\n'
+           'Subject: [PATCH 1/2] test\n'
+           'Content-Type: text/plain; charset=UTF-8\n')
+
+
+@override_settings(COMPRESSION_MIN_LENGTH=16)
+class TestCompressedTextField(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        self.patch = utils.create_patches(1)[0]
+
+    def _save_headers(self, headers):
+        self.patch.headers = headers
+        self.patch.save()
+        return Submission.objects.get(id=self.patch.id).headers
+
+    def test_compressed(self):
+        headers = HEADERS * 4
+        self.assertEqual(self._save_headers(headers), headers)
+        value = _raw_value(Submission, 'headers', self.patch.id)
+        self.assertTrue(fields.is_compressed(value))
+        self.assertLess(len(value), len(headers))
+
+    def test_incompressible_value(self):
+        value = 'Subject: 0123456789abcdef'
+        self.assertEqual(self._save_headers(value), value)
+        self.assertEqual(_raw_value(Submission, 'headers', self.patch.id),
+                         value)
+
+    @unittest.skipUnless(fields._ZDICT, 'preset dictionaries need Python 3.3')
+    @override_settings(COMPRESSION_USE_DICTIONARIES=True)
+    def test_dictionary(self):
+        self.assertLess(len(fields.compress_text(HEADERS, 'headers')),
+                        len(fields.compress_text(HEADERS)))
+        for dictionary in (None, 'headers', 'diff'):
+            self.assertEqual(fields.decompress_text(
+                fields.compress_text(HEADERS, dictionary)), HEADERS)
+
+    def test_no_dictionary(self):
+        # values can be read by Python 2 unless dictionaries are enabled
+        self._save_headers(HEADERS * 4)
+        value = _raw_value(Submission, 'headers', self.patch.id)
+        self.assertTrue(value.startswith(fields.COMPRESSED_PREFIX + ':'))
+
+    def test_short_value(self):
+        self.assertEqual(self._save_headers('short'), 'short')
+        self.assertEqual(_raw_value(Submission, 'headers', self.patch.id),
+                         'short')
+
+    def test_compressed_like_value(self):
+        value = fields.COMPRESSED_PREFIX
+        self.assertEqual(self._save_headers(value), value)
+
+    def test_unicode(self):
+        headers = u'From: J\xf6rg Test <test@example.com>\n' * 2
+        self.assertEqual(self._save_headers(headers), headers)
+
+    def test_compress_command(self):
+        headers = HEADERS * 4
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE %s SET headers = %%s' %
+                           Submission._meta.db_table, [headers])
+
+        call_command('compresstext', chunk_size=1, stdout=StringIO())
+        self.assertTrue(fields.is_compressed(
+            _raw_value(Submission, 'headers', self.patch.id)))
+        self.assertEqual(Submission.objects.get(id=self.patch.id).headers,
+                         headers)
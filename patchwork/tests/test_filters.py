@@ -17,8 +17,13 @@
 # along with Patchwork; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.utils.six import StringIO
 
+from patchwork.models import PatchFile
+from patchwork.tests import utils
 from patchwork.tests.utils import defaults
 
 
@@ -44,3 +49,67 @@ class FilterQueryStringTest(TestCase):
         url = '/project/%s/list/?submitter=%%E2%%98%%83' % project.linkname
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
+
+
+class FilesFilterTest(TestCase):
+    fixtures = ['default_states']
+
+    diff = (
+        'diff --git a/drivers/net/foo.c b/drivers/net/foo.c\n'
+        '--- a/drivers/net/foo.c\n'
+        '+++ b/drivers/net/foo.c\n'
+        '@@ -1,2 +1,2 @@\n'
+        '-a\n'
+        '+b\n'
+        ' c\n'
+        'diff --git a/drivers/net/bar.c b/drivers/net/bar.c\n'
+        '--- /dev/null\n'
+        '+++ b/drivers/net/bar.c\n'
+        '@@ -0,0 +1 @@\n'
+        '+d\n')
+
+    def setUp(self):
+        self.patches = utils.create_patches(2)
+        self.patches[1].diff = self.diff
+        self.patches[1].save()
+        self.patches[1].refresh_files()
+
+    def testFilesIndexed(self):
+        files = PatchFile.objects.filter(patch=self.patches[1])
+        self.assertEqual(
+            [(f.path, f.change_type, f.lines_added, f.lines_removed)
+             for f in files],
+            [('drivers/net/foo.c', PatchFile.CHANGE_MODIFIED, 1, 1),
+             ('drivers/net/bar.c', PatchFile.CHANGE_ADDED, 1, 0)])
+
+    def testFilter(self):
+        url = reverse('patch-list',
+                      kwargs={'project_id': defaults.project.linkname})
+        response = self.client.get(url, {'files': 'drivers/net/'})
+        # the patch touches two files, but must be listed only once
+        self.assertEqual(list(response.context['page'].object_list),
+                         [self.patches[1]])
+
+        response = self.client.get(url, {'files': 'drivers/usb/'})
+        self.assertEqual(list(response.context['page'].object_list), [])
+
+    def testIndexFilesCommand(self):
+        PatchFile.objects.all().delete()
+        out = StringIO()
+        call_command('indexfiles', processes=1, batch_size=1, stdout=out)
+        self.assertEqual(PatchFile.objects.filter(
+            patch=self.patches[1]).count(), 2)
+        self.assertTrue(PatchFile.objects.filter(
+            patch=self.patches[0]).exists())
+
+        # indexed patches are skipped unless --all is given
+        PatchFile.objects.filter(patch=self.patches[1]).delete()
+        call_command('indexfiles', processes=1, stdout=out)
+        self.assertEqual(PatchFile.objects.filter(
+            patch=self.patches[1]).count(), 2)
+
+    def testIndexFilesCommandPool(self):
+        PatchFile.objects.all().delete()
+        call_command('indexfiles', processes=2, stdout=StringIO())
+        self.assertEqual(PatchFile.objects.filter(
+            patch=self.patches[1]).count(), 2)
@@ -22,12 +22,16 @@ from __future__ import absolute_import
 import datetime
 import re
 
+from django.core.cache import caches
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
 from django.utils.six.moves import zip
 
-from patchwork.models import Person, Patch
-from patchwork.tests.utils import defaults
+from patchwork import pagecache
+from patchwork.models import Check, Person, Patch, Project
+from patchwork.tests.utils import (create_check, create_patches,
+                                   create_project, create_user, defaults)
 
 
 class EmptyPatchListTest(TestCase):
@@ -130,3 +134,110 @@ class PatchOrderTest(TestCase):
             self.assertGreaterEqual(p1.submitter.name.lower(),
                                     p2.submitter.name.lower())
         self._test_sequence(response, test_fn)
+
+
+# lists are invalidated once changes commit
+class PageCacheTest(TransactionTestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        caches['default'].clear()
+        pagecache.clear_stats()
+        self.project = create_project()
+        self.patch = create_patches(1, project=self.project)[0]
+        self.url = reverse('patch-list',
+                           kwargs={'project_id': self.project.linkname})
+
+    def testCached(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, self.patch.name)
+
+        # only the project is fetched
+        with self.assertNumQueries(1):
+            cached = self.client.get(self.url)
+        self.assertEqual(cached.content, response.content)
+        stats = pagecache.get_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def testParams(self):
+        self.client.get(self.url)
+        self.client.get(self.url + '?order=name&utm_source=test')
+        self.client.get(self.url + '?utm_source=test')
+        self.assertEqual(pagecache.get_stats()['hits'], 1)
+
+    def testEscapedParams(self):
+        submitter = self.patch.submitter_id
+        self.client.get(self.url + '?order=date%%26submitter%%3D%d' %
+                        submitter)
+        self.client.get(self.url + '?order=date&submitter=%d' % submitter)
+        self.assertEqual(pagecache.get_stats()['hits'], 0)
+
+    def testInvalidatedByPatch(self):
+        self.client.get(self.url)
+        patch = create_patches(1, project=self.project)[0]
+        patch.name = 'newpatch'
+        patch.save()
+        self.assertContains(self.client.get(self.url), patch.name)
+
+        patch.archived = True
+        patch.save()
+        self.assertNotContains(self.client.get(self.url), patch.name)
+        self.assertEqual(pagecache.get_stats()['hits'], 0)
+
+    def testInvalidatedByCheck(self):
+        self.client.get(self.url)
+        check = create_check(self.patch, create_user(),
+                             state=Check.STATE_FAIL)
+        self.client.get(self.url)
+        check.delete()
+        self.client.get(self.url)
+        self.assertEqual(pagecache.get_stats()['hits'], 0)
+
+    def testInvalidatedByRename(self):
+        self.client.get(self.url)
+        person = self.patch.submitter
+        person.name = 'renamed'
+        person.save()
+        self.assertContains(self.client.get(self.url), person.name)
+
+        state = self.patch.state
+        state.name = 'Renamed'
+        state.save()
+        self.assertContains(self.client.get(self.url), state.name)
+        self.assertEqual(pagecache.get_stats()['hits'], 0)
+
+    def testInvalidatedOnCommit(self):
+        generation = Project.objects.get(id=self.project.id).list_generation
+        with transaction.atomic():
+            patches = create_patches(2, project=self.project)
+            create_check(patches[0], create_user())
+            # the project row isn't updated until the transaction commits
+            self.assertEqual(Project.objects.get(
+                id=self.project.id).list_generation, generation)
+        self.assertEqual(Project.objects.get(
+            id=self.project.id).list_generation, generation + 1)
+
+        try:
+            with transaction.atomic():
+                create_patches(1, project=self.project)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(Project.objects.get(
+            id=self.project.id).list_generation, generation + 1)
+
+    def testProjectSave(self):
+        generation = Project.objects.get(id=self.project.id).list_generation
+        create_patches(1, project=self.project)
+        self.project.save()
+        self.assertTrue(Project.objects.get(
+            id=self.project.id).list_generation > generation)
+
+    def testAuthenticated(self):
+        user = create_user()
+        self.client.login(username=user.username, password=user.username)
+        self.client.get(self.url)
+        self.client.get(self.url)
+        self.assertEqual(pagecache.get_stats(),
+                         {'hits': 0, 'misses': 0, 'hit_rate': None})
@@ -0,0 +1,143 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import datetime
+
+from django.core import mail
+from django.core.mail import EmailMultiAlternatives, send_mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+
+from patchwork import mailqueue
+from patchwork.models import QueuedMail
+
+
+class FailingBackend(BaseEmailBackend):
+
+    def send_messages(self, email_messages):
+        raise IOError('connection refused')
+
+
+@override_settings(
+    EMAIL_BACKEND='patchwork.mailqueue.QueueBackend',
+    MAIL_QUEUE_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    MAIL_QUEUE_CONCURRENCY=1,
+    MAIL_QUEUE_RETRY_SECONDS=60,
+    MAIL_QUEUE_MAX_ATTEMPTS=3)
+class MailQueueTest(TestCase):
+
+    def _send(self):
+        send_mail('test subject', 'test body', 'from@example.com',
+                  ['to@example.com'])
+
+    def _make_due(self):
+        QueuedMail.objects.update(next_attempt=datetime.datetime.now())
+
+    def testQueued(self):
+        self._send()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(QueuedMail.objects.count(), 1)
+
+        self.assertEqual(mailqueue.deliver(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        msg = mail.outbox[0]
+        self.assertEqual(msg.subject, 'test subject')
+        self.assertEqual(msg.body, 'test body')
+        self.assertEqual(msg.from_email, 'from@example.com')
+        self.assertEqual(msg.to, ['to@example.com'])
+        self.assertEqual(QueuedMail.objects.count(), 0)
+
+    def testRegistrationQueued(self):
+        response = self.client.post('/register/', {
+            'username': 'test', 'first_name': 'Test', 'last_name': 'User',
+            'email': 'test@example.com', 'password': 'password'})
+        self.assertContains(response, 'confirmation email has been sent')
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command('sendqueuedmail', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['test@example.com'])
+
+    def testAlternatives(self):
+        message = EmailMultiAlternatives('test subject', 'test body',
+                                         'from@example.com',
+                                         ['to@example.com'],
+                                         headers={'Precedence': 'bulk'})
+        message.attach_alternative('<p>test body</p>', 'text/html')
+        message.send()
+
+        mailqueue.deliver()
+        msg = mail.outbox[0]
+        self.assertEqual(msg.extra_headers, {'Precedence': 'bulk'})
+        self.assertEqual(msg.alternatives,
+                         [('<p>test body</p>', 'text/html')])
+
+    @override_settings(
+        MAIL_QUEUE_BACKEND='patchwork.tests.test_mailqueue.FailingBackend')
+    def testRetry(self):
+        self._send()
+
+        self.assertEqual(mailqueue.deliver(), (0, 1))
+        queued = QueuedMail.objects.get()
+        self.assertEqual(queued.status, QueuedMail.STATUS_QUEUED)
+        self.assertEqual(queued.attempts, 1)
+        self.assertIn('connection refused', queued.last_error)
+        delay = queued.next_attempt - datetime.datetime.now()
+        self.assertTrue(50 < delay.total_seconds() <= 60)
+
+        # not retried until the delay has passed
+        self.assertEqual(mailqueue.deliver(), (0, 0))
+
+        # each retry waits twice as long as the last
+        self._make_due()
+        self.assertEqual(mailqueue.deliver(), (0, 1))
+        queued = QueuedMail.objects.get()
+        self.assertEqual(queued.attempts, 2)
+        delay = queued.next_attempt - datetime.datetime.now()
+        self.assertTrue(110 < delay.total_seconds() <= 120)
+
+    @override_settings(
+        MAIL_QUEUE_BACKEND='patchwork.tests.test_mailqueue.FailingBackend')
+    def testDead(self):
+        self._send()
+        for i in range(3):
+            self._make_due()
+            self.assertEqual(mailqueue.deliver(), (0, 1))
+
+        queued = QueuedMail.objects.get()
+        self.assertEqual(queued.status, QueuedMail.STATUS_DEAD)
+        self.assertEqual(queued.attempts, 3)
+
+        self._make_due()
+        self.assertEqual(mailqueue.deliver(), (0, 0))
+
+    def testInterrupted(self):
+        # a worker died delivering the mail on its last attempt
+        self._send()
+        QueuedMail.objects.update(attempts=3)
+
+        self.assertEqual(mailqueue.deliver(), (0, 1))
+        self.assertEqual(len(mail.outbox), 0)
+        queued = QueuedMail.objects.get()
+        self.assertEqual(queued.status, QueuedMail.STATUS_DEAD)
+        self.assertIn('interrupted', queued.last_error)
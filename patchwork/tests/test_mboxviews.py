@@ -23,9 +23,15 @@ import datetime
 import dateutil.parser
 import dateutil.tz
 import email
+import os
+import shutil
+import tempfile
+import time
 
 from django.test import TestCase
+from django.test.utils import override_settings
 
+from patchwork import artifacts
 from patchwork.models import Patch, Comment
 from patchwork.tests.utils import defaults, create_user
 
@@ -250,3 +256,103 @@ class MboxCommentPostcriptUnchangedTest(TestCase):
         self.assertContains(response, self.txt)
         self.txt += "\n"
         self.assertNotContains(response, self.txt)
+
+
+class ArtifactCacheTest(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        override = override_settings(ARTIFACT_CACHE_DIR=self.dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        defaults.project.save()
+
+        self.person = defaults.patch_author_person
+        self.person.save()
+
+        self.patch = Patch(project=defaults.project,
+                           msgid='p1', name='testpatch',
+                           submitter=self.person, diff=defaults.patch,
+                           content='comment 1 text\nAcked-by: 1\n')
+        self.patch.save()
+
+    def _path(self, response):
+        url = response['X-Accel-Redirect']
+        self.assertTrue(url.startswith('/artifacts/'))
+        return os.path.join(self.dir, url[len('/artifacts/'):])
+
+    def _read(self, response):
+        with open(self._path(response)) as f:
+            return f.read()
+
+    def testDiff(self):
+        response = self.client.get('/patch/%d/raw/' % self.patch.id)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self._read(response), defaults.patch)
+        self.assertIn('testpatch.patch', response['Content-Disposition'])
+
+    def testMbox(self):
+        response = self.client.get('/patch/%d/mbox/' % self.patch.id)
+        self.assertEqual(response.content, b'')
+        mbox = self._read(response)
+        self.assertIn('Acked-by: 1\n', mbox)
+        self.assertIn(defaults.patch, mbox)
+
+    def testCached(self):
+        response = self.client.get('/patch/%d/mbox/' % self.patch.id)
+        path = self._path(response)
+        with open(path, 'w') as f:
+            f.write('cached')
+
+        response = self.client.get('/patch/%d/mbox/' % self.patch.id)
+        self.assertEqual(self._path(response), path)
+        self.assertEqual(self._read(response), 'cached')
+
+    def testInvalidatedByPatch(self):
+        response = self.client.get('/patch/%d/mbox/' % self.patch.id)
+        path = self._path(response)
+
+        self.patch.name = 'newpatch'
+        self.patch.save()
+
+        response = self.client.get('/patch/%d/mbox/' % self.patch.id)
+        self.assertNotEqual(self._path(response), path)
+        self.assertIn('Subject: newpatch', self._read(response))
+
+    def testInvalidatedByComment(self):
+        response = self.client.get('/patch/%d/mbox/' % self.patch.id)
+        path = self._path(response)
+
+        Comment(submission=self.patch, msgid='p2', submitter=self.person,
+                content='comment 2 text\nAcked-by: 2\n').save()
+
+        response = self.client.get('/patch/%d/mbox/' % self.patch.id)
+        self.assertNotEqual(self._path(response), path)
+        self.assertIn('Acked-by: 1\nAcked-by: 2\n', self._read(response))
+
+    @override_settings(ARTIFACT_CACHE_HEADER='X-Sendfile')
+    def testSendfile(self):
+        response = self.client.get('/patch/%d/raw/' % self.patch.id)
+        path = response['X-Sendfile']
+        self.assertTrue(path.startswith(self.dir))
+        with open(path) as f:
+            self.assertEqual(f.read(), defaults.patch)
+
+    def testPrune(self):
+        mbox = self._path(
+            self.client.get('/patch/%d/mbox/' % self.patch.id))
+        diff = self._path(
+            self.client.get('/patch/%d/raw/' % self.patch.id))
+        old = time.time() - 3600
+        os.utime(mbox, (old, old))
+
+        size = os.path.getsize(mbox) + os.path.getsize(diff)
+        self.assertEqual(artifacts.prune(size), size)
+        self.assertTrue(os.path.exists(mbox))
+
+        self.assertEqual(artifacts.prune(size - 1), os.path.getsize(diff))
+        self.assertFalse(os.path.exists(mbox))
+        self.assertTrue(os.path.exists(diff))
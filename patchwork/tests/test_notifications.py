@@ -20,14 +20,38 @@
 import datetime
 
 from django.conf import settings
+from django.contrib.sites.models import Site
 from django.core import mail
+from django.core.mail.backends import locmem
 from django.test import TestCase
+from django.test.utils import override_settings
 
-from patchwork.models import Patch, State, PatchChangeNotification, EmailOptout
+from patchwork.models import (Patch, Person, State, PatchChangeNotification,
+                              EmailOptout)
 from patchwork.tests.utils import defaults
 from patchwork.utils import send_notifications
 
 
+class RequeueEmailBackend(locmem.EmailBackend):
+    """Change every notification while a mail is being sent."""
+
+    def send_messages(self, messages):
+        PatchChangeNotification.objects.update(
+            last_modified=datetime.datetime.now())
+        return super(RequeueEmailBackend, self).send_messages(messages)
+
+
+class InterruptEmailBackend(locmem.EmailBackend):
+    """Interrupt sending once, after the first mail."""
+    interrupt = False
+
+    def send_messages(self, messages):
+        if mail.outbox and InterruptEmailBackend.interrupt:
+            InterruptEmailBackend.interrupt = False
+            raise KeyboardInterrupt()
+        return super(InterruptEmailBackend, self).send_messages(messages)
+
+
 class PatchNotificationModelTest(TestCase):
     fixtures = ['default_states']
 
@@ -108,6 +132,39 @@ class PatchNotificationModelTest(TestCase):
         self.assertEqual(notification.orig_state, oldstate)
         self.assertTrue(notification.last_modified >= orig_timestamp)
 
+    def testConcurrentChanges(self):
+        """Ensure concurrent changes keep the first original state"""
+        self.patch.save()
+        oldstate = self.patch.state
+        newstates = State.objects.exclude(pk=oldstate.pk)[:2]
+
+        patches = [Patch.objects.get(pk=self.patch.pk) for _ in range(2)]
+        for patch, state in zip(patches, newstates):
+            patch.state = state
+            patch.save()
+
+        self.assertEqual(PatchChangeNotification.objects.count(), 1)
+        notification = PatchChangeNotification.objects.all()[0]
+        self.assertEqual(notification.orig_state, oldstate)
+
+    def testPatchChangeFromDatabase(self):
+        """Ensure we detect changes to patches loaded from the database"""
+        self.patch.save()
+        oldstate = self.patch.state
+        state = State.objects.exclude(pk=oldstate.pk)[0]
+
+        patch = Patch.objects.get(pk=self.patch.pk)
+        patch.state = state
+        patch.save()
+        self.assertEqual(PatchChangeNotification.objects.count(), 1)
+        notification = PatchChangeNotification.objects.all()[0]
+        self.assertEqual(notification.orig_state, oldstate)
+
+        # a second change of an already-saved instance is still tracked
+        patch.state = oldstate
+        patch.save()
+        self.assertEqual(PatchChangeNotification.objects.count(), 0)
+
     def testProjectNotificationsDisabled(self):
         """Ensure we don't see notifications created when a project is
            configured not to send them"""
@@ -257,3 +314,68 @@ class PatchNotificationEmailTest(TestCase):
         msg = mail.outbox[0]
         self.assertIn(patches[0].get_absolute_url(), msg.body)
         self.assertIn(patches[1].get_absolute_url(), msg.body)
+
+    def testNotificationsBatched(self):
+        """Ensure the queries made don't depend on the number of
+           recipients"""
+        patches = [self.patch]
+        for i in range(3):
+            submitter = Person(email='submitter%d@example.com' % i)
+            submitter.save()
+            patches.append(Patch(project=self.project,
+                                 msgid='testpatch-%d' % i,
+                                 name='testpatch %d' % i, diff='',
+                                 submitter=submitter))
+
+        for patch in patches:
+            patch.save()
+            PatchChangeNotification(patch=patch,
+                                    orig_state=patch.state).save()
+
+        EmailOptout(email=patches[1].submitter.email).save()
+        self._expireNotifications()
+        Site.objects.clear_cache()
+
+        # the notifications, opt-outs and site, and the deletion
+        with self.assertNumQueries(4):
+            errors = send_notifications()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(PatchChangeNotification.objects.count(), 0)
+
+    @override_settings(EMAIL_BACKEND='patchwork.tests.test_notifications.'
+                       'RequeueEmailBackend')
+    def testNotificationChangedWhileSending(self):
+        PatchChangeNotification(patch=self.patch,
+                                orig_state=self.patch.state).save()
+        self._expireNotifications()
+
+        errors = send_notifications()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(mail.outbox), 1)
+        # the change is notified later
+        self.assertEqual(PatchChangeNotification.objects.count(), 1)
+
+    @override_settings(EMAIL_BACKEND='patchwork.tests.test_notifications.'
+                       'InterruptEmailBackend')
+    def testNotificationsInterrupted(self):
+        submitter = Person(email='submitter@example.com')
+        submitter.save()
+        patch = Patch(project=self.project, msgid='testpatch-2',
+                      name='testpatch 2', diff='', submitter=submitter)
+        patch.save()
+        for p in (self.patch, patch):
+            PatchChangeNotification(patch=p, orig_state=p.state).save()
+        self._expireNotifications()
+
+        InterruptEmailBackend.interrupt = True
+        with self.assertRaises(KeyboardInterrupt):
+            send_notifications()
+
+        # the notification already sent isn't sent again
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(PatchChangeNotification.objects.count(), 1)
+        send_notifications()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertNotEqual(mail.outbox[0].to, mail.outbox[1].to)
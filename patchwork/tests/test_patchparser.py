@@ -22,12 +22,15 @@ from email.mime.text import MIMEText
 from email.utils import make_msgid
 
 from django.test import TestCase
+from django.test.utils import override_settings
 
+from patchwork import instrumentation
 from patchwork.bin.parsemail import (find_content, find_author,
                                      find_project_by_header, parse_mail,
                                      split_prefixes, clean_subject)
-from patchwork.models import (Project, Person, Patch, Comment, State,
-                              get_default_initial_patch_state)
+from patchwork.models import (Project, Person, Patch, PatchFile, Comment,
+                              State, get_default_initial_patch_state)
+from patchwork.parser import patch_get_file_stats
 from patchwork.tests.utils import (read_patch, read_mail, create_email,
                                    defaults, create_user)
 
@@ -258,6 +261,20 @@ class SenderCorrelationTest(TestCase):
         self.assertEqual(new, False)
         self.assertEqual(person.id, self.person.id)
 
+    def testEmailKey(self):
+        person = Person(email='New.Sender@Example.com')
+        person.save()
+        self.assertEqual(person.email_key, 'new.sender@example.com')
+        (found, new) = find_author(self.mail('new.sender@EXAMPLE.com'))
+        self.assertEqual(found.id, person.id)
+
+    def testDuplicateEmailKey(self):
+        # older databases may hold addresses differing only in case
+        Person(email=self.existing_sender.upper()).save()
+        (person, new) = find_author(self.mail(self.existing_sender.title()))
+        self.assertEqual(new, False)
+        self.assertEqual(person.id, self.person.id)
+
     def tearDown(self):
         self.person.delete()
 
@@ -452,6 +469,15 @@ class GitRenameWithDiffTest(MBoxPatchTest):
         self.assertEqual(patch.diff.count("\nrename to "), 2)
         self.assertEqual(patch.diff.count('\n-a\n+b'), 1)
 
+    def testFileStats(self):
+        patch, _, _ = find_content(self.project, self.mail)
+        prefix = 'package/rpi-userland/rpi-userland-00'
+        self.assertEqual(patch_get_file_stats(patch.diff), [
+            (prefix + '0-add-pkgconfig-files.patch', 'R', 1, 1),
+            (prefix + '1-makefiles-cmake-vmcs.cmake-allow-to-override-'
+             'VMCS_IN.patch', 'R', 0, 0),
+        ])
+
 
 class CVSFormatPatchTest(MBoxPatchTest):
     mail_file = '0007-cvs-format-diff.mbox'
@@ -495,6 +521,15 @@ class NoNewlineAtEndOfFilePatchTest(MBoxPatchTest):
         # Confirm we got both markers
         self.assertEqual(2, patch.diff.count('\ No newline at end of file'))
 
+    def testFileStats(self):
+        patch, _, _ = find_content(self.project, self.mail)
+        prefix = 'tools/testing/selftests/powerpc/'
+        self.assertEqual(patch_get_file_stats(patch.diff), [
+            (prefix + 'Makefile', 'M', 1, 1),
+            (prefix + 'vphn/vphn.c', 'A', 1, 0),
+            (prefix + 'vphn/vphn.h', 'A', 1, 0),
+        ])
+
 
 class DelegateRequestTest(TestCase):
     fixtures = ['default_states']
@@ -510,7 +545,9 @@ class DelegateRequestTest(TestCase):
         self.p1.save()
 
     def get_email(self):
-        email = create_email(self.patch)
+        # the default project may still hold the ID of one saved by an
+        # earlier test, so saving it could overwrite this test's project
+        email = create_email(self.patch, project=self.p1)
         del email['List-ID']
         email['List-ID'] = '<' + self.p1.listid + '>'
         email['Message-Id'] = self.msgid
@@ -527,6 +564,27 @@ class DelegateRequestTest(TestCase):
         parse_mail(email)
         self._assertDelegate(self.user)
 
+    def testDelegateDifferentCase(self):
+        email = self.get_email()
+        email['X-Patchwork-Delegate'] = self.user.email.upper()
+        parse_mail(email)
+        self._assertDelegate(self.user)
+
+    def testDelegateWithoutPerson(self):
+        Person.objects.filter(user=self.user).delete()
+        email = self.get_email()
+        email['X-Patchwork-Delegate'] = self.user.email
+        parse_mail(email)
+        self._assertDelegate(self.user)
+
+    def testDelegateLinkedAddress(self):
+        person = Person(email='other@example.com', user=self.user)
+        person.save()
+        email = self.get_email()
+        email['X-Patchwork-Delegate'] = person.email
+        parse_mail(email)
+        self._assertDelegate(self.user)
+
     def testNoDelegate(self):
         email = self.get_email()
         parse_mail(email)
@@ -600,6 +658,23 @@ class InitialPatchStateTest(TestCase):
         parse_mail(email)
         self._assertState(self.default_state)
 
+    def testDefaultStateCacheInvalidated(self):
+        state = State.objects.get(ordering=0)
+        state.name = 'Renamed Default State'
+        state.save()
+        self.assertEqual(get_default_initial_patch_state().name,
+                         'Renamed Default State')
+
+    @override_settings(DEFAULT_STATE_CACHE_TIMEOUT=0)
+    def testDefaultStateCacheExpires(self):
+        # cached afresh, now that the timeout is overridden
+        self.default_state.save()
+        get_default_initial_patch_state()
+        # as another process would, so no signal is sent
+        State.objects.filter(ordering=0).update(name='Renamed Elsewhere')
+        self.assertEqual(get_default_initial_patch_state().name,
+                         'Renamed Elsewhere')
+
     def tearDown(self):
         self.p1.delete()
         self.user.delete()
@@ -633,6 +708,62 @@ class ParseInitialTagsTest(PatchTest):
             tag__name='Tested-by').count, 1)
 
 
+class ParsePatchFilesTest(PatchTest):
+    patch_filename = '0001-add-line.patch'
+
+    def setUp(self):
+        self.project.listid = 'test.example.com'
+        self.project.save()
+
+    def testFilesIndexed(self):
+        email = create_email('test comment\n' +
+                             read_patch(self.patch_filename),
+                             project=self.project)
+        parse_mail(email)
+        patch = Patch.objects.get()
+        self.assertEqual(
+            list(patch.files.values_list('path', 'change_type',
+                                         'lines_added', 'lines_removed')),
+            [('meep.text', PatchFile.CHANGE_MODIFIED, 1, 0)])
+
+
+class ParseTimingTest(PatchTest):
+    patch_filename = '0001-add-line.patch'
+    fixtures = ['default_tags', 'default_states']
+
+    def setUp(self):
+        self.project.listid = 'test.example.com'
+        self.project.save()
+        self.email = create_email('test comment\n' +
+                                  read_patch(self.patch_filename),
+                                  project=self.project)
+
+    def tearDown(self):
+        instrumentation.disable()
+
+    def testDisabled(self):
+        parse_mail(self.email)
+        self.assertFalse(instrumentation.is_enabled())
+        self.assertEqual(instrumentation.get_stats(), [])
+
+    def testStages(self):
+        instrumentation.enable()
+        parse_mail(self.email)
+
+        stats = dict((s.name, s) for s in instrumentation.get_stats())
+        for name in ('find_project', 'find_author', 'find_content',
+                     'parse_patch', 'auto_delegate', 'patch.save',
+                     'refresh_tags'):
+            self.assertEqual(stats[name].calls, 1)
+        self.assertTrue(stats['find_project'].queries > 0)
+        self.assertTrue(stats['patch.save'].queries >=
+                        stats['refresh_tags'].queries)
+
+        # one header line plus a line per stage
+        self.assertEqual(len(instrumentation.format_summary()),
+                         len(stats) + 1)
+
+
 class PrefixTest(TestCase):
 
     def testSplitPrefixes(self):
@@ -0,0 +1,97 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from collections import deque
+
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from patchwork.middleware import _queries_since, clear_profiles, \
+    get_profiles
+from patchwork.tests.utils import create_patches, create_project, create_user
+
+
+@override_settings(ENABLE_PROFILING=True,
+                   PROFILING_SAMPLE_RATES={'patch-list': 1.0, '*': 0.0})
+class ProfilingMiddlewareTest(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        clear_profiles()
+        self.project = create_project()
+        create_patches(3, project=self.project)
+        self.list_url = reverse('patch-list',
+                                kwargs={'project_id': self.project.linkname})
+
+    def testSampledView(self):
+        response = self.client.get(self.list_url)
+        self.assertEqual(response.status_code, 200)
+
+        profiles = get_profiles()
+        self.assertEqual(len(profiles), 1)
+        profile = profiles[0]
+        self.assertEqual(profile['view'], 'patch-list')
+        self.assertEqual(profile['status'], 200)
+        self.assertTrue(profile['sql_count'] > 0)
+        self.assertTrue(profile['template_time'] > 0)
+        self.assertTrue(profile['time'] >= profile['template_time'])
+        self.assertTrue(0 < len(profile['slowest_queries']) <= 5)
+        self.assertEqual(profile['slowest_queries'][0]['db'], 'default')
+
+    def testQueriesSince(self):
+        queries = [{'sql': 'SELECT %d' % i, 'time': '0.000'}
+                   for i in range(5)]
+        log = deque(queries[:3], maxlen=3)
+        self.assertEqual(_queries_since(log, None), queries[:3])
+        self.assertEqual(_queries_since(log, queries[1]), queries[2:3])
+
+        # once the log is full, each query recorded drops the oldest
+        log.extend(queries[3:])
+        self.assertEqual(_queries_since(log, queries[2]), queries[3:])
+        self.assertEqual(_queries_since(log, queries[1]), queries[2:])
+        self.assertEqual(_queries_since(log, queries[0]), queries[2:])
+
+    def testUnsampledView(self):
+        response = self.client.get(reverse('help', kwargs={'path': ''}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_profiles(), [])
+
+    @override_settings(ENABLE_PROFILING=False)
+    def testDisabled(self):
+        self.client.get(self.list_url)
+        self.assertEqual(get_profiles(), [])
+
+    def testProfilesView(self):
+        self.client.get(self.list_url)
+        url = reverse('profiling')
+
+        # staff only
+        user = create_user()
+        self.client.login(username=user.username, password=user.username)
+        response = self.client.get(url)
+        self.assertNotEqual(response.status_code, 200)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['summary'][0]['view'],
+                         'patch-list')
+        self.assertEqual(response.context['summary'][0]['count'], 1)
@@ -0,0 +1,284 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+"""Query count regression tests for the most frequently used views.
+
+Each test renders a view against a small and a large data set and
+asserts that the number of SQL queries issued does not grow with the
+number of rows, i.e. that there are no N+1 query patterns.
+"""
+
+from __future__ import absolute_import
+
+from collections import Counter
+import re
+import unittest
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.six.moves import xmlrpc_client
+
+from patchwork import fields
+from patchwork.tests.utils import (create_bundle, create_check,
+                                   create_comment, create_patches,
+                                   create_project, create_user)
+
+
+_number_re = re.compile(r'\b\d+\b')
+_in_list_re = re.compile(r'IN \((?:%s|N)(?:, (?:%s|N))*\)')
+
+
+def _normalise_sql(sql):
+    """Strip literals from a query so repeated queries can be grouped."""
+    sql = _number_re.sub('N', sql)
+    return _in_list_re.sub('IN (...)', sql)
+
+
+class QueryCountTestCase(TestCase):
+    fixtures = ['default_tags', 'default_states']
+
+    # the number of rows in the "small" and "large" data sets
+    small_count = 10
+    large_count = 1000
+
+    def assertQueryCountConstant(self, small_fn, large_fn, grow_fn=None):
+        """Assert that two callables issue the same number of queries.
+
+        The small callable is run once beforehand so that any caches
+        (sessions, sites, content types, ...) are already populated.
+        If given, grow_fn is run between the two measurements to grow
+        the data set. On failure, the queries issued more often for the
+        large data set are reported.
+        """
+        small_fn()
+
+        with CaptureQueriesContext(connection) as small_queries:
+            small_fn()
+        if grow_fn:
+            grow_fn()
+        with CaptureQueriesContext(connection) as large_queries:
+            large_fn()
+
+        if len(small_queries) == len(large_queries):
+            return
+
+        small = Counter(_normalise_sql(q['sql']) for q in small_queries)
+        large = Counter(_normalise_sql(q['sql']) for q in large_queries)
+
+        lines = ['%d queries for the small data set, %d for the large '
+                 'data set. Queries issued more often for the large data '
+                 'set:' % (len(small_queries), len(large_queries))]
+        for sql, count in large.most_common():
+            if count != small[sql]:
+                lines.append('  %dx (was %dx): %s' % (count, small[sql], sql))
+
+        self.fail('\n'.join(lines))
+
+
+class PatchQueryCountTest(QueryCountTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.data = {}
+
+        for size in ('small', 'large'):
+            count = getattr(cls, '%s_count' % size)
+
+            project = create_project()
+            patches = create_patches(count, project=project,
+                                     delegate=cls.user)
+            for patch in patches:
+                create_comment(patch)
+                create_check(patch, cls.user)
+
+            detail = create_patches(1, project=project)[0]
+            for i in range(count):
+                create_comment(detail)
+                create_check(detail, cls.user, context='ctx-%d' % i)
+
+            bundle = create_bundle(cls.user, project, patches,
+                                   name='bundle-%s' % size, public=True)
+
+            cls.data[size] = {
+                'project': project,
+                'detail': detail,
+                'bundle': bundle,
+            }
+
+    def _get(self, size, view, kwargs):
+        def fn():
+            response = self.client.get(reverse(view, kwargs=kwargs(size)))
+            self.assertEqual(response.status_code, 200)
+        return fn
+
+    def _assertViewQueryCountConstant(self, view, kwargs):
+        self.assertQueryCountConstant(
+            self._get('small', view, kwargs),
+            self._get('large', view, kwargs))
+
+    # anonymous list pages are otherwise served from the page cache
+    @override_settings(LIST_CACHE_TIMEOUT=0)
+    def testPatchList(self):
+        self._assertViewQueryCountConstant(
+            'patch-list',
+            lambda size: {'project_id': self.data[size]['project'].linkname})
+
+    def testPatchListAuthenticated(self):
+        self.client.login(username=self.user.username,
+                          password=self.user.username)
+        self.testPatchList()
+
+    def testPatchDetail(self):
+        self._assertViewQueryCountConstant(
+            'patch-detail',
+            lambda size: {'patch_id': self.data[size]['detail'].id})
+
+    def testPatchMbox(self):
+        self._assertViewQueryCountConstant(
+            'patch-mbox',
+            lambda size: {'patch_id': self.data[size]['detail'].id})
+
+    def testBundleMbox(self):
+        self._assertViewQueryCountConstant(
+            'bundle-mbox',
+            lambda size: {'username': self.user.username,
+                          'bundlename': self.data[size]['bundle'].name})
+
+    def testTodoList(self):
+        self.client.login(username=self.user.username,
+                          password=self.user.username)
+        self._assertViewQueryCountConstant(
+            'user-todo',
+            lambda size: {'project_id': self.data[size]['project'].linkname})
+
+    @unittest.skipUnless(settings.ENABLE_XMLRPC,
+                         'requires xmlrpc interface (use the ENABLE_XMLRPC '
+                         'setting)')
+    def testXMLRPCPatchList(self):
+        self._assertXMLRPCQueryCountConstant('patch_list', lambda size: (
+            {'project_id': self.data[size]['project'].id},))
+
+    @unittest.skipUnless(settings.ENABLE_XMLRPC,
+                         'requires xmlrpc interface (use the ENABLE_XMLRPC '
+                         'setting)')
+    def testXMLRPCCheckList(self):
+        self._assertXMLRPCQueryCountConstant('check_list', lambda size: (
+            {'project_id': self.data[size]['project'].id},))
+
+    def _assertXMLRPCQueryCountConstant(self, method, params):
+        def call(size):
+            def fn():
+                response = self.client.post(
+                    reverse('xmlrpc'),
+                    xmlrpc_client.dumps(params(size), method),
+                    content_type='text/xml')
+                result = xmlrpc_client.loads(response.content)[0][0]
+                self.assertTrue(len(result) >= self.small_count)
+            return fn
+
+        self.assertQueryCountConstant(call('small'), call('large'))
+
+
+class BlobQueryCountTest(QueryCountTestCase):
+    """Views of patches whose diffs and comments are in the blob store."""
+
+    small_count = 3
+    large_count = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user()
+        cls.data = {}
+
+        def value(size, i):
+            return ('%s-%d ' % (size, i)) * settings.BLOB_MIN_LENGTH
+
+        for size in ('small', 'large'):
+            count = getattr(cls, '%s_count' % size)
+
+            project = create_project()
+            patches = create_patches(count, project=project)
+            for i, patch in enumerate(patches):
+                patch.diff = value(size, i)
+                patch.save()
+
+            detail = patches[0]
+            for i in range(count):
+                create_comment(detail, content=value(size, i))
+
+            bundle = create_bundle(cls.user, project, patches,
+                                   name='bundle-%s' % size, public=True)
+            cls.data[size] = {'detail': detail, 'bundle': bundle}
+
+    def _get(self, size, view, kwargs):
+        def fn():
+            # every blob is loaded from the database each time
+            fields.clear_blob_cache()
+            response = self.client.get(reverse(view, kwargs=kwargs(size)))
+            self.assertEqual(response.status_code, 200)
+        return fn
+
+    def _assertViewQueryCountConstant(self, view, kwargs):
+        self.assertQueryCountConstant(
+            self._get('small', view, kwargs),
+            self._get('large', view, kwargs))
+
+    def testPatchDetail(self):
+        self._assertViewQueryCountConstant(
+            'patch-detail',
+            lambda size: {'patch_id': self.data[size]['detail'].id})
+
+    def testPatchMbox(self):
+        self._assertViewQueryCountConstant(
+            'patch-mbox',
+            lambda size: {'patch_id': self.data[size]['detail'].id})
+
+    def testBundleMbox(self):
+        self._assertViewQueryCountConstant(
+            'bundle-mbox',
+            lambda size: {'username': self.user.username,
+                          'bundlename': self.data[size]['bundle'].name})
+
+
+class TodoListsQueryCountTest(QueryCountTestCase):
+
+    def setUp(self):
+        self.user = create_user()
+        self.client.login(username=self.user.username,
+                          password=self.user.username)
+
+    def _create_todo_projects(self, count):
+        for i in range(count):
+            create_patches(1, project=create_project(), delegate=self.user)
+
+    def testTodoLists(self):
+        url = reverse('user-todos')
+
+        def fn():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+        self._create_todo_projects(self.small_count)
+        self.assertQueryCountConstant(
+            fn, fn, lambda: self._create_todo_projects(
+                self.large_count - self.small_count))
@@ -0,0 +1,140 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from django.contrib.sessions.models import Session
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import override_settings
+from django.utils.six.moves import xmlrpc_client
+
+from patchwork import routers
+from patchwork.middleware import ReplicaMiddleware
+from patchwork.models import Patch
+from patchwork.tests.utils import create_project
+
+
+def _view(request):
+    return HttpResponse()
+
+
+@routers.use_primary
+def _primary_view(request):
+    return HttpResponse()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+
+    def testPrimaryByDefault(self):
+        self.assertEqual(self.router.db_for_read(Patch), None)
+
+    def testUseReplicas(self):
+        with routers.use_replicas():
+            self.assertEqual(self.router.db_for_read(Patch), 'replica')
+            with routers.use_replicas(False):
+                self.assertEqual(self.router.db_for_read(Patch), None)
+            self.assertEqual(self.router.db_for_read(Patch), 'replica')
+        self.assertEqual(self.router.db_for_read(Patch), None)
+
+    def testSessions(self):
+        with routers.use_replicas():
+            self.assertEqual(self.router.db_for_read(Session), 'default')
+
+    def testWrite(self):
+        patch = Patch()
+        self.assertEqual(self.router.db_for_write(Patch, instance=patch),
+                         None)
+        patch._state.db = 'replica'
+        self.assertEqual(self.router.db_for_write(Patch, instance=patch),
+                         'default')
+
+    def testAllowMigrate(self):
+        self.assertEqual(self.router.allow_migrate('default', 'patchwork'),
+                         None)
+        self.assertFalse(self.router.allow_migrate('replica', 'patchwork'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaMiddlewareTest(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = ReplicaMiddleware()
+
+    def tearDown(self):
+        routers.set_replica(None)
+
+    def _request(self, request, view=_view):
+        self.middleware.process_request(request)
+        self.middleware.process_view(request, view, (), {})
+        replica = routers.get_replica()
+        response = self.middleware.process_response(request, view(request))
+        self.assertEqual(routers.get_replica(), None)
+        return replica, routers.PIN_COOKIE in response.cookies
+
+    def testGet(self):
+        self.assertEqual(self._request(self.factory.get('/')),
+                         ('replica', False))
+
+    def testPinned(self):
+        request = self.factory.get('/')
+        request.COOKIES[routers.PIN_COOKIE] = '1'
+        self.assertEqual(self._request(request), (None, False))
+
+    def testPrimaryView(self):
+        self.assertEqual(self._request(self.factory.get('/'), _primary_view),
+                         (None, False))
+
+    def testPost(self):
+        self.assertEqual(self._request(self.factory.post('/')),
+                         (None, True))
+
+    def testReadOnlyPost(self):
+        request = self.factory.post('/')
+        request.replica_read_only = True
+        self.assertEqual(self._request(request), (None, False))
+
+
+# the primary stands in as a replica, as the test database has no others
+@override_settings(DATABASE_REPLICAS=['default'], ENABLE_XMLRPC=True)
+class ReplicaRequestTest(TestCase):
+    fixtures = ['default_states']
+
+    def testList(self):
+        project = create_project()
+        response = self.client.get(
+            reverse('patch-list', kwargs={'project_id': project.linkname}))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(routers.PIN_COOKIE in response.cookies)
+
+    def testAnonymousXMLRPC(self):
+        response = self.client.post(
+            reverse('xmlrpc'), xmlrpc_client.dumps((), 'pw_rpc_version'),
+            content_type='text/xml')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(routers.PIN_COOKIE in response.cookies)
+
+    def testLogin(self):
+        response = self.client.post(reverse('auth_login'), {
+            'username': 'nobody', 'password': 'nobody'})
+        self.assertTrue(routers.PIN_COOKIE in response.cookies)
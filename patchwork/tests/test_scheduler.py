@@ -0,0 +1,159 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+
+import datetime
+import logging
+
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.six import StringIO
+
+from patchwork import scheduler
+from patchwork.models import PatchChangeNotification, ScheduledJob
+from patchwork.tests.utils import create_patches
+
+
+class SchedulerTest(TestCase):
+
+    def setUp(self):
+        self.runs = 0
+        self.job = scheduler.Job('test', self.func, 60, 3600)
+
+    def func(self):
+        self.runs += 1
+
+    def _row(self):
+        return ScheduledJob.objects.get(name='test')
+
+    def testRun(self):
+        # new jobs are run straight away
+        locked_until = scheduler.claim(self.job)
+        self.assertTrue(locked_until)
+        self.assertEqual(self._row().locked_until, locked_until)
+
+        # but not twice at once
+        self.assertFalse(scheduler.claim(self.job, force=True))
+
+        self.assertIsNone(scheduler.run(self.job, locked_until))
+        self.assertEqual(self.runs, 1)
+        row = self._row()
+        self.assertIsNone(row.locked_until)
+        self.assertTrue(row.last_succeeded)
+        self.assertIsNotNone(row.last_duration)
+        delay = (row.next_run - row.last_run).total_seconds()
+        self.assertTrue(60 <= delay <= 66)
+
+        # the next run isn't due yet
+        self.assertFalse(scheduler.claim(self.job))
+        self.assertTrue(scheduler.claim(self.job, force=True))
+
+    def testDue(self):
+        ScheduledJob.objects.create(
+            name='test',
+            next_run=datetime.datetime.now() - datetime.timedelta(seconds=1))
+        self.assertTrue(scheduler.claim(self.job))
+
+    def testLockExpired(self):
+        self.assertTrue(scheduler.claim(self.job))
+
+        # the scheduler running the job died
+        ScheduledJob.objects.update(
+            locked_until=datetime.datetime.now() -
+            datetime.timedelta(seconds=1))
+        self.assertTrue(scheduler.claim(self.job, force=True))
+
+    def testLockTakenOver(self):
+        locked_until = scheduler.claim(self.job)
+        ScheduledJob.objects.update(
+            locked_until=datetime.datetime.now() -
+            datetime.timedelta(seconds=1))
+        other = scheduler.claim(self.job, force=True)
+        self.assertTrue(other)
+
+        # the first run finishing leaves the second run's lock alone
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        scheduler.run(self.job, locked_until)
+        self.assertEqual(self._row().locked_until, other)
+        self.assertIsNone(self._row().last_run)
+
+        scheduler.run(self.job, other)
+        self.assertIsNone(self._row().locked_until)
+        self.assertIsNotNone(self._row().last_run)
+
+    def testFailure(self):
+        def fail():
+            raise ValueError('test failure')
+
+        job = scheduler.Job('test', fail, 60, 3600)
+        locked_until = scheduler.claim(job)
+        self.assertTrue(locked_until)
+
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.assertEqual(scheduler.run(job, locked_until),
+                         'ValueError: test failure')
+
+        row = self._row()
+        self.assertIsNone(row.locked_until)
+        self.assertFalse(row.last_succeeded)
+        self.assertEqual(row.last_error, 'ValueError: test failure')
+
+    def testRegister(self):
+        scheduler.register('test', interval=60)(self.func)
+        self.addCleanup(scheduler._jobs.pop, 'test')
+        self.assertIn('test', [job.name for job in scheduler.jobs()])
+
+        with override_settings(SCHEDULER_INTERVALS={'test': 0}):
+            self.assertNotIn('test', [job.name for job in scheduler.jobs()])
+
+
+@override_settings(MAIL_QUEUE_CONCURRENCY=1)
+class CronTest(TestCase):
+    fixtures = ['default_states']
+
+    def testCron(self):
+        patch = create_patches()[0]
+        PatchChangeNotification.objects.create(
+            patch=patch, orig_state=patch.state,
+            last_modified=datetime.datetime.now() -
+            datetime.timedelta(days=1))
+
+        call_command('cron', stderr=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(
+            set(ScheduledJob.objects.values_list('name', flat=True)),
+            set(job.name for job in scheduler.jobs()))
+        self.assertTrue(all(ScheduledJob.objects.values_list(
+            'last_succeeded', flat=True)))
+
+    def testSchedulerSkipsLocked(self):
+        ScheduledJob.objects.create(
+            name='notifications',
+            locked_until=datetime.datetime.now() +
+            datetime.timedelta(hours=1))
+
+        call_command('scheduler', once=True, stderr=StringIO())
+        self.assertTrue(ScheduledJob.objects.get(
+            name='expiry').last_succeeded)
+        self.assertIsNone(ScheduledJob.objects.get(
+            name='notifications').last_run)
@@ -0,0 +1,124 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import unittest
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from patchwork.models import PatchBucket
+from patchwork.similarity import BANDS, diff_buckets, diff_shingles
+from patchwork.tests import utils
+from patchwork.views import xmlrpc as xmlrpc_views
+
+
+def _make_diff(lines, context='context', offset=1, indent='    '):
+    diff = ['diff --git a/drivers/foo.c b/drivers/foo.c',
+            '--- a/drivers/foo.c',
+            '+++ b/drivers/foo.c',
+            '@@ -%d,%d +%d,%d @@' % (offset, len(lines) + 1,
+                                     offset, len(lines) + 1),
+            ' %s' % context]
+    diff += ['-%sold_value_%d = %d;' % (indent, i, i) for i in lines]
+    diff += ['+%snew_value_%d = %d;' % (indent, i, i) for i in lines]
+    return '\n'.join(diff) + '\n'
+
+
+class DiffBucketsTest(unittest.TestCase):
+
+    def testRebasedResend(self):
+        diff = _make_diff(range(10))
+        resend = _make_diff(range(10), context='other context', offset=100,
+                            indent='\t ')
+        self.assertEqual(diff_shingles(diff), diff_shingles(resend))
+        self.assertEqual(diff_buckets(diff), diff_buckets(resend))
+        self.assertEqual(len(diff_buckets(diff)), BANDS)
+
+    def testSimilar(self):
+        # a Jaccard similarity of 0.9 shares a bucket with near certainty
+        diff = set(diff_buckets(_make_diff(range(19))))
+        revision = set(diff_buckets(_make_diff(range(20))))
+        self.assertTrue(diff & revision)
+
+    def testDissimilar(self):
+        diff = set(diff_buckets(_make_diff(range(20))))
+        other = set(diff_buckets(_make_diff(range(100, 120))))
+        self.assertFalse(diff & other)
+
+    def testEmpty(self):
+        self.assertEqual(diff_buckets(''), [])
+        self.assertEqual(diff_buckets(_make_diff([])), [])
+
+
+class SimilarPatchesTest(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        self.project = utils.create_project()
+        self.patches = utils.create_patches(4, project=self.project)
+        diffs = [_make_diff(range(20)), _make_diff(range(100, 120)),
+                 _make_diff(range(19)), _make_diff(range(20))]
+        for patch, diff in zip(self.patches, diffs):
+            patch.diff = diff
+            patch.save()
+            patch.refresh_buckets()
+
+    def testSimilarPatches(self):
+        self.assertEqual(list(self.patches[3].similar_patches()),
+                         [self.patches[0], self.patches[2]])
+        self.assertEqual(list(self.patches[3].similar_patches(1)),
+                         [self.patches[0]])
+
+    def testOnlyEarlierPatches(self):
+        self.assertEqual(list(self.patches[0].similar_patches()), [])
+
+    def testOnlySameProject(self):
+        other = utils.create_patches(project=utils.create_project())[0]
+        other.diff = self.patches[0].diff
+        other.save()
+        other.refresh_buckets()
+        self.assertEqual(list(other.similar_patches()), [])
+
+    def testPatchView(self):
+        response = self.client.get(
+            reverse('patch-detail', kwargs={'patch_id': self.patches[2].id}))
+        self.assertEqual(list(response.context['similar_patches']),
+                         [self.patches[0]])
+        self.assertContains(response, reverse(
+            'patch-detail', kwargs={'patch_id': self.patches[0].id}))
+
+    @unittest.skipUnless(settings.ENABLE_XMLRPC,
+                         'requires xmlrpc interface (use the ENABLE_XMLRPC '
+                         'setting)')
+    def testXMLRPC(self):
+        patches = xmlrpc_views.patch_list_similar(self.patches[3].id)
+        self.assertEqual([patch['id'] for patch in patches],
+                         [self.patches[0].id, self.patches[2].id])
+        self.assertEqual(xmlrpc_views.patch_list_similar(-1), [])
+
+    def testIndexSimilarityCommand(self):
+        PatchBucket.objects.all().delete()
+        call_command('indexsimilarity', processes=1, batch_size=3,
+                     stdout=StringIO())
+        self.assertEqual(PatchBucket.objects.count(), 4 * BANDS)
+        self.assertEqual(list(self.patches[3].similar_patches()),
+                         [self.patches[0], self.patches[2]])
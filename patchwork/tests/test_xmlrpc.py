@@ -21,10 +21,14 @@ import unittest
 
 from django.conf import settings
 from django.core.urlresolvers import reverse
-from django.test import LiveServerTestCase
+from django.db import connection
+from django.test import LiveServerTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.six.moves import xmlrpc_client
 
+from patchwork.models import APIToken, Check, Patch, State
 from patchwork.tests import utils
+from patchwork.views import xmlrpc as xmlrpc_views
 
 
 @unittest.skipUnless(settings.ENABLE_XMLRPC,
@@ -64,3 +68,256 @@ class XMLRPCTest(LiveServerTestCase):
         patches = self.rpc.patch_list({'max_count': -1})
         self.assertEqual(len(patches), 1)
         self.assertEqual(patches[0]['id'], patch_objs[-1].id)
+
+
+@unittest.skipUnless(settings.ENABLE_XMLRPC,
+                     'requires xmlrpc interface (use the ENABLE_XMLRPC '
+                     'setting)')
+class XMLRPCListTest(TestCase):
+    """Test the list methods, which don't serialize model instances."""
+    fixtures = ['default_states']
+
+    def setUp(self):
+        self.user = utils.create_user()
+        self.patches = utils.create_patches(5, delegate=self.user)
+        for patch in self.patches:
+            utils.create_check(patch, self.user)
+
+    def testPatchList(self):
+        with self.assertNumQueries(1):
+            patches = xmlrpc_views.patch_list(
+                {'project_id': self.patches[0].project_id})
+        self.assertEqual(patches, [xmlrpc_views.patch_to_dict(patch)
+                                   for patch in self.patches])
+
+    def testPatchListNegativeMaxCount(self):
+        with self.assertNumQueries(1):
+            patches = xmlrpc_views.patch_list({'max_count': -2})
+        self.assertEqual([patch['id'] for patch in patches],
+                         [patch.id for patch in self.patches[-2:]])
+
+    def testCheckList(self):
+        with self.assertNumQueries(1):
+            checks = xmlrpc_views.check_list(
+                {'project_id': self.patches[0].project_id, 'max_count': -2})
+        self.assertEqual(checks, [
+            xmlrpc_views.check_to_dict(check)
+            for check in Check.objects.order_by('id')[3:]])
+
+    def testPersonList(self):
+        person = self.patches[0].submitter
+        with self.assertNumQueries(1):
+            people = xmlrpc_views.person_list(person.email)
+        self.assertEqual(people, [xmlrpc_views.person_to_dict(person)])
+
+    def testProjectList(self):
+        project = self.patches[0].project
+        with self.assertNumQueries(1):
+            projects = xmlrpc_views.project_list(project.linkname, -1)
+        self.assertEqual(projects, [xmlrpc_views.project_to_dict(project)])
+
+    def testPatchListByPath(self):
+        self.patches[1].files.update(path='drivers/net/foo.c')
+        self.patches[3].files.update(path='drivers/net/bar.c')
+        self.patches[3].archived = True
+        self.patches[3].save()
+
+        with self.assertNumQueries(1):
+            patches = xmlrpc_views.patch_list_by_path('drivers/net/')
+        self.assertEqual([patch['id'] for patch in patches],
+                         [self.patches[1].id, self.patches[3].id])
+
+        patches = xmlrpc_views.patch_list_by_path('drivers/net/',
+                                                  {'archived': False})
+        self.assertEqual([patch['id'] for patch in patches],
+                         [self.patches[1].id])
+
+    def testPatchFileList(self):
+        with self.assertNumQueries(1):
+            files = xmlrpc_views.patch_file_list(self.patches[0].id)
+        self.assertEqual(files, [{'path': '', 'change_type': 'added',
+                                  'lines_added': 1, 'lines_removed': 0}])
+
+
+@unittest.skipUnless(settings.ENABLE_XMLRPC,
+                     'requires xmlrpc interface (use the ENABLE_XMLRPC '
+                     'setting)')
+class XMLRPCTokenTest(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        self.patch = utils.create_patches()[0]
+        self.user = utils.create_maintainer(self.patch.project)
+        self.token = APIToken.generate(self.user)
+
+    def tearDown(self):
+        xmlrpc_views._token_cache.clear()
+
+    def _call(self, token, method='check_create', params=None):
+        if params is None:
+            params = (self.patch.id, 'ci', 'success')
+        response = self.client.post(
+            reverse('xmlrpc'), xmlrpc_client.dumps(params, method),
+            content_type='text/xml', HTTP_AUTHORIZATION='Bearer ' + token)
+        return xmlrpc_client.loads(response.content)[0][0]
+
+    def testToken(self):
+        self._call(self.token)
+        check = Check.objects.get(patch=self.patch)
+        self.assertEqual(check.user, self.user)
+
+    def testTokenNotStored(self):
+        self.assertFalse(APIToken.objects.filter(digest=self.token).exists())
+        self.assertFalse(APIToken.objects.filter(prefix=self.token).exists())
+
+    def testInvalidToken(self):
+        self.assertRaises(xmlrpc_client.Fault, self._call,
+                          self.token[:-1] + '-')
+        self.assertFalse(Check.objects.exists())
+
+    def testInactiveUser(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertRaises(xmlrpc_client.Fault, self._call, self.token)
+
+    def testCachedToken(self):
+        self._call(self.token)
+        with CaptureQueriesContext(connection) as queries:
+            self._call(self.token)
+        self.assertFalse([q for q in queries
+                          if APIToken._meta.db_table in q['sql']])
+        self.assertEqual(Check.objects.count(), 2)
+
+    def testRevokedToken(self):
+        self._call(self.token)
+        APIToken.objects.get(user=self.user).delete()
+        self.assertRaises(xmlrpc_client.Fault, self._call, self.token)
+
+    def testCreateTokenView(self):
+        self.client.login(username=self.user.username,
+                          password=self.user.username)
+        response = self.client.post(reverse('user-token-create'),
+                                    {'name': 'ci'})
+        token = response.context['token']
+        self.assertContains(response, token)
+        self.assertEqual(APIToken.authenticate(token), self.user)
+        self.assertEqual(APIToken.objects.get(prefix=token[:8]).name, 'ci')
+
+        response = self.client.get(reverse('user-profile'))
+        self.assertContains(response, token[:8])
+        self.assertNotContains(response, token)
+
+    def testDeleteTokenView(self):
+        other = utils.create_user()
+        self.client.login(username=other.username, password=other.username)
+        api_token = APIToken.objects.get(user=self.user)
+        url = reverse('user-token-delete', kwargs={'token_id': api_token.id})
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, 404)
+
+        self.client.login(username=self.user.username,
+                          password=self.user.username)
+        self.client.post(url)
+        self.assertFalse(APIToken.objects.exists())
+
+
+@unittest.skipUnless(settings.ENABLE_XMLRPC,
+                     'requires xmlrpc interface (use the ENABLE_XMLRPC '
+                     'setting)')
+class XMLRPCBatchTest(TestCase):
+    fixtures = ['default_states']
+
+    def setUp(self):
+        self.patches = utils.create_patches(3)
+        self.user = utils.create_maintainer(self.patches[0].project)
+        self.token = APIToken.generate(self.user)
+
+    def tearDown(self):
+        xmlrpc_views._token_cache.clear()
+
+    def _call(self, method, params, auth=True):
+        extra = {}
+        if auth:
+            extra['HTTP_AUTHORIZATION'] = 'Bearer ' + self.token
+        response = self.client.post(
+            reverse('xmlrpc'), xmlrpc_client.dumps(params, method),
+            content_type='text/xml', **extra)
+        return xmlrpc_client.loads(response.content)[0][0]
+
+    def _multicall(self, calls, auth=True):
+        return self._call('system.multicall', ([
+            {'methodName': method, 'params': params}
+            for method, params in calls],), auth)
+
+    def testMulticall(self):
+        results = self._multicall([
+            ('patch_get', [self.patches[0].id]),
+            ('no_such_method', []),
+            ('patch_get', [self.patches[1].id]),
+        ])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0][0]['id'], self.patches[0].id)
+        self.assertEqual(results[1]['faultCode'], 1)
+        self.assertEqual(results[2][0]['id'], self.patches[1].id)
+
+    def testMulticallAuth(self):
+        calls = [
+            ('patch_get', [self.patches[0].id]),
+            ('check_create', [self.patches[0].id, 'ci', 'success']),
+        ]
+
+        # calls requiring authentication fail without credentials...
+        results = self._multicall(calls, auth=False)
+        self.assertEqual(results[0][0]['id'], self.patches[0].id)
+        self.assertEqual(results[1]['faultCode'], 1)
+        self.assertFalse(Check.objects.exists())
+
+        # ...but succeed with them, which are verified only once
+        calls.append(('check_create', [self.patches[1].id, 'ci', 'fail']))
+        with CaptureQueriesContext(connection) as queries:
+            results = self._multicall(calls)
+        self.assertEqual(results[1:], [[True], [True]])
+        self.assertEqual(len([q for q in queries
+                              if APIToken._meta.db_table in q['sql']]), 1)
+        self.assertEqual(Check.objects.count(), 2)
+
+    def testPatchGetMulti(self):
+        ids = [self.patches[2].id, -1, self.patches[0].id]
+        patches = self._call('patch_get_multi', (ids,))
+        self.assertEqual(patches[0]['id'], self.patches[2].id)
+        self.assertEqual(patches[1], {})
+        self.assertEqual(patches[2]['id'], self.patches[0].id)
+
+    def testPatchGetMboxMulti(self):
+        ids = [self.patches[1].id, -1]
+        mboxes = self._call('patch_get_mbox_multi', (ids,))
+        self.assertIn(self.patches[1].msgid, mboxes[0])
+        self.assertEqual(mboxes[1], '')
+
+    def testPatchSetMulti(self):
+        state = State.objects.exclude(pk=self.patches[0].state_id)[0]
+        ids = [patch.id for patch in self.patches]
+        self.assertTrue(self._call('patch_set_multi',
+                                   (ids, {'state': state.id})))
+        self.assertEqual(Patch.objects.filter(state=state).count(), 3)
+
+    def testPatchSetMultiNotEditable(self):
+        other = utils.create_patches(1, project=utils.create_project())[0]
+        ids = [self.patches[0].id, other.id]
+        self.assertRaises(xmlrpc_client.Fault, self._call,
+                          'patch_set_multi', (ids, {'archived': True}))
+        self.assertFalse(Patch.objects.filter(archived=True).exists())
+
+    def testCheckCreateMulti(self):
+        checks = [{'patch_id': patch.id, 'context': 'ci', 'state': 'success'}
+                  for patch in self.patches]
+        self.assertTrue(self._call('check_create_multi', (checks,)))
+        self.assertEqual(Check.objects.count(), 3)
+
+    def testCheckCreateMultiInvalid(self):
+        checks = [{'patch_id': patch.id, 'context': 'ci', 'state': 'success'}
+                  for patch in self.patches]
+        checks[-1]['state'] = 'invalid'
+        self.assertRaises(xmlrpc_client.Fault, self._call,
+                          'check_create_multi', (checks,))
+        self.assertFalse(Check.objects.exists())
@@ -26,7 +26,8 @@ import os
 
 from django.contrib.auth.models import User
 
-from patchwork.models import Project, Person, Patch
+from patchwork.models import (Bundle, Check, Comment, Patch, Person,
+                              Project)
 
 
 # helper functions for tests
@@ -86,25 +87,88 @@ def create_maintainer(project):
     return user
 
 
-def create_patches(count=1):
-    """Create 'count' unique patches."""
-    defaults.project.save()
+_project_idx = 1
+
+
+def create_project(**kwargs):
+    global _project_idx
+    linkname = 'test-project-%d' % _project_idx
+    _project_idx += 1
+
+    values = {
+        'linkname': linkname,
+        'name': linkname,
+        'listid': '%s.example.com' % linkname,
+        'listemail': '%s@example.com' % linkname,
+    }
+    values.update(kwargs)
+
+    project = Project(**values)
+    project.save()
+
+    return project
+
+
+def create_patches(count=1, project=None, **kwargs):
+    """Create 'count' unique patches.
+
+    Additional keyword arguments are set on each patch.
+    """
+    if project is None:
+        project = defaults.project
+        project.save()
     defaults.patch_author_person.save()
 
     patches = []
 
     for i in range(0, count):
-        patch = Patch(project=defaults.project,
+        patch = Patch(project=project,
                       submitter=defaults.patch_author_person,
                       msgid=make_msgid(),
                       name='testpatch%d' % (i + 1),
-                      diff=defaults.patch)
+                      diff=defaults.patch,
+                      **kwargs)
         patch.save()
         patches.append(patch)
 
     return patches
 
 
+def create_comment(submission, submitter=None, content=None):
+    if submitter is None:
+        submitter = defaults.patch_author_person
+        submitter.save()
+    if content is None:
+        content = 'Acked-by: %s' % submitter
+
+    comment = Comment(submission=submission, submitter=submitter,
+                      msgid=make_msgid(), content=content)
+    comment.save()
+
+    return comment
+
+
+def create_check(patch, user, state=Check.STATE_SUCCESS,
+                 context='jenkins-ci'):
+    check = Check(patch=patch, user=user, state=state,
+                  target_url='http://example.com/', description='',
+                  context=context)
+    check.save()
+
+    return check
+
+
+def create_bundle(owner, project, patches=(), name='testbundle',
+                  public=False):
+    bundle = Bundle(owner=owner, project=project, name=name, public=public)
+    bundle.save()
+
+    for patch in patches:
+        bundle.append_patch(patch)
+
+    return bundle
+
+
 def find_in_context(context, key):
     if isinstance(context, list):
         for c in context:
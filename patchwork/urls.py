@@ -28,6 +28,7 @@ from patchwork.views import bundle as bundle_views
 from patchwork.views import help as help_views
 from patchwork.views import mail as mail_views
 from patchwork.views import patch as patch_views
+from patchwork.views import profiling as profiling_views
 from patchwork.views import project as project_views
 from patchwork.views import pwclient as pwclient_views
 from patchwork.views import user as user_views
@@ -70,6 +71,11 @@ urlpatterns = [
     url(r'^user/unlink/(?P<person_id>[^/]+)/$', user_views.unlink,
         name='user-unlink'),
 
+    url(r'^user/tokens/new/$', user_views.token_create,
+        name='user-token-create'),
+    url(r'^user/tokens/(?P<token_id>\d+)/delete/$', user_views.token_delete,
+        name='user-token-delete'),
+
     # password change
     url(r'^user/password-change/$', auth_views.password_change,
         name='password_change'),
@@ -113,6 +119,10 @@ urlpatterns = [
     url(r'^submitter/$', api_views.submitters, name='api-submitters'),
     url(r'^delegate/$', api_views.delegates, name='api-delegates'),
 
+    # event feed
+    url(r'^events/$', api_views.events, name='api-events'),
+    url(r'^events/wait/$', api_views.events_wait, name='api-events-wait'),
+
     # email setup
     url(r'^mail/$', mail_views.settings, name='mail-settings'),
     url(r'^mail/optout/$', mail_views.optout, name='mail-optout'),
@@ -120,6 +130,9 @@ urlpatterns = [
 
     # help!
     url(r'^help/(?P<path>.*)$', help_views.help, name='help'),
+
+    # request profiling
+    url(r'^profiling/$', profiling_views.profiles, name='profiling'),
 ]
 
 if 'debug_toolbar' in settings.INSTALLED_APPS:
@@ -25,89 +25,311 @@ import itertools
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
-from django.core.mail import EmailMessage
-from django.db.models import Count, Q, F
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction
+from django.db.models import Count, Q, F, Max, Min
 
+from patchwork import notify
 from patchwork.compat import render_to_string
 from patchwork.models import (PatchChangeNotification, EmailOptout,
-                              EmailConfirmation)
+                              EmailConfirmation, Event, Person, UserProfile,
+                              ArchivePolicy, Patch, Project, normalize_email)
+
+
+# the number of delivered notifications deleted at once
+NOTIFICATION_DELETE_BATCH_SIZE = 10
 
 
 def send_notifications():
     date_limit = datetime.datetime.now() - datetime.timedelta(
         minutes=settings.NOTIFICATION_DELAY_MINUTES)
 
-    # We delay sending notifications to a user if they have other
-    # notifications that are still in the "pending" state. To do this,
-    # we compare the total number of patch change notifications queued
-    # for each user against the number of "ready" notifications.
-    qs = PatchChangeNotification.objects.all()
-    qs2 = PatchChangeNotification.objects\
-        .filter(last_modified__lt=date_limit)\
-        .values('patch__submitter')\
-        .annotate(count=Count('patch__submitter'))
-    qs2 = {elem['patch__submitter']: elem['count'] for elem in qs2}
+    # fetch every notification along with everything the mails show, but
+    # not the bulky columns of the patches
+    qs = PatchChangeNotification.objects.select_related(
+        'orig_state', 'patch__state', 'patch__submitter', 'patch__project')
+    qs = qs.defer('patch__diff', 'patch__content', 'patch__headers')
 
     groups = itertools.groupby(qs.order_by('patch__submitter'),
                                lambda n: n.patch.submitter)
 
-    errors = []
-
+    # We delay sending notifications to a user if they have other
+    # notifications that are still in the "pending" state.
+    ready = []
     for (recipient, notifications) in groups:
         notifications = list(notifications)
+        if all(n.last_modified < date_limit for n in notifications):
+            ready.append((recipient, notifications))
 
-        if recipient.id not in qs2 or qs2[recipient.id] < len(notifications):
-            continue
+    optouts = set(EmailOptout.objects.filter(
+        email__in=[normalize_email(r.email) for r, _ in ready]).values_list(
+            'email', flat=True))
 
-        projects = set([n.patch.project.linkname for n in notifications])
+    site = Site.objects.get_current()
+    connection = get_connection()
+    delivered = []
+    errors = []
 
-        def delete_notifications():
-            pks = [n.pk for n in notifications]
-            PatchChangeNotification.objects.filter(pk__in=pks).delete()
+    try:
+        for (recipient, notifications) in ready:
+            # delete as we go, so that a crash doesn't resend many mails
+            if len(delivered) >= NOTIFICATION_DELETE_BATCH_SIZE:
+                _delete_notifications(delivered)
+                delivered = []
 
-        if EmailOptout.is_optout(recipient.email):
-            delete_notifications()
-            continue
+            if normalize_email(recipient.email) in optouts:
+                delivered.extend(notifications)
+                continue
 
-        context = {
-            'site': Site.objects.get_current(),
-            'notifications': notifications,
-            'projects': projects,
-        }
-
-        subject = render_to_string(
-            'patchwork/patch-change-notification-subject.text',
-            context).strip()
-        content = render_to_string('patchwork/patch-change-notification.mail',
-                                   context)
-
-        message = EmailMessage(subject=subject, body=content,
-                               from_email=settings.NOTIFICATION_FROM_EMAIL,
-                               to=[recipient.email],
-                               headers={'Precedence': 'bulk'})
-
-        try:
-            message.send()
-        except Exception as ex:
-            errors.append((recipient, ex))
-            continue
+            context = {
+                'site': site,
+                'notifications': notifications,
+                'projects': set([n.patch.project.linkname
+                                 for n in notifications]),
+            }
+
+            subject = render_to_string(
+                'patchwork/patch-change-notification-subject.text',
+                context).strip()
+            content = render_to_string(
+                'patchwork/patch-change-notification.mail', context)
 
-        delete_notifications()
+            message = EmailMessage(
+                subject=subject, body=content,
+                from_email=settings.NOTIFICATION_FROM_EMAIL,
+                to=[recipient.email], headers={'Precedence': 'bulk'})
+
+            # send each message over the same connection, reconnecting if
+            # a failure may have broken it
+            try:
+                connection.open()
+                connection.send_messages([message])
+            except Exception as ex:
+                errors.append((recipient, ex))
+                connection.close()
+                continue
+
+            delivered.extend(notifications)
+    finally:
+        connection.close()
+        _delete_notifications(delivered)
 
     return errors
 
 
-def do_expiry():
-    # expire any pending confirmations
+def _delete_notifications(notifications):
+    # notifications changed since they were read are kept, and sent later
+    if not notifications:
+        return
+
+    query = Q()
+    for notification in notifications:
+        query |= Q(pk=notification.pk,
+                   last_modified=notification.last_modified)
+    PatchChangeNotification.objects.filter(query).delete()
+
+
+def _chunks(queryset, chunk_size):
+    """Yield the primary keys of the rows matched by a queryset, in
+    ascending batches of at most chunk_size."""
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        chunk = queryset
+        if last is not None:
+            chunk = chunk.filter(pk__gt=last)
+        ids = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def _raw_delete(model, column, ids):
+    qn = db_connection.ops.quote_name
+    with db_connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s WHERE %s IN (%s)' % (
+            qn(model._meta.db_table), qn(column),
+            ', '.join(['%s'] * len(ids))), ids)
+
+
+def _delete_confirmations(confirmations, ids):
+    """Delete the given confirmations, returning the number deleted."""
+    # lock the confirmations, and check that they are still expired, so
+    # that the rows counted are the rows deleted
+    ids = list(confirmations.filter(
+        pk__in=ids).select_for_update().values_list('pk', flat=True))
+    if ids:
+        EmailConfirmation.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def _delete_users(users, ids):
+    """Delete the given users, returning the number deleted."""
+    # lock the users, and check that they are still expired, so that a
+    # registration confirmed meanwhile isn't lost
+    ids = list(users.filter(pk__in=ids).select_for_update().values_list(
+        'pk', flat=True))
+    if not ids:
+        return 0
+
+    # Delete the rows belonging only to the users directly, rather than
+    # letting Django's collector fetch them first. Anything else still
+    # referring to the users, which is rare for users who have never
+    # logged in, is then handled by the collector.
+    profiles = list(UserProfile.objects.filter(user__in=ids).values_list(
+        'pk', flat=True))
+    if profiles:
+        UserProfile.maintainer_projects.through.objects.filter(
+            userprofile__in=profiles).delete()
+        _raw_delete(UserProfile, 'id', profiles)
+    EmailConfirmation.objects.filter(user__in=ids).delete()
+    Person.objects.filter(user__in=ids).update(user=None)
+    User.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def do_expiry(chunk_size=500, dry_run=False, progress=None):
+    """Expire pending confirmations, and inactive users without one.
+
+    Rows are deleted in batches by ascending primary key, each batch in
+    its own transaction, so that tables are never locked for long.
+
+    Args:
+        chunk_size (int): The number of rows deleted per transaction.
+        dry_run (bool): Only count the rows that would be deleted.
+        progress: If given, a callable called after each batch with the
+            kind of rows being deleted, 'confirmations' or 'users', the
+            number deleted so far and the number to delete.
+
+    Returns:
+        A (confirmations, users) tuple of the number of rows deleted, or
+        that would be deleted.
+    """
     q = (Q(date__lt=datetime.datetime.now() - EmailConfirmation.validity) |
          Q(active=False))
-    EmailConfirmation.objects.filter(q).delete()
+
+    # expire any pending confirmations
+    confirmations = EmailConfirmation.objects.filter(q)
 
     # expire inactive users with no pending confirmation
-    pending_confs = EmailConfirmation.objects.values('user')
+    pending_confs = EmailConfirmation.objects.exclude(q).filter(
+        user__isnull=False).values('user')
     users = User.objects.filter(is_active=False,
                                 last_login=F('date_joined')).exclude(
                                     id__in=pending_confs)
 
-    # delete users
-    users.delete()
+    counts = []
+    for (kind, queryset, delete) in [
+            ('confirmations', confirmations, _delete_confirmations),
+            ('users', users, _delete_users)]:
+        total = queryset.count()
+        if dry_run:
+            counts.append(total)
+            continue
+
+        done = 0
+        for ids in _chunks(queryset, chunk_size):
+            with transaction.atomic():
+                # rows changed since they were listed may be kept
+                done += delete(queryset, ids)
+            if progress:
+                progress(kind, done, total)
+        counts.append(done)
+
+    return tuple(counts)
+
+
+def archive_stale_patches(chunk_size=500, dry_run=False):
+    """Archive the patches matched by each project's archive policies.
+
+    Patches are archived by an UPDATE per batch of at most chunk_size
+    patches, each batch in its own transaction, rather than by saving
+    each patch. An event is recorded for each patch archived, and the
+    project's cached patch lists are invalidated.
+
+    Args:
+        chunk_size (int): The number of patches archived per transaction.
+        dry_run (bool): Only count the patches that would be archived.
+
+    Returns:
+        The number of patches archived, or that would be archived.
+    """
+    policies = ArchivePolicy.objects.prefetch_related('states')
+
+    if dry_run:
+        # a patch may be matched by several policies
+        stale = set()
+        for policy in policies:
+            stale.update(policy.stale_patches().values_list('pk', flat=True))
+        return len(stale)
+
+    count = 0
+    for policy in policies:
+        patches = policy.stale_patches()
+        for ids in _chunks(patches, chunk_size):
+            with transaction.atomic():
+                # lock the patches, and check that they are still stale
+                ids = list(patches.filter(pk__in=ids).select_for_update()
+                           .values_list('pk', flat=True))
+                if not ids:
+                    continue
+                # the artifact generation is left alone, as the raw diffs
+                # and mboxes cached on disk don't include the archived flag
+                Patch.objects.filter(pk__in=ids).update(archived=True)
+                Event.objects.bulk_create([
+                    Event(category=Event.CATEGORY_PATCH_ARCHIVED,
+                          project_id=policy.project_id, submission_id=id)
+                    for id in ids])
+                Project.objects.filter(id=policy.project_id).update(
+                    list_generation=F('list_generation') + 1)
+
+            # the events were created without sending signals
+            notify.send(policy.project_id)
+            count += len(ids)
+
+    return count
+
+
+def compact_events():
+    """Compact runs of state or delegate changes to a single event.
+
+    Only events older than EVENT_COMPACTION_HOURS are considered. The most
+    recent event of each run is kept, so clients that have already seen
+    part of a run still see the final value, and its previous value is
+    rewritten to that before the run.
+    """
+    date_limit = datetime.datetime.now() - datetime.timedelta(
+        hours=settings.EVENT_COMPACTION_HOURS)
+    fields = {
+        Event.CATEGORY_PATCH_STATE_CHANGED: 'previous_state_id',
+        Event.CATEGORY_PATCH_DELEGATED: 'previous_delegate_id',
+    }
+    count = 0
+
+    for category, field in fields.items():
+        events = Event.objects.filter(category=category,
+                                      date__lt=date_limit)
+        runs = events.order_by().values('submission').annotate(
+            count=Count('id'), first=Min('id'), last=Max('id')).filter(
+                count__gt=1)
+
+        for run in runs:
+            previous = Event.objects.filter(id=run['first']).values_list(
+                field, flat=True)[0]
+            Event.objects.filter(id=run['last']).update(**{field: previous})
+            events.filter(submission=run['submission'],
+                          id__lt=run['last']).delete()
+            count += run['count'] - 1
+
+    return count
+
+
+def expire_events():
+    """Delete events older than EVENT_RETENTION_DAYS."""
+    date_limit = datetime.datetime.now() - datetime.timedelta(
+        days=settings.EVENT_RETENTION_DAYS)
+    events = Event.objects.filter(date__lt=date_limit)
+    count = events.count()
+    events.delete()
+    return count
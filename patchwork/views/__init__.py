@@ -31,10 +31,11 @@ from django.contrib import messages
 from django.http import Http404
 from django.shortcuts import render, get_object_or_404
 
+from patchwork import routers
 from patchwork.filters import Filters
 from patchwork.forms import MultiplePatchForm
-from patchwork.models import (Bundle, BundlePatch, Comment, Patch,
-                              EmailConfirmation, Project)
+from patchwork.models import (Bundle, BundlePatch, Patch, EmailConfirmation,
+                              Project)
 from patchwork.paginator import Paginator
 
 
@@ -365,7 +366,7 @@ def patch_to_mbox(patch):
     # TODO(stephenfin): Make this use the tags infrastructure
     body += patch.patch_responses()
 
-    for comment in Comment.objects.filter(submission=patch):
+    for comment in patch.comments.all():
         body += comment.patch_responses()
 
     if postscript:
@@ -400,6 +401,9 @@ def patch_to_mbox(patch):
     return mail
 
 
+# confirmations are made by GET requests, but activate accounts and link
+# email addresses
+@routers.use_primary
 def confirm(request, key):
     import patchwork.views.user
     import patchwork.views.mail
@@ -17,12 +17,18 @@
 # along with Patchwork; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
+import datetime
 import json
+import time
 
+from django.conf import settings
 from django.db.models import Q
 from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
 
-from patchwork.models import Person, User
+from patchwork import notify
+from patchwork import routers
+from patchwork.models import Event, Person, Project, User
 
 
 MINIMUM_CHARACTERS = 3
@@ -80,3 +86,78 @@ def delegates(request):
         }
 
     return _handle_request(request, queryset, formatter)
+
+
+def _int_param(request, name):
+    try:
+        return max(int(request.GET.get(name, 0)), 0)
+    except ValueError:
+        return 0
+
+
+def _events_response(request, since, filters):
+    data = Event.list_since(since, _int_param(request, 'limit'), **filters)
+    data = {
+        'events': data,
+        'last_id': data[-1]['id'] if data else since,
+    }
+
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+def events(request):
+    """Return the events recorded after a given event ID.
+
+    Events are returned oldest first, in pages of at most ``limit``
+    events, along with the ID to pass as ``since`` to fetch the next page.
+    """
+    filters = {}
+    if request.GET.get('project'):
+        filters['project__linkname'] = request.GET['project']
+
+    return _events_response(request, _int_param(request, 'since'), filters)
+
+
+# waiters are woken up as soon as events are committed to the primary
+@routers.use_primary
+def events_wait(request):
+    """Wait for events recorded after a given event ID.
+
+    Like `events`, but if there are no new events, wait up to ``timeout``
+    seconds for one to be recorded. If too many requests are already
+    waiting, respond with 503 Service Unavailable and a Retry-After
+    header rather than tying up another worker.
+    """
+    since = _int_param(request, 'since')
+    timeout = min(_int_param(request, 'timeout') or
+                  settings.LONGPOLL_MAX_TIMEOUT,
+                  settings.LONGPOLL_MAX_TIMEOUT)
+    deadline = time.time() + timeout
+
+    filters = {}
+    project_id = None
+    if request.GET.get('project'):
+        project = get_object_or_404(Project, linkname=request.GET['project'])
+        project_id = filters['project_id'] = project.id
+
+    events = Event.objects.filter(id__gt=since, **filters)
+    if not events.filter(date__lt=Event.commit_horizon()).exists():
+        with notify.waiter_slot() as acquired:
+            if not acquired:
+                response = HttpResponse(status=503)
+                response['Retry-After'] = str(timeout)
+                return response
+
+            # new events are only listed once EVENT_COMMIT_LAG has passed,
+            # so wait for the first of them while still holding the slot,
+            # rather than returning an empty list
+            notify.wait(events.exists, project_id, timeout)
+            date = events.values_list('date', flat=True).first()
+            if date is not None:
+                delay = date + datetime.timedelta(
+                    seconds=settings.EVENT_COMMIT_LAG) - \
+                    datetime.datetime.now()
+                time.sleep(max(min(delay.total_seconds(),
+                                   deadline - time.time()), 0))
+
+    return _events_response(request, since, filters)
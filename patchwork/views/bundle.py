@@ -203,8 +203,9 @@ def mbox(request, username, bundlename):
     if not (request.user == bundle.owner or bundle.public):
         return HttpResponseNotFound()
 
-    mbox = '\n'.join([patch_to_mbox(p).as_string(True)
-                      for p in bundle.ordered_patches()])
+    patches = bundle.ordered_patches().select_related(
+        'submitter', 'delegate').prefetch_related('comments')
+    mbox = '\n'.join([patch_to_mbox(p).as_string(True) for p in patches])
 
     response = HttpResponse(content_type='text/plain')
     response['Content-Disposition'] = \
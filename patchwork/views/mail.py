@@ -27,7 +27,7 @@ from django.shortcuts import render
 
 from patchwork.compat import render_to_string
 from patchwork.forms import OptinoutRequestForm, EmailForm
-from patchwork.models import EmailOptout, EmailConfirmation
+from patchwork.models import EmailOptout, EmailConfirmation, normalize_email
 
 
 def settings(request):
@@ -35,7 +35,7 @@ def settings(request):
         form = EmailForm(data=request.POST)
         if form.is_valid():
             email = form.cleaned_data['email']
-            is_optout = EmailOptout.objects.filter(email=email).count() > 0
+            is_optout = EmailOptout.is_optout(email)
             context = {
                 'email': email,
                 'is_optout': is_optout,
@@ -52,7 +52,7 @@ def settings(request):
 
 
 def optout_confirm(request, conf):
-    email = conf.email.strip().lower()
+    email = normalize_email(conf.email)
     # silently ignore duplicated optouts
     if EmailOptout.objects.filter(email=email).count() == 0:
         optout = EmailOptout(email=email)
@@ -68,7 +68,7 @@ def optout_confirm(request, conf):
 
 
 def optin_confirm(request, conf):
-    email = conf.email.strip().lower()
+    email = normalize_email(conf.email)
     EmailOptout.objects.filter(email=email).delete()
 
     conf.deactivate()
@@ -24,6 +24,8 @@ from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render, get_object_or_404
 from django.utils import six
 
+from patchwork import artifacts
+from patchwork import pagecache
 from patchwork.forms import PatchForm, CreateBundleForm
 from patchwork.models import Patch, Project, Bundle
 from patchwork.views import generic_list, patch_to_mbox
@@ -87,6 +89,8 @@ def patch(request, patch_id):
         context['bundles'] = Bundle.objects.filter(owner=request.user)
 
     context['patch'] = patch
+    context['comments'] = patch.comments.select_related('submitter')
+    context['similar_patches'] = patch.similar_patches()
     context['patchform'] = form
     context['createbundleform'] = createbundleform
     context['project'] = patch.project
@@ -94,23 +98,44 @@ def patch(request, patch_id):
     return render(request, 'patchwork/patch.html', context)
 
 
+def _artifact_patch(patch_id):
+    patches = Patch.objects.all()
+    # the bulky columns are only needed if the artifact isn't on disk yet
+    if artifacts.enabled():
+        patches = patches.defer('diff', 'content', 'headers')
+    return get_object_or_404(patches, id=patch_id)
+
+
+def _mbox_text(patch):
+    # NOTE(stephenfin) http://stackoverflow.com/a/28584090/613428
+    if six.PY3:
+        return patch_to_mbox(patch).as_bytes(True).decode()
+    return patch_to_mbox(patch).as_string(True)
+
+
 def content(request, patch_id):
-    patch = get_object_or_404(Patch, id=patch_id)
-    response = HttpResponse(content_type="text/x-patch")
-    response.write(patch.diff)
+    patch = _artifact_patch(patch_id)
+    if artifacts.enabled():
+        response = artifacts.response(patch, 'diff',
+                                      lambda: patch.diff or '',
+                                      'text/x-patch')
+    else:
+        response = HttpResponse(content_type="text/x-patch")
+        response.write(patch.diff)
     response['Content-Disposition'] = 'attachment; filename=' + \
         patch.filename().replace(';', '').replace('\n', '')
     return response
 
 
 def mbox(request, patch_id):
-    patch = get_object_or_404(Patch, id=patch_id)
-    response = HttpResponse(content_type="text/plain")
-    # NOTE(stephenfin) http://stackoverflow.com/a/28584090/613428
-    if six.PY3:
-        response.write(patch_to_mbox(patch).as_bytes(True).decode())
+    patch = _artifact_patch(patch_id)
+    if artifacts.enabled():
+        response = artifacts.response(patch, 'mbox',
+                                      lambda: _mbox_text(patch),
+                                      'text/plain')
     else:
-        response.write(patch_to_mbox(patch).as_string(True))
+        response = HttpResponse(content_type="text/plain")
+        response.write(_mbox_text(patch))
     response['Content-Disposition'] = 'attachment; filename=' + \
         patch.filename().replace(';', '').replace('\n', '')
     return response
@@ -118,6 +143,17 @@ def mbox(request, patch_id):
 
 def list(request, project_id):
     project = get_object_or_404(Project, linkname=project_id)
+
+    cache_key = pagecache.cache_key(request, project)
+    if cache_key:
+        content = pagecache.get_page(cache_key)
+        if content is not None:
+            return HttpResponse(content)
+
     context = generic_list(request, project, 'patch-list',
                            view_args={'project_id': project.linkname})
-    return render(request, 'patchwork/list.html', context)
+    response = render(request, 'patchwork/list.html', context)
+
+    if cache_key:
+        pagecache.set_page(cache_key, response.content)
+    return response
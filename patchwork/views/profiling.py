@@ -0,0 +1,72 @@
+# Patchwork - automated patch tracking system
+# Copyright (C) 2016 Intel Corporation
+#
+# This file is part of the Patchwork package.
+#
+# Patchwork is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# Patchwork is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Patchwork; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+from __future__ import absolute_import
+
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404
+from django.shortcuts import render
+
+from patchwork import pagecache
+from patchwork.middleware import get_profiles
+
+
+def _summarise(profiles):
+    views = OrderedDict()
+    for profile in sorted(profiles, key=lambda p: p['view']):
+        views.setdefault(profile['view'], []).append(profile)
+
+    summary = []
+    for view, view_profiles in views.items():
+        times = sorted(p['time'] for p in view_profiles)
+        count = len(view_profiles)
+        summary.append({
+            'view': view,
+            'count': count,
+            'mean_time': sum(times) / count,
+            'p95_time': times[min(int(count * 0.95), count - 1)],
+            'mean_sql_count': float(
+                sum(p['sql_count'] for p in view_profiles)) / count,
+            'mean_sql_time': sum(p['sql_time'] for p in view_profiles) / count,
+            'mean_template_time': sum(
+                p['template_time'] for p in view_profiles) / count,
+        })
+    return summary
+
+
+@staff_member_required
+def profiles(request):
+    if not settings.ENABLE_PROFILING:
+        raise Http404
+
+    profiles = get_profiles()
+    view = request.GET.get('view')
+    if view:
+        profiles = [p for p in profiles if p['view'] == view]
+
+    context = {
+        'summary': _summarise(profiles),
+        'profiles': profiles,
+        'view': view,
+        'list_cache': pagecache.get_stats(),
+    }
+    return render(request, 'patchwork/profiling.html', context)
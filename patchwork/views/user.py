@@ -25,6 +25,7 @@ from django.contrib.sites.models import Site
 from django.conf import settings
 from django.core.mail import send_mail
 from django.core import urlresolvers
+from django.db.models import Count
 from django.http import HttpResponseRedirect
 from django.shortcuts import render, get_object_or_404
 
@@ -33,7 +34,7 @@ from patchwork.filters import DelegateFilter
 from patchwork.forms import (UserProfileForm, UserPersonLinkForm,
                              RegistrationForm)
 from patchwork.models import (Project, Bundle, Person, EmailConfirmation,
-                              State, EmailOptout)
+                              State, EmailOptout, APIToken)
 from patchwork.views import generic_list
 
 
@@ -83,9 +84,8 @@ def register_confirm(request, conf):
     conf.user.save()
     conf.deactivate()
 
-    try:
-        person = Person.objects.get(email__iexact=conf.user.email)
-    except Person.DoesNotExist:
+    person = Person.find(conf.user.email)
+    if person is None:
         person = Person(email=conf.user.email,
                         name=conf.user.profile.name())
     person.user = conf.user
@@ -114,7 +114,7 @@ def profile(request):
     # FIXME(stephenfin): This looks unsafe. Investigate.
     optout_query = '%s.%s IN (SELECT %s FROM %s)' % (
         Person._meta.db_table,
-        Person._meta.get_field('email').column,
+        Person._meta.get_field('email_key').column,
         EmailOptout._meta.get_field('email').column,
         EmailOptout._meta.db_table)
     people = Person.objects.filter(user=request.user) \
@@ -122,6 +122,9 @@ def profile(request):
     context['linked_emails'] = people
     context['linkform'] = UserPersonLinkForm()
 
+    context['show_api_tokens'] = settings.ENABLE_XMLRPC
+    context['api_tokens'] = request.user.api_tokens.all()
+
     return render(request, 'patchwork/profile.html', context)
 
 
@@ -159,9 +162,8 @@ def link(request):
 
 @login_required
 def link_confirm(request, conf):
-    try:
-        person = Person.objects.get(email__iexact=conf.email)
-    except Person.DoesNotExist:
+    person = Person.find(conf.email)
+    if person is None:
         person = Person(email=conf.email)
 
     person.link_to_user(conf.user)
@@ -187,16 +189,41 @@ def unlink(request, person_id):
     return HttpResponseRedirect(urlresolvers.reverse('user-profile'))
 
 
+@login_required
+def token_create(request):
+    if request.method != 'POST' or not settings.ENABLE_XMLRPC:
+        return HttpResponseRedirect(urlresolvers.reverse('user-profile'))
+
+    token = APIToken.generate(request.user,
+                              name=request.POST.get('name', '')[:100])
+
+    # the token itself isn't stored, so can only be displayed now
+    return render(request, 'patchwork/api-token.html', {'token': token})
+
+
+@login_required
+def token_delete(request, token_id):
+    token = get_object_or_404(APIToken, id=token_id, user=request.user)
+
+    if request.method == 'POST':
+        token.delete()
+
+    return HttpResponseRedirect(urlresolvers.reverse('user-profile'))
+
+
 @login_required
 def todo_lists(request):
     todo_lists = []
 
-    for project in Project.objects.all():
-        patches = request.user.profile.todo_patches(project=project)
-        if not patches.count():
-            continue
+    # count the todo patches for all projects in a single query
+    patches = request.user.profile.todo_patches().order_by()
+    counts = patches.values('project').annotate(n_patches=Count('pk'))
+    counts = {count['project']: count['n_patches'] for count in counts}
 
-        todo_lists.append({'project': project, 'n_patches': patches.count()})
+    projects = Project.objects.filter(id__in=patches.values('project'))
+    for project in projects:
+        todo_lists.append({'project': project,
+                           'n_patches': counts[project.id]})
 
     if len(todo_lists) == 1:
         return HttpResponseRedirect(
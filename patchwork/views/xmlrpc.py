@@ -29,9 +29,14 @@ try:
 except ImportError:
     from xmlrpc.server import XMLRPCDocGenerator
 import sys
+import threading
+import time
 
+from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.contrib.auth import authenticate
+from django.db import transaction
+from django.db.models.signals import post_delete
 from django.http import (
     HttpResponse, HttpResponseRedirect, HttpResponseServerError)
 from django.views.decorators.csrf import csrf_exempt
@@ -39,7 +44,9 @@ from django.utils import six
 from django.utils.six.moves import map, xmlrpc_client
 from django.utils.six.moves.xmlrpc_server import SimpleXMLRPCDispatcher
 
-from patchwork.models import Patch, Project, Person, State, Check
+from patchwork import routers
+from patchwork.models import (APIToken, Patch, PatchFile, Project, Person,
+                              State, Check, Event)
 from patchwork.views import patch_to_mbox
 
 
@@ -81,6 +88,9 @@ class PatchworkXMLRPCDispatcher(SimpleXMLRPCDispatcher,
 
         header = auth_header.strip()
 
+        if header.startswith('Bearer '):
+            return _user_for_token(header[len('Bearer '):].strip())
+
         if not header.startswith('Basic '):
             raise Exception('Authentication scheme not supported')
 
@@ -95,13 +105,20 @@ class PatchworkXMLRPCDispatcher(SimpleXMLRPCDispatcher,
         return authenticate(username=username, password=password)
 
     def _dispatch(self, request, method, params):
+        if method == 'system.multicall':
+            return self._multicall(request, *params)
+
         if method not in list(self.func_map.keys()):
             raise Exception('method "%s" is not supported' % method)
 
         auth_required, fn = self.func_map[method]
 
         if auth_required:
-            user = self._user_for_request(request)
+            # credentials are only verified once per request, however many
+            # calls a multicall makes
+            if not hasattr(request, '_xmlrpc_user'):
+                request._xmlrpc_user = self._user_for_request(request)
+            user = request._xmlrpc_user
             if not user:
                 raise Exception('Invalid username/password')
 
@@ -109,6 +126,34 @@ class PatchworkXMLRPCDispatcher(SimpleXMLRPCDispatcher,
 
         return fn(*params)
 
+    def _multicall(self, request, calls):
+        """Make multiple calls in a single request.
+
+        Each call is dispatched, and authenticated, as if it were made on
+        its own. The result of a successful call is wrapped in a
+        single-item list, while a failed call gives a struct with the
+        ``faultCode`` and ``faultString`` of the fault.
+        """
+        results = []
+        for call in calls:
+            try:
+                method = call['methodName']
+                if method == 'system.multicall':
+                    raise Exception('recursive system.multicall forbidden')
+                result = self._dispatch(request, method,
+                                        tuple(call['params']))
+                results.append([result])
+            except six.moves.xmlrpc_client.Fault as fault:
+                results.append({'faultCode': fault.faultCode,
+                                'faultString': fault.faultString})
+            except:
+                results.append({
+                    'faultCode': 1,
+                    'faultString': '%s:%s' % (sys.exc_info()[0],
+                                              sys.exc_info()[1]),
+                })
+        return results
+
     def _marshaled_dispatch(self, request):
         try:
             params, method = six.moves.xmlrpc_client.loads(request.body)
@@ -130,6 +175,43 @@ class PatchworkXMLRPCDispatcher(SimpleXMLRPCDispatcher,
 
 dispatcher = PatchworkXMLRPCDispatcher()
 
+# API tokens are cheap to verify, but CI systems may make many thousands of
+# calls a day with the same token, so validated tokens are cached by digest
+# for XMLRPC_TOKEN_CACHE_TIMEOUT seconds
+_token_cache = {}
+_token_cache_lock = threading.Lock()
+
+
+def _user_for_token(token):
+    digest = APIToken.hash_token(token)
+    now = time.time()
+
+    with _token_cache_lock:
+        user, expiry = _token_cache.get(digest, (None, 0))
+    if user is not None and expiry > now:
+        return user
+
+    user = APIToken.authenticate(token)
+
+    timeout = settings.XMLRPC_TOKEN_CACHE_TIMEOUT
+    if user is not None and timeout:
+        with _token_cache_lock:
+            for key, (_, expiry) in list(_token_cache.items()):
+                if expiry <= now:
+                    del _token_cache[key]
+            _token_cache[digest] = (user, now + timeout)
+
+    return user
+
+
+def _token_delete_callback(sender, instance, **kwargs):
+    # revoked tokens may remain valid for other processes until their
+    # cache entries expire
+    with _token_cache_lock:
+        _token_cache.pop(instance.digest, None)
+
+post_delete.connect(_token_delete_callback, sender=APIToken)
+
 # XMLRPC view function
 
 
@@ -142,8 +224,16 @@ def xmlrpc(request):
     response = HttpResponse()
 
     if request.method == 'POST':
+        # anonymous clients can't make changes, so are served from a
+        # replica. Authenticated ones use the primary, so they see their
+        # own changes without needing to keep a cookie
+        request.replica_read_only = \
+            'HTTP_AUTHORIZATION' not in request.META and \
+            'Authorization' not in request.META
         try:
-            ret = dispatcher._marshaled_dispatch(request)
+            with routers.use_replicas(request.replica_read_only and
+                                      not routers.is_pinned(request)):
+                ret = dispatcher._marshaled_dispatch(request)
         except Exception:
             return HttpResponseServerError()
     else:
@@ -351,6 +441,100 @@ def check_to_dict(obj):
     }
 
 
+# The list methods serialize directly from the values() of a single query,
+# rather than from model instances, as they may return many thousands of
+# rows. The following functions must match their *_to_dict equivalents.
+
+PERSON_VALUES = ('id', 'email', 'name', 'user__username')
+
+
+def person_values_to_dict(values):
+    return {
+        'id': values['id'],
+        'email': values['email'],
+        'name': values['name'] or values['email'],
+        'user': six.text_type(values['user__username']).encode('utf-8'),
+    }
+
+
+PATCH_VALUES = ('id', 'date', 'msgid', 'name', 'project_id', 'project__name',
+                'state_id', 'state__name', 'archived', 'submitter_id',
+                'submitter__name', 'submitter__email', 'delegate_id',
+                'delegate__username', 'commit_ref')
+
+
+def patch_values_to_dict(values):
+    if values['submitter__name']:
+        submitter = '%s <%s>' % (values['submitter__name'],
+                                 values['submitter__email'])
+    else:
+        submitter = values['submitter__email']
+
+    return {
+        'id': values['id'],
+        'date': six.text_type(values['date']).encode('utf-8'),
+        'filename': Patch.filename_for_name(values['name']),
+        'msgid': values['msgid'],
+        'name': values['name'],
+        'project': six.text_type(values['project__name']).encode('utf-8'),
+        'project_id': values['project_id'],
+        'state': six.text_type(values['state__name']).encode('utf-8'),
+        'state_id': values['state_id'],
+        'archived': values['archived'],
+        'submitter': six.text_type(submitter).encode('utf-8'),
+        'submitter_id': values['submitter_id'],
+        'delegate': six.text_type(
+            values['delegate__username']).encode('utf-8'),
+        'delegate_id': values['delegate_id'] or 0,
+        'commit_ref': values['commit_ref'] or '',
+    }
+
+
+CHECK_VALUES = ('id', 'date', 'patch_id', 'patch__name', 'user_id',
+                'user__username', 'state', 'target_url', 'description',
+                'context')
+
+
+def check_values_to_dict(values):
+    return {
+        'id': values['id'],
+        'date': six.text_type(values['date']).encode('utf-8'),
+        'patch': six.text_type(values['patch__name']).encode('utf-8'),
+        'patch_id': values['patch_id'],
+        'user': six.text_type(values['user__username']).encode('utf-8'),
+        'user_id': values['user_id'],
+        'state': dict(Check.STATE_CHOICES)[values['state']],
+        'target_url': values['target_url'],
+        'description': values['description'],
+        'context': values['context'],
+    }
+
+
+def limit_results(queryset, max_count):
+    """Apply a ``max_count`` to an ordered queryset.
+
+    A positive max_count returns at most that many results from the
+    start of the queryset, and a negative one at most that many from the
+    end. Both are limited in the database, rather than fetching all
+    rows.
+
+    Args:
+        queryset: The queryset to limit. This must be ordered.
+        max_count (int): The number of results to return, or 0 for all.
+
+    Returns:
+        A list of the results.
+    """
+    if max_count > 0:
+        return list(queryset[:max_count])
+    elif max_count < 0:
+        results = list(queryset.reverse()[:-max_count])
+        results.reverse()
+        return results
+    else:
+        return list(queryset)
+
+
 def patch_check_to_dict(obj):
     """Return a combined patch check."""
     state_names = dict(Check.STATE_CHOICES)
@@ -379,7 +563,7 @@ def pw_rpc_version():
     Returns:
         Version of the API.
     """
-    return (1, 2, 0)
+    return (1, 6, 0)
 
 
 @xmlrpc_method()
@@ -405,13 +589,9 @@ def project_list(search_str=None, max_count=0):
         else:
             projects = Project.objects.all()
 
-        if max_count > 0:
-            return list(map(project_to_dict, projects[:max_count]))
-        elif max_count < 0:
-            return list(map(project_to_dict,
-                            projects[len(projects) + max_count:]))
-        else:
-            return list(map(project_to_dict, projects))
+        projects = projects.values('id', 'linkname', 'name')
+
+        return limit_results(projects, max_count)
     except Project.DoesNotExist:
         return []
 
@@ -460,12 +640,10 @@ def person_list(search_str=None, max_count=0):
         else:
             people = Person.objects.all()
 
-        if max_count > 0:
-            return list(map(person_to_dict, people[:max_count]))
-        elif max_count < 0:
-            return list(map(person_to_dict, people[len(people) + max_count:]))
-        else:
-            return list(map(person_to_dict, people))
+        people = people.order_by('id').values(*PERSON_VALUES)
+
+        return list(map(person_values_to_dict,
+                        limit_results(people, max_count)))
     except Person.DoesNotExist:
         return []
 
@@ -555,6 +733,10 @@ def patch_list(filt=None):
         A serialized list of patches matching filters, if any. A list
         of all patches if no filter given.
     """
+    return _patch_list(filt)
+
+
+def _patch_list(filt, **extra):
     if filt is None:
         filt = {}
 
@@ -590,32 +772,93 @@ def patch_list(filt=None):
                     # Invalid lookup type given
                     return []
 
-            if parts[0] == 'project_id':
-                dfilter['project'] = Project.objects.filter(id=filt[key])[0]
-            elif parts[0] == 'submitter_id':
-                dfilter['submitter'] = Person.objects.filter(id=filt[key])[0]
-            elif parts[0] == 'delegate_id':
-                dfilter['delegate'] = Person.objects.filter(id=filt[key])[0]
-            elif parts[0] == 'state_id':
-                dfilter['state'] = State.objects.filter(id=filt[key])[0]
-            elif parts[0] == 'max_count':
+            if parts[0] == 'max_count':
                 max_count = filt[key]
             else:
                 dfilter[key] = filt[key]
 
-        patches = Patch.objects.filter(**dfilter)
+        patches = Patch.objects.filter(**dfilter).filter(**extra)\
+            .order_by('date', 'id').values(*PATCH_VALUES)
 
-        if max_count > 0:
-            return list(map(patch_to_dict, patches[:max_count]))
-        elif max_count < 0:
-            return list(map(patch_to_dict,
-                            patches[len(patches) + max_count:]))
-        else:
-            return list(map(patch_to_dict, patches))
+        return list(map(patch_values_to_dict,
+                        limit_results(patches, max_count)))
     except Patch.DoesNotExist:
         return []
 
 
+@xmlrpc_method()
+def patch_list_by_path(path, filt=None):
+    """List patches touching files under a given path.
+
+    For example, ``patch_list_by_path('drivers/net/', {'archived': False})``
+    lists the unarchived patches touching any file in drivers/net.
+    Patches are matched using the index of the files they touch, so no
+    diffs are fetched.
+
+    Args:
+        path (str): The path prefix. Use a trailing slash to match only
+            files within a directory.
+        filt (dict): Additional filters, as for ``patch_list``.
+
+    Returns:
+        A serialized list of patches touching files under the path and
+        matching the filters, if any.
+    """
+    return _patch_list(filt, id__in=PatchFile.objects.filter(
+        path__startswith=path).values('patch_id'))
+
+
+@xmlrpc_method()
+def patch_list_similar(patch_id, max_count=10):
+    """List patches likely to be earlier revisions of a patch.
+
+    Candidates are earlier patches in the same project whose diffs are
+    similar to the patch's, ignoring context lines and whitespace. They
+    are found using a locality-sensitive index, so may include unrelated
+    patches or miss related ones.
+
+    Args:
+        patch_id (int): The ID of the patch.
+        max_count (int): The maximum number of patches to return.
+
+    Returns:
+        A serialized list of patches, most similar first.
+    """
+    try:
+        patch = Patch.objects.get(id=patch_id)
+    except Patch.DoesNotExist:
+        return []
+
+    ids = list(patch.similar_patches(max_count).values_list('id', flat=True))
+    patches = dict((values['id'], values) for values in
+                   Patch.objects.filter(id__in=ids).values(*PATCH_VALUES))
+    return [patch_values_to_dict(patches[id]) for id in ids]
+
+
+@xmlrpc_method()
+def patch_file_list(patch_id):
+    """List the files touched by a patch.
+
+    Args:
+        patch_id (int): The ID of the patch.
+
+    Returns:
+        A list of the files touched by the patch, in the order they
+        appear in its diff. Each is a dict of ``path``, ``change_type``
+        (one of 'added', 'deleted', 'modified' or 'renamed'),
+        ``lines_added`` and ``lines_removed``.
+    """
+    change_types = dict(PatchFile.CHANGE_CHOICES)
+    files = PatchFile.objects.filter(patch_id=patch_id).values_list(
+        'path', 'change_type', 'lines_added', 'lines_removed')
+    return [{
+        'path': path,
+        'change_type': change_types[change_type],
+        'lines_added': added,
+        'lines_removed': removed,
+    } for path, change_type, added, removed in files]
+
+
 @xmlrpc_method()
 def patch_get(patch_id):
     """Get a patch by its ID.
@@ -636,6 +879,24 @@ def patch_get(patch_id):
         return {}
 
 
+@xmlrpc_method()
+def patch_get_multi(patch_ids):
+    """Get multiple patches by their IDs.
+
+    Args:
+        patch_ids (list): The IDs of the patches to retrieve.
+
+    Returns:
+        A list of the serialized patches, in the order of the given
+        IDs. An empty dict is given for any ID that doesn't match a
+        patch.
+    """
+    patches = Patch.objects.filter(id__in=patch_ids).values(*PATCH_VALUES)
+    patches = dict((patch['id'], patch_values_to_dict(patch))
+                   for patch in patches)
+    return [patches.get(patch_id, {}) for patch_id in patch_ids]
+
+
 @xmlrpc_method()
 def patch_get_by_hash(hash):
     """Get a patch by its hash.
@@ -700,6 +961,26 @@ def patch_get_mbox(patch_id):
         return ''
 
 
+@xmlrpc_method()
+def patch_get_mbox_multi(patch_ids):
+    """Get multiple patches by their IDs in mbox format.
+
+    Args:
+        patch_ids (list): The IDs of the patches to retrieve.
+
+    Returns:
+        A list of the patches in mbox format, in the order of the given
+        IDs. An empty string is given for any ID that doesn't match a
+        patch.
+    """
+    patches = Patch.objects.filter(id__in=patch_ids)\
+        .select_related('submitter', 'delegate')\
+        .prefetch_related('comments')
+    mboxes = dict((patch.id, patch_to_mbox(patch).as_string(True))
+                  for patch in patches)
+    return [mboxes.get(patch_id, '') for patch_id in patch_ids]
+
+
 @xmlrpc_method()
 def patch_get_diff(patch_id):
     """Get a patch by its ID in diff format.
@@ -754,23 +1035,9 @@ def patch_set(user, patch_id, params):
         Patch.DoesNotExist: The patch did not exist.
     """
     try:
-        ok_params = ['state', 'commit_ref', 'archived']
-
         patch = Patch.objects.get(id=patch_id)
 
-        if not patch.is_editable(user):
-            raise Exception('No permissions to edit this patch')
-
-        for (k, v) in params.items():
-            if k not in ok_params:
-                continue
-
-            if k == 'state':
-                patch.state = State.objects.get(id=v)
-
-            else:
-                setattr(patch, k, v)
-
+        _patch_set(user, patch, _patch_set_fields(params))
         patch.save()
 
         return True
@@ -779,6 +1046,73 @@ def patch_set(user, patch_id, params):
         raise
 
 
+@xmlrpc_method(login_required=True)
+def patch_set_multi(user, patch_ids, params):
+    """Set fields of multiple patches.
+
+    Modify the patches matching the given patch IDs, as ``patch_set``
+    does for a single patch. Either all of the patches are modified, or,
+    if any is not found or may not be edited by the user, none are.
+
+    **NOTE:** Authentication is required for this method.
+
+    Args:
+        user (User): The user making the request. This will be
+            populated from HTTP Basic Auth.
+        patch_ids (list): The IDs of the patches to modify.
+        params (dict): A dictionary of keys corresponding to patch
+            object fields and the values that said fields should be
+            set to.
+
+    Returns:
+        True, if successful else raise exception.
+
+    Raises:
+        Exception: User did not have necessary permissions to edit one
+            of the patches
+        Patch.DoesNotExist: One of the patches did not exist.
+    """
+    fields = _patch_set_fields(params)
+    patches = Patch.objects.select_related('project').in_bulk(patch_ids)
+
+    with transaction.atomic():
+        for patch_id in patch_ids:
+            patch = patches.get(patch_id)
+            if patch is None:
+                raise Patch.DoesNotExist('Patch %s does not exist' %
+                                         patch_id)
+            _patch_set(user, patch, fields)
+            patch.save()
+
+    return True
+
+
+def _patch_set_fields(params):
+    """Return the fields to set on a patch for patch_set parameters."""
+    ok_params = ['state', 'commit_ref', 'archived']
+    fields = {}
+
+    for (k, v) in params.items():
+        if k not in ok_params:
+            continue
+
+        if k == 'state':
+            fields['state'] = State.objects.get(id=v)
+
+        else:
+            fields[k] = v
+
+    return fields
+
+
+def _patch_set(user, patch, fields):
+    if not patch.is_editable(user):
+        raise Exception('No permissions to edit this patch')
+
+    for (k, v) in fields.items():
+        setattr(patch, k, v)
+
+
 @xmlrpc_method()
 def state_list(search_str=None, max_count=0):
     """List states matching a given name filter.
@@ -917,24 +1251,18 @@ def check_list(filt=None):
                     # Invalid lookup type given
                     return []
 
-            if parts[0] == 'user_id':
-                dfilter['user'] = Person.objects.filter(id=filt[key])[0]
             if parts[0] == 'project_id':
-                dfilter['patch__project'] = Project.objects.filter(
-                    id=filt[key])[0]
-            elif parts[0] == 'patch_id':
-                dfilter['patch'] = Patch.objects.filter(id=filt[key])[0]
+                dfilter['patch__' + key] = filt[key]
             elif parts[0] == 'max_count':
                 max_count = filt[key]
             else:
                 dfilter[key] = filt[key]
 
-        checks = Check.objects.filter(**dfilter)
+        checks = Check.objects.filter(**dfilter).order_by('id')\
+            .values(*CHECK_VALUES)
 
-        if max_count > 0:
-            return list(map(check_to_dict, checks[:max_count]))
-        else:
-            return list(map(check_to_dict, checks))
+        return list(map(check_values_to_dict,
+                        limit_results(checks, max_count)))
     except Check.DoesNotExist:
         return []
 
@@ -979,17 +1307,61 @@ def check_create(user, patch_id, context, state, target_url="",
     patch = Patch.objects.get(id=patch_id)
     if not patch.is_editable(user):
         raise Exception('No permissions to edit this patch')
-    for state_val, state_str in Check.STATE_CHOICES:
-        if state == state_str:
-            state = state_val
-            break
-    else:
-        raise Exception("Invalid check state: %s" % state)
-    Check.objects.create(patch=patch, context=context, state=state, user=user,
+    Check.objects.create(patch=patch, context=context,
+                         state=_check_state(state), user=user,
                          target_url=target_url, description=description)
     return True
 
 
+@xmlrpc_method(login_required=True)
+def check_create_multi(user, checks):
+    """Add Checks to multiple patches.
+
+    Either all of the checks are added, or, if any is invalid, none are.
+
+    **NOTE:** Authentication is required for this method.
+
+    Args:
+        checks (list): A list of dicts, each with the ``patch_id``,
+            ``context`` and ``state`` and, optionally, the
+            ``target_url`` and ``description`` of a check, as given to
+            ``check_create``.
+
+    Returns:
+        True, if successful else raise exception.
+    """
+    patches = Patch.objects.select_related('project').in_bulk(
+        set(check['patch_id'] for check in checks))
+
+    check_objs = []
+    for check in checks:
+        patch = patches.get(check['patch_id'])
+        if patch is None:
+            raise Patch.DoesNotExist('Patch %s does not exist' %
+                                     check['patch_id'])
+        if not patch.is_editable(user):
+            raise Exception('No permissions to edit this patch')
+        check_objs.append(Check(
+            patch=patch, context=check['context'],
+            state=_check_state(check['state']), user=user,
+            target_url=check.get('target_url', ''),
+            description=check.get('description', '')))
+
+    # checks are saved individually so that their signals are sent
+    with transaction.atomic():
+        for check in check_objs:
+            check.save()
+
+    return True
+
+
+def _check_state(state):
+    for state_val, state_str in Check.STATE_CHOICES:
+        if state == state_str:
+            return state_val
+    raise Exception("Invalid check state: %s" % state)
+
+
 @xmlrpc_method()
 def patch_check_get(patch_id):
     """Get a patch's combined checks by its ID.
@@ -1009,3 +1381,31 @@ def patch_check_get(patch_id):
         return patch_check_to_dict(patch)
     except Patch.DoesNotExist:
         return {}
+
+
+@xmlrpc_method()
+def event_list(since_id=0, max_count=0, project_id=0):
+    """List events recorded after a given event.
+
+    Events record the creation of patches, comments and checks, and
+    changes to the state, delegate and archived status of patches. Each
+    event has a monotonically increasing ID; clients should pass the ID
+    of the last event they have seen to retrieve only newer events.
+
+    Args:
+        since_id (int): Return only events with an ID greater than this.
+        max_count (int): The maximum number of events to return, up to a
+            server-defined limit. If 0, return as many as allowed.
+        project_id (int): If non-zero, only return events for the
+            project with this ID.
+
+    Returns:
+        A list of serialized events, ordered by ID. Callers should repeat
+        the call with the ID of the last event returned until an empty
+        list is returned.
+    """
+    filters = {}
+    if project_id:
+        filters['project_id'] = project_id
+
+    return Event.list_since(since_id, max_count, **filters)